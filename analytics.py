@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Revenue and occupancy analytics for House Rental CLI
+
+Every report is built from a (listing x month) matrix of nights for a date
+window and then summed into groups with np.bincount, so a stay that crosses a
+month boundary counts each night in its own month and nothing loops over
+bookings in Python:
+
+    revenue_report  booked nights, occupancy %, revenue and ADR per group
+    top             the best groups by one of those figures
+    status_report   approved/pending/rejected nights and ratios per group
+
+Each report pulls the bookings overlapping the window in one query, plus the
+archived ones (see archive.py), and expands the ranges into nights with
+occupancy.expand_nights. Listings and bookings are read in one transaction,
+so nights and money always come from the same snapshot, even while other
+processes write.
+
+Groups are any combination of DIMENSIONS. "city" is the part of a listing's
+location before the first comma. Revenue counts the quoted total stored on a
+booking (see pricing.py), spread over its nights the way the monthly
+earnings spread it (see earnings.py), and prices nights of bookings without
+a total at the listing's current price_per_day.
+"""
+
+from collections import namedtuple
+from datetime import date
+import numpy as np
+import repository
+import occupancy
+import archive
+from config import VALID_STATUSES, REPORT_DIMENSIONS as DIMENSIONS, REPORT_METRICS as METRICS
+
+Listings = namedtuple("Listings", "ids price labels codes")
+
+
+def _factorize(values, count):
+    """Return (codes, labels) with labels sorted"""
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int64, count=count)
+    labels = sorted(index)
+    remap = np.empty(len(labels), dtype=np.int64)
+    remap[[index[label] for label in labels]] = np.arange(len(labels))
+    return remap[codes], np.array(labels, dtype=object)
+
+
+def _listings(conn):
+    """Load listing prices and the listing/host/city code of every listing"""
+    rows = repository.execute(conn, "analytics.listings").fetchall()
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    labels = {"listing": ids}
+    codes = {"listing": np.arange(len(ids))}
+    codes["host"], labels["host"] = _factorize((row[2] for row in rows), len(rows))
+    codes["city"], labels["city"] = _factorize((row[3].split(",")[0].strip() for row in rows), len(rows))
+    return Listings(ids, np.array([row[1] for row in rows], dtype=float), labels, codes)
+
+
+def _months(start_date, end_date):
+    """Return (months, days): every month the window touches and its number of days inside the window"""
+    first = np.datetime64(start_date, "D")
+    last = np.datetime64(end_date, "D")
+    months = np.arange(first.astype("datetime64[M]"), last.astype("datetime64[M]") + 1)
+    starts = np.maximum(months.astype("datetime64[D]"), first)
+    ends = np.minimum((months + 1).astype("datetime64[D]") - 1, last)
+    return months, (ends - starts).astype(np.int64) + 1
+
+
+def _night_cells(listings, listing_id, start, end, start_date, end_date, months):
+    """Expand day-number spans into their nights inside the window
+
+    Returns (span, day, cell) per night: the index of its span, its day
+    number and its (listing x month) cell. Spans of unknown listings are left out.
+    """
+    first = date.fromisoformat(start_date).toordinal() + occupancy.JULIAN_OFFSET
+    last = date.fromisoformat(end_date).toordinal() + occupancy.JULIAN_OFFSET
+    row = np.searchsorted(listings.ids, listing_id)
+    known = np.flatnonzero((row < len(listings.ids)) & (listings.ids[np.minimum(row, len(listings.ids) - 1)] == listing_id))
+    owner, day = occupancy.expand_nights(np.maximum(start, first)[known], np.minimum(end, last)[known])
+    span = known[owner]
+
+    unix_day = day - (date(1970, 1, 1).toordinal() + occupancy.JULIAN_OFFSET)
+    month = (unix_day.astype("datetime64[D]").astype("datetime64[M]") - months[0]).astype(np.int64)
+    return span, day, row[span] * len(months) + month
+
+
+def approved_stays(conn, listings, start_date, end_date, months):
+    """(listing x month) (nights, quoted nights, quoted cents) of the approved stays
+
+    Night k of an n-night stay with a quoted total earns
+    total * (k + 1) // n - total * k // n cents, as in the monthly earnings,
+    so whole months match them exactly.
+    """
+    rows = repository.execute(conn, "analytics.approved", (end_date, start_date)).fetchall()
+    rows += archive.approved(conn, start_date, end_date)
+    listing_id, start, end, cents = np.array(rows, dtype=np.int64).reshape(-1, 4).T
+    span, day, cell = _night_cells(listings, listing_id, start, end, start_date, end_date, months)
+    earlier, stay, total = day - start[span], end[span] - start[span] + 1, cents[span]
+    quoted = total >= 0
+    night_cents = total * (earlier + 1) // stay - total * earlier // stay
+    shape = (len(listings.ids), len(months))
+    size = shape[0] * shape[1]
+    return (np.bincount(cell, minlength=size).reshape(shape),
+            np.bincount(cell[quoted], minlength=size).reshape(shape),
+            np.bincount(cell[quoted], night_cents[quoted], minlength=size).reshape(shape))
+
+
+def nights_by_status(conn, listings, start_date, end_date, months):
+    """{status: (listing x month) nights} for every booking overlapping the window"""
+    rows = repository.execute(conn, "analytics.spans", (end_date, start_date)).fetchall()
+    rows += archive.spans(conn, start_date, end_date)
+    listing_id, start, end, status = np.array(rows, dtype=np.int64).reshape(-1, 4).T
+    span, _, cell = _night_cells(listings, listing_id, start, end, start_date, end_date, months)
+    shape = (len(listings.ids), len(months))
+    statuses = status[span]
+    return {
+        name: np.bincount(cell[statuses == code], minlength=shape[0] * shape[1]).reshape(shape)
+        for code, name in enumerate(VALID_STATUSES)
+    }
+
+
+class _Grouping:
+    """Mixed-radix group keys for (listing x month) cells over a choice of DIMENSIONS"""
+
+    def __init__(self, by, listings, months):
+        unknown = [dim for dim in by if dim not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown dimension(s): {', '.join(unknown)}")
+        self.by = tuple(by)
+        self.labels = dict(listings.labels, month=np.datetime_as_string(months))
+        self.sizes = tuple(len(self.labels[dim]) for dim in self.by)
+        self.size = int(np.prod(self.sizes, dtype=np.int64))
+
+        rows = np.arange(len(listings.ids))[:, None]
+        month = np.arange(len(months))[None, :]
+        key = np.zeros((len(listings.ids), len(months)), dtype=np.int64)
+        for dim, size in zip(self.by, self.sizes):
+            key = key * size + (month if dim == "month" else listings.codes[dim][rows])
+        self.key = key.ravel()
+
+    def sum(self, cells):
+        """Sum a (listing x month) matrix into one value per group"""
+        return np.bincount(self.key, np.ravel(cells), minlength=self.size)
+
+    def label_rows(self, groups):
+        """Decode group keys back into tuples of labels"""
+        if not self.by:
+            return [()] * len(groups)
+        codes = np.unravel_index(groups, self.sizes)
+        return list(zip(*(self.labels[dim][code].tolist() for dim, code in zip(self.by, codes))))
+
+
+def revenue_report(conn, start_date, end_date, by=("month",)):
+    """Return (*group labels, booked_nights, occupancy_pct, revenue, adr) rows
+
+    Occupancy is booked nights over listing-nights in the window; ADR
+    (average daily rate) is revenue per booked night. Every group with at
+    least one listing is included, in group order.
+    """
+    months, days = _months(start_date, end_date)
+    with repository.read_transaction(conn):
+        listings = _listings(conn)
+        if not len(listings.ids):
+            return []
+        grouping = _Grouping(by, listings, months)
+        nights, quoted_nights, quoted_cents = approved_stays(conn, listings, start_date, end_date, months)
+
+    booked = grouping.sum(nights)
+    revenue = grouping.sum(quoted_cents / 100 + (nights - quoted_nights) * listings.price[:, None])
+    available = grouping.sum(np.broadcast_to(days, nights.shape))
+
+    groups = np.flatnonzero(available)
+    booked, revenue, available = booked[groups], revenue[groups], available[groups]
+    occupancy_pct = np.round(100 * booked / available, 1)
+    adr = np.round(np.divide(revenue, booked, out=np.zeros(len(groups)), where=booked > 0), 2)
+    figures = zip(booked.astype(np.int64).tolist(), occupancy_pct.tolist(), np.round(revenue, 2).tolist(), adr.tolist())
+    return [labels + row for labels, row in zip(grouping.label_rows(groups), figures)]
+
+
+def top(conn, start_date, end_date, by="host", metric="revenue", limit=10):
+    """Return the `limit` revenue_report rows for one dimension with the highest `metric`"""
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+    rows = revenue_report(conn, start_date, end_date, (by,))
+    column = 1 + METRICS.index(metric)
+    return sorted(rows, key=lambda row: row[column], reverse=True)[:limit]
+
+
+def status_report(conn, start_date, end_date, by=("month",)):
+    """Return (*group labels, approved, pending, rejected, pending_pct, rejected_pct) rows of nights
+
+    Percentages are shares of all requested nights in the group; groups
+    without any booking are left out.
+    """
+    months, _ = _months(start_date, end_date)
+    with repository.read_transaction(conn):
+        listings = _listings(conn)
+        if not len(listings.ids):
+            return []
+        grouping = _Grouping(by, listings, months)
+        nights = nights_by_status(conn, listings, start_date, end_date, months)
+
+    counts = [grouping.sum(nights[status]) for status in ("Approved", "Pending", "Rejected")]
+    total = sum(counts)
+    groups = np.flatnonzero(total)
+    approved, pending, rejected = (count[groups].astype(np.int64) for count in counts)
+    pending_pct = np.round(100 * pending / total[groups], 1)
+    rejected_pct = np.round(100 * rejected / total[groups], 1)
+    figures = zip(approved.tolist(), pending.tolist(), rejected.tolist(), pending_pct.tolist(), rejected_pct.tolist())
+    return [labels + row for labels, row in zip(grouping.label_rows(groups), figures)]
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Asynchronous JSON API for House Rental CLI
+
+A small HTTP/1.1 server on asyncio (standard library only) that exposes the
+operations in services.py to web and mobile front ends, with the same
+validation rules as the menu and command mode. The event loop only parses
+requests and writes responses; every SQLite call runs in a thread:
+
+    reads   a pool of config.API_READERS threads, each with its own connection
+    writes  one writer thread, so writes queue in-process instead of fighting
+            over the SQLite write lock
+
+Endpoints (query parameters in brackets, JSON bodies in braces):
+
+    GET    /listings                  [after, before, size]
+    POST   /listings                  {title, location, price_per_day, host_name}
+    GET    /listings/search           [q, min_price, max_price, location, host, free_from, free_to, limit]
+    GET    /listings/{id}/available   [start, end]
+    GET    /listings/{id}/quote       [start, end] price of a stay (see pricing.py)
+    GET    /availability              [start, end]
+    GET    /occupancy                 [start, end, nights]
+    GET    /bookings                  [after, before, size]
+    POST   /bookings                  {listing_id, customer_name, start_date, end_date}
+    POST   /bookings/approve-pending  {listing_id, start_date, end_date, policy, dry_run} (all optional)
+    POST   /bookings/{id}/approve
+    POST   /bookings/{id}/reject
+    DELETE /bookings/{id}
+    GET    /earnings
+    GET    /reports/revenue           [start, end, by, top, metric]
+    GET    /reports/status            [start, end, by]
+    GET    /stats/cache               result cache hit/miss counters (see resultcache.py)
+    GET    /changes                   [after, consumer, limit] change feed batch (see changes.py)
+    POST   /changes/consumers/{name}  {seq} commit a consumer's cursor
+
+Rule violations answer 400 with {"error": message}; unknown paths 404.
+
+With --report-lag SECONDS (default config.REPORT_REPLICA_LAG) the report
+endpoints (/occupancy, /earnings, /reports/*) read a reporting replica that a
+background thread re-copies that often (see snapshot.py), so long reports
+never hold a read transaction on the live database.
+
+At startup the writer thread checks that the database is migrated, then creates
+any missing derived tables and triggers. The readers find them ready and never
+run DDL.
+
+Usage:
+    python api.py [--host 127.0.0.1] [--port 8080] [--database FILE] [--readers 4] [--report-lag SECONDS]
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sqlite3
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+import repository
+import pagination
+import services
+import resultcache
+import snapshot
+import changes
+import migrations
+from services import ServiceError
+from config import DATABASE_NAME, PAGE_SIZE, API_HOST, API_PORT, API_READERS, API_MAX_BODY, REPORT_REPLICA_LAG, CHANGE_BATCH_SIZE
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+MAX_PAGE_SIZE = 500
+
+LISTING_FIELDS = ("id", "title", "location", "price_per_day", "host_name")
+BOOKING_FIELDS = ("id", "listing", "customer_name", "start_date", "end_date", "status")
+
+# (method, path regex, handler, writes, report); handlers take (conn, query, body, *path groups)
+# and return (status, payload)
+ROUTES = []
+
+
+def route(method, pattern, writes=False, report=False):
+    """Register a handler for METHOD and a path regex; report handlers may read the reporting replica"""
+    def register(handler):
+        ROUTES.append((method, re.compile(f"^{pattern}$"), handler, writes, report))
+        return handler
+    return register
+
+
+def _records(fields, rows):
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def _number(query, name, kind=int, default=None):
+    value = query.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ServiceError(f"{name} must be a number.")
+
+
+def _dates(query):
+    return query.get("start", ""), query.get("end", "")
+
+
+def _page(conn, view, fields, query):
+    size = min(max(_number(query, "size", default=PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    rows = pagination.fetch_page(conn, view, _number(query, "after"), _number(query, "before"), size)
+    return 200, {"items": _records(fields, rows), "next_after": rows[-1][0] if len(rows) == size else None}
+
+
+# ---------------------- Listings ----------------------
+@route("GET", "/listings")
+def list_listings(conn, query, body):
+    return _page(conn, "listings", LISTING_FIELDS, query)
+
+
+@route("POST", "/listings", writes=True)
+def add_listing(conn, query, body):
+    price = body.get("price_per_day")
+    if not isinstance(price, (int, float)) or isinstance(price, bool):
+        raise ServiceError("Price per day must be a positive number.")
+    listing_id = services.add_listing(conn, body.get("title"), body.get("location"), price, body.get("host_name"))
+    return 201, {"id": listing_id}
+
+
+@route("GET", "/listings/search")
+def search_listings(conn, query, body):
+    limit = _number(query, "limit", default=50)
+    if limit < 1:
+        raise ServiceError("limit must be at least 1.")
+    rows = services.search_listings(
+        conn, query.get("q"), _number(query, "min_price", float), _number(query, "max_price", float),
+        min(limit, MAX_PAGE_SIZE), query.get("location"), query.get("host"),
+        query.get("free_from"), query.get("free_to"))
+    return 200, {"items": _records(LISTING_FIELDS, rows)}
+
+
+@route("GET", r"/listings/(\d+)/available")
+def listing_available(conn, query, body, listing_id):
+    available = services.listing_available(conn, int(listing_id), *_dates(query))
+    return 200, {"id": int(listing_id), "available": available}
+
+
+@route("GET", r"/listings/(\d+)/quote")
+def quote_booking(conn, query, body, listing_id):
+    return 200, services.quote_booking(conn, int(listing_id), *_dates(query))._asdict()
+
+
+@route("GET", "/availability")
+def available_listings(conn, query, body):
+    rows = services.available_listings(conn, *_dates(query))
+    return 200, {"items": _records(("id", "title", "location", "price_per_day"), rows)}
+
+
+@route("GET", "/occupancy", report=True)
+def occupancy_report(conn, query, body):
+    rows = services.occupancy_report(conn, *_dates(query), _number(query, "nights", default=1))
+    fields = ("id", "title", "location", "booked_nights", "occupancy_pct", "next_free_start")
+    return 200, {"items": _records(fields, rows)}
+
+
+# ---------------------- Bookings ----------------------
+@route("GET", "/bookings")
+def list_bookings(conn, query, body):
+    return _page(conn, "bookings", BOOKING_FIELDS, query)
+
+
+@route("POST", "/bookings", writes=True)
+def create_booking(conn, query, body):
+    listing_id = body.get("listing_id")
+    if not isinstance(listing_id, int) or isinstance(listing_id, bool):
+        raise ServiceError("Invalid listing ID.")
+    booking_id = services.create_booking(conn, listing_id, body.get("customer_name"),
+                                         body.get("start_date", ""), body.get("end_date", ""))
+    return 201, {"id": booking_id, "status": "Pending"}
+
+
+def _set_status(status):
+    def handler(conn, query, body, booking_id):
+        services.update_booking_status(conn, int(booking_id), status)
+        return 200, {"id": int(booking_id), "status": status}
+    return handler
+
+
+@route("POST", "/bookings/approve-pending", writes=True)
+def approve_pending(conn, query, body):
+    listing_id = body.get("listing_id")
+    if listing_id is not None and (not isinstance(listing_id, int) or isinstance(listing_id, bool)):
+        raise ServiceError("Invalid listing ID.")
+    decisions = services.approve_pending(conn, listing_id, body.get("start_date"), body.get("end_date"),
+                                         body.get("policy", "first_come"), bool(body.get("dry_run")))
+    items = _records(("id", "listing_id", "start_date", "end_date", "status"), decisions)
+    return 200, {"approved": sum(d.status == "Approved" for d in decisions),
+                 "rejected": sum(d.status == "Rejected" for d in decisions), "items": items}
+
+
+route("POST", r"/bookings/(\d+)/approve", writes=True)(_set_status("Approved"))
+route("POST", r"/bookings/(\d+)/reject", writes=True)(_set_status("Rejected"))
+
+
+@route("DELETE", r"/bookings/(\d+)", writes=True)
+def cancel_booking(conn, query, body, booking_id):
+    services.cancel_booking(conn, int(booking_id))
+    return 200, {"id": int(booking_id), "status": "Cancelled"}
+
+
+# ---------------------- Reports ----------------------
+@route("GET", "/earnings", report=True)
+def earnings_report(conn, query, body):
+    return 200, {"items": _records(("id", "title", "host_name", "earnings"), services.earnings_report(conn))}
+
+
+def _by(query):
+    return tuple(part for part in query.get("by", "month").split(",") if part)
+
+
+@route("GET", "/reports/revenue", report=True)
+def revenue_report(conn, query, body):
+    by = _by(query)
+    rows = services.revenue_report(conn, *_dates(query), by, _number(query, "top"), query.get("metric", "revenue"))
+    return 200, {"items": _records(by + ("booked_nights", "occupancy_pct", "revenue", "adr"), rows)}
+
+
+@route("GET", "/reports/status", report=True)
+def status_report(conn, query, body):
+    by = _by(query)
+    rows = services.status_report(conn, *_dates(query), by)
+    fields = by + ("approved_nights", "pending_nights", "rejected_nights", "pending_pct", "rejected_pct")
+    return 200, {"items": _records(fields, rows)}
+
+
+@route("GET", "/stats/cache")
+def cache_stats(conn, query, body):
+    return 200, resultcache.stats()
+
+
+# ---------------------- Change feed ----------------------
+@route("GET", "/changes")
+def change_feed(conn, query, body):
+    after = _number(query, "after")
+    if after is None:
+        after = changes.position(conn, query["consumer"]) if query.get("consumer") else 0
+    limit = min(max(_number(query, "limit", default=CHANGE_BATCH_SIZE), 1), MAX_PAGE_SIZE)
+    batch = changes.read(conn, after, limit)
+    return 200, {"items": [change._asdict() for change in batch], "next_after": batch[-1].seq if batch else after}
+
+
+@route("POST", r"/changes/consumers/([\w.-]+)", writes=True)
+def commit_consumer(conn, query, body, name):
+    seq = body.get("seq")
+    if not isinstance(seq, int) or isinstance(seq, bool) or seq < 0:
+        raise ServiceError("seq must be a non-negative integer.")
+    changes.commit(conn, name, seq)
+    return 200, {"consumer": name, "seq": changes.position(conn, name)}
+
+
+# ---------------------- Server ----------------------
+class ApiServer:
+    """Serve ROUTES over HTTP/1.1 with keep-alive, running handlers in the reader or writer pool"""
+
+    def __init__(self, database=None, readers=API_READERS, report_lag=REPORT_REPLICA_LAG):
+        self.database = database or DATABASE_NAME
+        # One pooled connection per worker thread, so none is ever opened per request
+        self.pool = repository.ConnectionPool(self.database, size=readers + 1)
+        self.readers = ThreadPoolExecutor(readers, thread_name_prefix="api-read")
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix="api-write")
+        self.replica = snapshot.ReportingReplica(self.database, report_lag) if report_lag is not None else None
+        self.server = None
+
+    def _prepare(self):
+        """Refuse unmigrated databases and create the derived schema before any reader runs"""
+        with self.pool.connection() as conn:
+            migrations.require_current(conn)
+            migrations.mark_ready(conn)
+            for module in migrations.DERIVED_MODULES:
+                module.ensure_schema(conn)
+
+    def _call(self, handler, query, body, args, report=False):
+        connection = self.replica.connection if report and self.replica else self.pool.connection
+        with connection() as conn:
+            return handler(conn, query, body, *args)
+
+    async def dispatch(self, method, target, body):
+        """Return (status, payload) for one request"""
+        url = urlsplit(target)
+        path = url.path.rstrip("/") or "/"
+        matched_path = False
+        for route_method, pattern, handler, writes, report in ROUTES:
+            match = pattern.match(path)
+            if match:
+                matched_path = True
+                if route_method == method:
+                    break
+        else:
+            return (405, {"error": "Method not allowed."}) if matched_path else (404, {"error": "Not found."})
+
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            return 400, {"error": "Request body is not valid JSON."}
+        if not isinstance(data, dict):
+            return 400, {"error": "Request body must be a JSON object."}
+
+        executor = self.writer if writes else self.readers
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, self._call, handler, query, data, match.groups(), report)
+        except ServiceError as e:
+            return 400, {"error": str(e)}
+        except Exception:
+            traceback.print_exc()
+            return 500, {"error": "Internal server error."}
+
+    async def handle(self, reader, writer):
+        """Serve requests on one client connection until it closes"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Malformed request line."}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                length = int(headers.get("content-length") or 0)
+                if length > API_MAX_BODY:
+                    await self._respond(writer, 413, {"error": "Request body too large."}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, payload = await self.dispatch(method.upper(), target, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        data = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + data)
+        await writer.drain()
+
+    async def start(self, host=API_HOST, port=API_PORT):
+        """Start listening and return the bound port (useful with port=0)"""
+        await asyncio.get_running_loop().run_in_executor(self.writer, self._prepare)
+        self.server = await asyncio.start_server(self.handle, host, port)
+        if self.replica:
+            self.replica.start()
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        self.readers.shutdown()
+        self.writer.shutdown()
+        self.pool.close_all()
+        if self.replica:
+            self.replica.stop()
+
+
+def serve_in_thread(database=None, host="127.0.0.1", port=0, readers=API_READERS, report_lag=REPORT_REPLICA_LAG):
+    """Run an ApiServer on its own event loop in a daemon thread; return (port, stop)"""
+    loop = asyncio.new_event_loop()
+    server = ApiServer(database, readers, report_lag)
+    ready = threading.Event()
+    bound = []
+
+    def run():
+        asyncio.set_event_loop(loop)
+        try:
+            bound.append(loop.run_until_complete(server.start(host, port)))
+        except Exception as e:
+            bound.append(e)
+            return
+        finally:
+            ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    ready.wait()
+    if isinstance(bound[0], Exception):
+        thread.join()
+        loop.run_until_complete(server.close())
+        loop.close()
+        raise bound[0]
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    return bound[0], stop
+
+
+async def serve(database, host, port, readers, report_lag):
+    server = ApiServer(database, readers, report_lag)
+    try:
+        bound = await server.start(host, port)
+    except BaseException:
+        await server.close()
+        raise
+    replica = f", reports from a replica refreshed every {report_lag:g}s" if report_lag is not None else ""
+    print(f"✓ Serving {server.database} on http://{host}:{bound} ({readers} readers, 1 writer{replica})")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="House Rental JSON API")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--database", help="database file (default: config.DATABASE_NAME)")
+    parser.add_argument("--readers", type=int, default=API_READERS, help="read worker threads")
+    parser.add_argument("--report-lag", type=float, default=REPORT_REPLICA_LAG, metavar="SECONDS",
+                        help="serve reports from a snapshot replica refreshed this often")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.database, args.host, args.port, args.readers, args.report_lag))
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+    except sqlite3.Error as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Batched booking approval for House Rental CLI
+
+approve_pending() takes the Pending bookings selected by listing and/or date
+window and decides all of them at once. Per listing, the candidates are
+ordered by a policy and swept against the listing's booked nights: a
+candidate that fits is approved and its nights become booked, one that
+overlaps is rejected. Pending bookings outside the selection that overlap a
+newly approved one can never be approved either, so they are rejected too.
+
+The selection is read and every decision written inside one write
+transaction, so a queue of thousands of requests clears in one pass and no
+other approval can slip in between.
+
+Policies (config.APPROVAL_POLICIES):
+    first_come     the earliest request (lowest booking id) wins
+    highest_value  the most valuable stay wins, then the earliest: its quoted
+                   total, or nights x price for a booking without one
+    max_bookings   earliest check-out first, which approves as many bookings as fit
+"""
+
+import bisect
+from collections import namedtuple
+from datetime import date
+import repository
+from storage import JULIAN_OFFSET
+
+Decision = namedtuple("Decision", "booking_id listing_id start_date end_date status")
+
+# Sort key of a candidate (booking_id, start_day, end_day, value); the lowest is decided first
+PRIORITY = {
+    "first_come": lambda candidate: candidate[0],
+    "highest_value": lambda candidate: (-candidate[3], candidate[0]),
+    "max_bookings": lambda candidate: (candidate[2], candidate[0]),
+}
+
+
+class BookedNights:
+    """Sorted, disjoint day-number intervals of one listing"""
+
+    def __init__(self, intervals=()):
+        self.starts, self.ends = [], []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def overlaps(self, start, end):
+        # Only the last interval starting on or before `end` can reach back to `start`
+        i = bisect.bisect_right(self.starts, end) - 1
+        return i >= 0 and self.ends[i] >= start
+
+    def add(self, start, end):
+        """Book a range that does not overlap"""
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+
+def _iso(day):
+    return date.fromordinal(day - JULIAN_OFFSET).isoformat()
+
+
+def resolve(conn, listing_id=None, start_date=None, end_date=None, policy="first_come"):
+    """Return a Decision for every selected Pending booking and every Pending booking it displaces"""
+    priority = PRIORITY[policy]
+    selected = {}
+    params = (listing_id, start_date, end_date)
+    for booking_id, listing, start, end, value in repository.execute(conn, "approval.pending", params):
+        selected.setdefault(listing, []).append((booking_id, start, end, value))
+
+    decisions = []
+    for listing, candidates in selected.items():
+        window = (listing, _iso(min(c[1] for c in candidates)), _iso(max(c[2] for c in candidates)))
+        approved, pending = [], []
+        for booking_id, status, start, end in repository.execute(conn, "approval.listing_bookings", window):
+            if status == "Approved":
+                approved.append((start, end))
+            else:
+                pending.append((booking_id, start, end))
+
+        booked = BookedNights(approved)
+        added = BookedNights()
+        for booking_id, start, end, _ in sorted(candidates, key=priority):
+            fits = not booked.overlaps(start, end)
+            if fits:
+                booked.add(start, end)
+                added.add(start, end)
+            decisions.append(Decision(booking_id, listing, _iso(start), _iso(end), "Approved" if fits else "Rejected"))
+
+        chosen = {candidate[0] for candidate in candidates}
+        for booking_id, start, end in pending:
+            if booking_id not in chosen and added.overlaps(start, end):
+                decisions.append(Decision(booking_id, listing, _iso(start), _iso(end), "Rejected"))
+    return decisions
+
+
+def apply(conn, decisions):
+    """Write decisions with one executemany per status"""
+    approved = [(d.booking_id,) for d in decisions if d.status == "Approved"]
+    rejected = [(d.booking_id,) for d in decisions if d.status == "Rejected"]
+    # approve_if_free re-checks overlaps, so a decision can never double-book
+    repository.executemany(conn, "booking.approve_if_free", approved)
+    repository.executemany(conn, "booking.reject_pending", rejected)
+
+
+def approve_pending(conn, listing_id=None, start_date=None, end_date=None, policy="first_come", dry_run=False):
+    """Resolve and apply the selection in one write transaction; dry_run only resolves"""
+    if dry_run:
+        return resolve(conn, listing_id, start_date, end_date, policy)
+    with repository.write_transaction(conn):
+        decisions = resolve(conn, listing_id, start_date, end_date, policy)
+        apply(conn, decisions)
+    return decisions
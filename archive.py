@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Booking archive for House Rental CLI
+
+archive_bookings() moves bookings that ended before a cutoff, and optionally
+every Rejected booking, out of the live Bookings table into per-year
+partition files next to the database:
+
+    house_rental.db  ->  house_rental.archive-2023.db, house_rental.archive-2024.db, ...
+
+A booking goes to the partition of its start year. Partitions always hold
+text dates and quoted totals in currency units, and are never written to again except by later archive runs, so
+the live table, its indexes and the R*Tree stay the size of the bookings
+that still matter.
+
+Rows move in short batches: each ATTACHes the year's partition, copies the
+rows, records their approved nights with earnings.keep_archived() and
+deletes them, all in one BEGIN IMMEDIATE, so a booking is always in exactly
+one place and the earnings aggregates never change. The change log (see
+changes.py) records the moves as 'archive' rather than 'delete'.
+
+Reports read history transparently: spans() returns the archived bookings
+overlapping a window, and analytics.nights_by_status and the occupancy
+cache add them to what they read from Bookings. Availability checks for new
+bookings only look at the live table, so cutoffs later than today are
+refused and archive stays in the past. Each batch also drops the cached
+search and availability results (see resultcache.py).
+
+Usage:
+    python archive.py [--database FILE] [--before YYYY-MM-DD] [--rejected]
+    python archive.py --status
+"""
+
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import date
+import config
+import repository
+import earnings
+import changes
+import occupancy
+import resultcache
+import storage
+from storage import JULIAN_OFFSET
+from services import validate_date
+
+PARTITION_TABLE = """
+    CREATE TABLE IF NOT EXISTS archive.Bookings (
+        id INTEGER PRIMARY KEY,
+        listing_id INTEGER NOT NULL,
+        customer_name TEXT NOT NULL,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_at DATETIME,
+        archived_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        total REAL
+    )
+"""
+PARTITION_INDEX = "CREATE INDEX IF NOT EXISTS archive.idx_bookings_dates ON Bookings (end_date, start_date)"
+
+PARTITION_SPANS = """
+    SELECT listing_id, CAST(julianday(start_date) AS INTEGER), CAST(julianday(end_date) AS INTEGER),
+           CASE status WHEN 'Pending' THEN 0 WHEN 'Approved' THEN 1 ELSE 2 END
+    FROM Bookings WHERE end_date >= ? AND start_date <= ? AND (? = 0 OR status = 'Approved')
+"""
+PARTITION_APPROVED = """
+    SELECT listing_id, CAST(julianday(start_date) AS INTEGER), CAST(julianday(end_date) AS INTEGER),
+           COALESCE(CAST(round(total * 100) AS INTEGER), -1)
+    FROM Bookings WHERE end_date >= ? AND start_date <= ? AND status = 'Approved'
+"""
+# Partitions written before bookings had quoted totals
+PARTITION_APPROVED_UNQUOTED = PARTITION_APPROVED.replace("COALESCE(CAST(round(total * 100) AS INTEGER), -1)", "-1")
+PARTITION_NAME = re.compile(r"\.archive-(\d{4})\.db$")
+
+
+def partition_path(database, year):
+    """File holding the bookings of `database` archived for `year`"""
+    return f"{os.path.splitext(database)[0]}.archive-{year}.db"
+
+
+def partitions(database):
+    """{year: path} of the existing partition files of `database`"""
+    if not database:
+        return {}
+    found = {}
+    for path in glob.glob(glob.escape(os.path.splitext(database)[0]) + ".archive-*.db"):
+        match = PARTITION_NAME.search(path)
+        if match:
+            found[int(match.group(1))] = path
+    return found
+
+
+def _columns(fmt):
+    """SQL for (start date text, end date text, start year) and a day parameter converter"""
+    if fmt == storage.COMPACT:
+        start, end = storage.date_sql("start_date"), storage.date_sql("end_date")
+        return start, end, f"CAST(strftime('%Y', {start}) AS INTEGER)", lambda iso: date.fromisoformat(iso).toordinal() + JULIAN_OFFSET
+    return "start_date", "end_date", "CAST(substr(start_date, 1, 4) AS INTEGER)", str
+
+
+def _selection(before, rejected, to_day):
+    """WHERE clause and parameters of the bookings to archive"""
+    terms, params = [], []
+    if before:
+        terms.append("end_date < ?")
+        params.append(to_day(before))
+    if rejected:
+        terms.append("status = 'Rejected'")
+    return "(" + " OR ".join(terms) + ")", params
+
+
+def connect(database):
+    conn = sqlite3.connect(database, timeout=config.BUSY_TIMEOUT, factory=storage.Connection)
+    repository.configure_connection(conn)
+    return conn
+
+
+def archive_bookings(database=None, before=None, rejected=False, batch_size=None, pause=None, progress=None):
+    """Move the selected bookings into the year partitions; return {year: bookings moved}"""
+    if not before and not rejected:
+        raise ValueError("Choose a cutoff date, rejected bookings, or both")
+    if before and not validate_date(before):
+        raise ValueError("Invalid date format. Please use YYYY-MM-DD.")
+    if before and before > date.today().isoformat():
+        # Approved stays still to come must stay in Bookings, where availability checks see them
+        raise ValueError("Cutoff date cannot be in the future.")
+    database = database or config.DATABASE_NAME
+    batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+    pause = config.MIGRATION_PAUSE if pause is None else pause
+
+    conn = connect(database)
+    try:
+        earnings.ensure_schema(conn)
+        changes.ensure_schema(conn)
+        fmt = storage.storage_format(conn)
+        start, end, year_sql, to_day = _columns(fmt)
+        total = storage.price_sql("total") if fmt == storage.COMPACT else "total"
+        where, params = _selection(before, rejected, to_day)
+        years = [row[0] for row in conn.execute(f"SELECT DISTINCT {year_sql} FROM Bookings WHERE {where} ORDER BY 1", params)]
+
+        moved = {}
+        for year in years:
+            conn.execute("ATTACH DATABASE ? AS archive", (partition_path(database, year),))
+            try:
+                conn.execute(PARTITION_TABLE)
+                conn.execute(PARTITION_INDEX)
+                # Partitions written before bookings had quoted totals
+                if "total" not in {row[1] for row in conn.execute("PRAGMA archive.table_info(Bookings)")}:
+                    conn.execute("ALTER TABLE archive.Bookings ADD COLUMN total REAL")
+                batch = f"{where} AND {year_sql} = ? AND id > ? AND id <= ?"
+                last_id = 0
+                while True:
+                    with repository.write_transaction(conn):
+                        bound = conn.execute(
+                            f"SELECT MAX(id) FROM (SELECT id FROM Bookings WHERE {where} AND {year_sql} = ?"
+                            f" AND id > ? ORDER BY id LIMIT ?)",
+                            (*params, year, last_id, batch_size),
+                        ).fetchone()[0]
+                        if bound is None:
+                            break
+                        batch_params = (*params, year, last_id, bound)
+                        conn.execute(
+                            f"INSERT OR REPLACE INTO archive.Bookings"
+                            f" (id, listing_id, customer_name, start_date, end_date, status, created_at, total)"
+                            f" SELECT id, listing_id, customer_name, {start}, {end}, status, created_at, {total}"
+                            f" FROM Bookings WHERE {batch}",
+                            batch_params,
+                        )
+                        earnings.keep_archived(conn, batch, batch_params)
+                        logged = changes.head(conn)
+                        count = conn.execute(f"DELETE FROM Bookings WHERE {batch}", batch_params).rowcount
+                        changes.mark_archived(conn, logged)
+                    resultcache.invalidate(conn)
+                    moved[year] = moved.get(year, 0) + count
+                    last_id = bound
+                    if progress:
+                        progress(f"  {year}: {moved[year]:,} bookings archived")
+                    time.sleep(pause)
+            finally:
+                conn.execute("DETACH DATABASE archive")
+
+        if moved:
+            # Hand the freed pages back when the file uses auto_vacuum=INCREMENTAL
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+            occupancy.invalidate(conn)
+        return moved
+    finally:
+        conn.close()
+
+
+def spans(conn, start_date, end_date, approved_only=False):
+    """Archived (listing_id, start_day, end_day, status_code) rows overlapping the window
+
+    Same columns as the "analytics.spans" statement. Only partitions of years
+    up to the window's end can hold overlapping bookings.
+    """
+    return _partition_rows(conn, end_date, PARTITION_SPANS, (start_date, end_date, int(approved_only)))
+
+
+def approved(conn, start_date, end_date):
+    """Archived approved (listing_id, start_day, end_day, total_cents) rows overlapping the window
+
+    Same columns as the "analytics.approved" statement: total_cents is -1
+    for bookings without a quoted total.
+    """
+    return _partition_rows(conn, end_date, PARTITION_APPROVED, (start_date, end_date),
+                           unquoted_sql=PARTITION_APPROVED_UNQUOTED)
+
+
+def _partition_rows(conn, end_date, sql, params, unquoted_sql=None):
+    """Rows of `sql` from the partitions of years up to end_date
+
+    Partitions without the total column run `unquoted_sql` instead.
+    """
+    last_year = date.fromisoformat(end_date).year
+    # A reporting snapshot (see snapshot.py) reads the partitions of the database it copies
+    database = getattr(conn, "source_database", None) or repository.database_file(conn)
+    rows = []
+    for year, path in sorted(partitions(database).items()):
+        if year > last_year:
+            break
+        archive = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            if unquoted_sql and "total" not in {row[1] for row in archive.execute("PRAGMA table_info(Bookings)")}:
+                rows.extend(archive.execute(unquoted_sql, params))
+            else:
+                rows.extend(archive.execute(sql, params))
+        finally:
+            archive.close()
+    return rows
+
+
+def status(database):
+    """(year, bookings, approved, first start, last end, file size) per partition"""
+    rows = []
+    for year, path in sorted(partitions(database).items()):
+        archive = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            count, approved, first, last = archive.execute(
+                "SELECT COUNT(*), SUM(status = 'Approved'), MIN(start_date), MAX(end_date) FROM Bookings"
+            ).fetchone()
+        finally:
+            archive.close()
+        rows.append((year, count, approved or 0, first, last, os.path.getsize(path)))
+    return rows
+
+
+def main(argv=None):
+    from tabulate import tabulate
+    parser = argparse.ArgumentParser(description="Move old or rejected bookings into per-year archive files")
+    parser.add_argument("--database", default=config.DATABASE_NAME)
+    parser.add_argument("--before", metavar="YYYY-MM-DD", help="archive bookings that ended before this date")
+    parser.add_argument("--rejected", action="store_true", help="archive every rejected booking")
+    parser.add_argument("--batch-size", type=int, default=config.ARCHIVE_BATCH_SIZE, help="bookings moved per transaction")
+    parser.add_argument("--pause", type=float, default=config.MIGRATION_PAUSE, help="seconds to yield between batches")
+    parser.add_argument("--status", action="store_true", help="list the archive partitions and exit")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        rows = status(args.database)
+        if not rows:
+            print("No archived bookings.")
+            return 0
+        print(tabulate(rows, headers=["Year", "Bookings", "Approved", "First Start", "Last End", "Bytes"],
+                       tablefmt=config.TABLE_FORMAT))
+        return 0
+
+    try:
+        moved = archive_bookings(args.database, args.before, args.rejected, args.batch_size, args.pause, progress=print)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✓ Archived {sum(moved.values()):,} booking(s) into {len(moved)} partition(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Availability engine for House Rental CLI
+
+Approved bookings are mirrored into an R*Tree of julian-day ranges so that
+"which listings are free from X to Y" is answered from the spatial index
+instead of scanning Bookings. Single-listing overlap checks use the composite
+(listing_id, status, start_date, end_date) index.
+
+A booking [start, end] conflicts with a requested range [X, Y] when
+start <= Y and end >= X, which also covers bookings that fall strictly
+inside the requested range.
+"""
+
+import repository
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE INDEX IF NOT EXISTS idx_bookings_listing_status_dates
+    ON Bookings (listing_id, status, start_date, end_date)
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS BookingSpans
+    USING rtree_i32(id, start_day, end_day)
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bookings_spans_ai AFTER INSERT ON Bookings
+    WHEN NEW.status = 'Approved'
+    BEGIN
+        INSERT INTO BookingSpans (id, start_day, end_day)
+        VALUES (NEW.id, CAST(julianday(NEW.start_date) AS INTEGER), CAST(julianday(NEW.end_date) AS INTEGER));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bookings_spans_au AFTER UPDATE OF status, start_date, end_date ON Bookings
+    BEGIN
+        DELETE FROM BookingSpans WHERE id = OLD.id;
+        INSERT INTO BookingSpans (id, start_day, end_day)
+        SELECT NEW.id, CAST(julianday(NEW.start_date) AS INTEGER), CAST(julianday(NEW.end_date) AS INTEGER)
+        WHERE NEW.status = 'Approved';
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bookings_spans_ad AFTER DELETE ON Bookings
+    BEGIN
+        DELETE FROM BookingSpans WHERE id = OLD.id;
+    END
+    """,
+]
+
+BACKFILL_SPANS = """
+    INSERT OR REPLACE INTO BookingSpans (id, start_day, end_day)
+    SELECT id, CAST(julianday(start_date) AS INTEGER), CAST(julianday(end_date) AS INTEGER)
+    FROM Bookings WHERE status = 'Approved'
+"""
+
+BOOKING_TRIGGERS = ["bookings_spans_ai", "bookings_spans_au", "bookings_spans_ad"]
+
+_ready = set()
+
+
+def ensure_schema(conn):
+    """Create the availability index, R*Tree and sync triggers if missing"""
+    key = repository.database_file(conn)
+    if key and key in _ready:
+        return
+    # Join a caller's open transaction instead of committing it early
+    owns_transaction = not conn.in_transaction
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'BookingSpans'"
+    ).fetchone()
+    for statement in SCHEMA_STATEMENTS:
+        conn.execute(statement)
+    if not exists:
+        conn.execute(BACKFILL_SPANS)
+    if owns_transaction:
+        conn.commit()
+        _ready.add(key)
+
+
+def drop_triggers(conn):
+    """Drop the Bookings sync triggers for a bulk load; call rebuild_spans() afterwards
+
+    The overlap index stays: bulk.py checks each approved row against it.
+    """
+    for name in BOOKING_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.commit()
+    _ready.discard(repository.database_file(conn))
+
+
+def rebuild_spans(conn):
+    """Repopulate BookingSpans from Bookings (e.g. after bulk edits with triggers off)"""
+    ensure_schema(conn)
+    conn.execute("DELETE FROM BookingSpans")
+    conn.execute(BACKFILL_SPANS)
+    conn.commit()
+
+
+def is_available(conn, listing_id, start_date, end_date):
+    """Return True if no approved booking of the listing overlaps the range"""
+    ensure_schema(conn)
+    count = repository.execute(conn, "booking.overlap_count", (listing_id, end_date, start_date)).fetchone()[0]
+    return count == 0
+
+
+def free_listings(conn, start_date, end_date):
+    """Return (id, title, location, price_per_day) for listings free for the whole range"""
+    ensure_schema(conn)
+    return repository.execute(conn, "listing.available", (end_date, start_date)).fetchall()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for House Rental CLI
+
+Generates synthetic databases (see datagen.py) at one or more booking counts
+and times the operation behind every menu action in main.py and features.py.
+For each operation it records p50/p95/p99 latency over repeated runs and the
+peak Python memory of one run, then compares against a stored baseline and
+flags regressions.
+
+Usage:
+    python benchmark.py                                  # 10k bookings
+    python benchmark.py --scales 10000 100000 1000000
+    python benchmark.py --save-baseline                  # record current numbers
+    python benchmark.py --baseline benchmarks/baseline.json --threshold 1.25
+    python benchmark.py --storage --scales 100000        # text vs compact storage
+
+--storage copies each database into both storage formats (see storage.py),
+vacuums both, and compares file size and the queries that read booking dates
+and prices on every row.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from tabulate import tabulate
+import repository
+import availability
+import occupancy
+import pagination
+import services
+import datagen
+import migrations
+import storage
+from config import TABLE_FORMAT
+
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+# Changes smaller than this many milliseconds are treated as noise
+NOISE_FLOOR_MS = 0.05
+
+SEARCH_WORDS = ["nairobi", "villa", "beach", "mwangi", "cozy", "karen", "nyali", "studio", "lake", "grace"]
+WRITE_START = date(2040, 1, 1)
+
+
+class Context:
+    """Per-database state shared by the operations of one benchmark run"""
+
+    def __init__(self, conn, seed):
+        self.conn = conn
+        self.rng = random.Random(seed)
+        self.max_listing = conn.execute("SELECT MAX(id) FROM Listings").fetchone()[0]
+        self.max_booking = conn.execute("SELECT MAX(id) FROM Bookings").fetchone()[0] or 0
+        self.next_day = 0
+
+    def listing_id(self):
+        return self.rng.randint(1, self.max_listing)
+
+    def booking_id(self):
+        return self.rng.randint(1, max(self.max_booking, 1))
+
+    def date_range(self, nights=3):
+        start = date(2024, 1, 1) + timedelta(days=self.rng.randrange(700))
+        return start.isoformat(), (start + timedelta(days=nights - 1)).isoformat()
+
+    def pending_booking(self):
+        """Create a fresh Pending booking in the far future and return its id"""
+        self.next_day += 2
+        start = WRITE_START + timedelta(days=self.next_day)
+        return services.create_booking(self.conn, self.listing_id(), "Benchmark", start.isoformat(), start.isoformat())
+
+
+# Each operation takes the Context and returns the zero-argument call to time,
+# so any setup (e.g. creating a booking to approve) stays outside the timing.
+OPERATIONS = {
+    "view_listings_page": lambda ctx: (lambda after=ctx.listing_id(): pagination.fetch_page(ctx.conn, "listings", after=after)),
+    "view_listings_all": lambda ctx: (lambda: sum(1 for _ in services.iter_listings(ctx.conn))),
+    "manage_bookings_page": lambda ctx: (lambda after=ctx.booking_id(): pagination.fetch_page(ctx.conn, "bookings", after=after)),
+    "search_text": lambda ctx: (lambda word=ctx.rng.choice(SEARCH_WORDS): services.search_listings(ctx.conn, text=word, limit=50)),
+    "search_price_range": lambda ctx: (lambda low=ctx.rng.randint(20, 200): services.search_listings(
+        ctx.conn, min_price=low, max_price=low + 20, limit=50)),
+    "search_facets": lambda ctx: (lambda dates=ctx.date_range(): services.search_listings(
+        ctx.conn, location="Nairobi", max_price=150, free_from=dates[0], free_to=dates[1], limit=50)),
+    "availability_all_listings": lambda ctx: (lambda dates=ctx.date_range(): services.available_listings(ctx.conn, *dates)),
+    "availability_one_listing": lambda ctx: (lambda listing=ctx.listing_id(), dates=ctx.date_range(): availability.is_available(
+        ctx.conn, listing, *dates)),
+    "occupancy_free_listings": lambda ctx: (lambda dates=ctx.date_range(): occupancy.free_listings(ctx.conn, *dates)),
+    "occupancy_first_window": lambda ctx: (lambda dates=ctx.date_range(60): occupancy.first_free_window(ctx.conn, 5, *dates)),
+    "create_booking": lambda ctx: ctx.pending_booking,
+    "approve_booking": lambda ctx: (lambda booking=ctx.pending_booking(): services.update_booking_status(ctx.conn, booking, "Approved")),
+    "cancel_booking": lambda ctx: (lambda booking=ctx.pending_booking(): services.cancel_booking(ctx.conn, booking)),
+    "earnings_report": lambda ctx: (lambda: services.earnings_report(ctx.conn)),
+    "revenue_report_by_month_city": lambda ctx: (lambda: services.revenue_report(ctx.conn, "2024-01-01", "2025-12-31", ("month", "city"))),
+    "status_report_by_month": lambda ctx: (lambda: services.status_report(ctx.conn, "2024-01-01", "2025-12-31")),
+}
+
+
+# Queries whose cost depends on how dates and prices are stored (benchmark.py --storage)
+STORAGE_OPERATIONS = {
+    "overlap_check": OPERATIONS["availability_one_listing"],
+    "approved_overlaps_scan": lambda ctx: (lambda: repository.execute(ctx.conn, "booking.approved_overlaps").fetchall()),
+    "earnings_full_query": lambda ctx: (lambda: repository.execute(ctx.conn, "earnings.by_listing").fetchall()),
+    "earnings_report": OPERATIONS["earnings_report"],
+    "status_report_by_month": OPERATIONS["status_report_by_month"],
+    "manage_bookings_page": OPERATIONS["manage_bookings_page"],
+}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def measure(ctx, make_call, repeat):
+    """Return latency percentiles (ms) and peak traced memory (KiB) for one operation"""
+    timings = []
+    for _ in range(repeat):
+        call = make_call(ctx)
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+
+    call = make_call(ctx)
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "p50": percentile(timings, 0.50),
+        "p95": percentile(timings, 0.95),
+        "p99": percentile(timings, 0.99),
+        "mean": sum(timings) / len(timings),
+        "peak_kib": peak / 1024,
+    }
+
+
+def database_for(scale, data_dir, seed, rebuild=False, progress=None):
+    """Return the path of a synthetic database with `scale` bookings, creating it if needed"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"bench_{scale}_{seed}.db")
+    if rebuild or not os.path.exists(path):
+        datagen.create_database(path, max(1, scale // 10), scale, seed, progress)
+    return path
+
+
+def run_benchmarks(scale, repeat=20, seed=42, data_dir=None, operations=None, rebuild=False, progress=None):
+    """Benchmark the selected operations at one scale and return {operation: stats}"""
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), "house_rental_bench")
+    path = database_for(scale, data_dir, seed, rebuild, progress)
+    results = {}
+    with repository.connection(path) as conn:
+        ctx = Context(conn, seed)
+        for name in operations or OPERATIONS:
+            results[name] = measure(ctx, OPERATIONS[name], repeat)
+    return results
+
+
+def storage_copies(scale, data_dir, seed, rebuild=False, progress=None):
+    """Return {format: path} of vacuumed text and compact copies of the scale's database"""
+    source = database_for(scale, data_dir, seed, rebuild, progress)
+    paths = {}
+    for fmt in storage.FORMATS:
+        path = os.path.join(data_dir, f"bench_{scale}_{seed}_{fmt}.db")
+        if rebuild or not os.path.exists(path):
+            # The backup API also copies pages still in the source's WAL
+            with sqlite3.connect(source) as src, sqlite3.connect(path) as copy:
+                src.backup(copy)
+            if not migrations.convert_storage(path, fmt, pause=0):
+                conn = sqlite3.connect(path)
+                conn.execute("VACUUM")
+                conn.close()
+        paths[fmt] = path
+    return paths
+
+
+def compare_storage(scale, repeat=20, seed=42, data_dir=None, rebuild=False, progress=None):
+    """Return {format: {"file_bytes": size, operation: stats}} for both storage formats"""
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), "house_rental_bench")
+    results = {}
+    for fmt, path in storage_copies(scale, data_dir, seed, rebuild, progress).items():
+        results[fmt] = {"file_bytes": os.path.getsize(path)}
+        with repository.connection(path) as conn:
+            ctx = Context(conn, seed)
+            for name, make_call in STORAGE_OPERATIONS.items():
+                results[fmt][name] = measure(ctx, make_call, repeat)
+    return results
+
+
+def print_storage_comparison(results):
+    text, compact = results[storage.TEXT], results[storage.COMPACT]
+    rows = [["file size (KiB)", f"{text['file_bytes'] / 1024:.0f}", f"{compact['file_bytes'] / 1024:.0f}",
+             f"{compact['file_bytes'] / text['file_bytes']:.2f}x"]]
+    rows += [[name, f"{text[name]['p50']:.3f}", f"{compact[name]['p50']:.3f}",
+              f"{compact[name]['p50'] / text[name]['p50']:.2f}x" if text[name]["p50"] else "-"]
+             for name in STORAGE_OPERATIONS]
+    print(tabulate(rows, headers=["Measure (p50 ms)", "text", "compact", "compact / text"], tablefmt=TABLE_FORMAT))
+
+
+def compare(results, baseline, threshold):
+    """Return [(scale, operation, current_p95, baseline_p95)] for regressed operations"""
+    regressions = []
+    for scale, operations in results.items():
+        for name, stats in operations.items():
+            before = baseline.get(str(scale), {}).get(name)
+            if not before:
+                continue
+            if stats["p95"] > before["p95"] * threshold and stats["p95"] - before["p95"] > NOISE_FLOOR_MS:
+                regressions.append((scale, name, stats["p95"], before["p95"]))
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def save_baseline(path, results):
+    baseline = load_baseline(path)
+    baseline.update({str(scale): operations for scale, operations in results.items()})
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(baseline, handle, indent=2, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark House Rental CLI operations")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000], help="booking counts to test")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per operation")
+    parser.add_argument("--ops", nargs="+", choices=sorted(OPERATIONS), help="operations to run (default: all)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", help="where generated databases are cached")
+    parser.add_argument("--rebuild", action="store_true", help="regenerate cached databases")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=1.25, help="flag p95 slower than baseline by this factor")
+    parser.add_argument("--json", help="also write the raw results to this file")
+    parser.add_argument("--storage", action="store_true", help="compare the text and compact storage formats instead")
+    args = parser.parse_args(argv)
+
+    if args.storage:
+        results = {}
+        for scale in args.scales:
+            print(f"\n=== {scale:,} bookings: text vs compact storage ===")
+            results[scale] = compare_storage(scale, args.repeat, args.seed, args.data_dir, args.rebuild, print)
+            print_storage_comparison(results[scale])
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as handle:
+                json.dump(results, handle, indent=2)
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    for scale in args.scales:
+        print(f"\n=== {scale:,} bookings ===")
+        results[scale] = run_benchmarks(scale, args.repeat, args.seed, args.data_dir, args.ops, args.rebuild, print)
+        rows = []
+        for name, stats in results[scale].items():
+            before = baseline.get(str(scale), {}).get(name)
+            change = f"{stats['p95'] / before['p95']:.2f}x" if before and before["p95"] else "-"
+            rows.append([name, f"{stats['p50']:.3f}", f"{stats['p95']:.3f}", f"{stats['p99']:.3f}",
+                         f"{stats['peak_kib']:.0f}", change])
+        print(tabulate(rows, headers=["Operation", "p50 ms", "p95 ms", "p99 ms", "Peak KiB", "vs baseline p95"],
+                       tablefmt=TABLE_FORMAT))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"\n✓ Baseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("\n❌ Regressions:")
+        for scale, name, now, before in regressions:
+            print(f"  {scale:,} bookings / {name}: p95 {before:.3f} ms -> {now:.3f} ms")
+        return 1
+    if baseline:
+        print("\n✓ No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Bulk import and export for House Rental CLI
+
+Reads CSV or JSONL files in chunks, validates every row with the same rules
+as the table CHECK constraints and validate_date, and inserts each chunk with
+executemany in its own transaction. Approved bookings are inserted only if
+no approved booking of the listing overlaps them, as in services.py, and
+rows reusing an existing id are rejected. Exports stream the table through a cursor,
+so neither direction holds the whole file in memory. Files always hold ISO
+dates and prices in currency units, whatever the database's storage format.
+
+Usage:
+    python bulk.py import listings listings.csv
+    python bulk.py import bookings bookings.jsonl
+    python bulk.py export bookings bookings.csv
+"""
+
+import argparse
+import csv
+import json
+import math
+import sqlite3
+import sys
+import time
+from functools import lru_cache
+import repository
+import availability
+import earnings
+import occupancy
+import resultcache
+import storage
+from services import validate_date
+from config import VALID_STATUSES
+
+CHUNK_SIZE = 50000
+
+TABLES = {
+    "listings": {
+        "columns": ["id", "title", "location", "price_per_day", "host_name"],
+        "insert": "INSERT INTO Listings (id, title, location, price_per_day, host_name) VALUES (?, ?, ?, ?, ?)",
+        "select": "SELECT id, title, location, price_per_day, host_name FROM Listings ORDER BY id",
+        "compact_insert": "INSERT INTO Listings (id, title, location, price_per_day, host_name)"
+                          " VALUES (?, ?, ?, CAST(round(? * 100) AS INTEGER), ?)",
+        "compact_select": "SELECT id, title, location, price_per_day / 100.0, host_name FROM Listings ORDER BY id",
+    },
+    "bookings": {
+        "columns": ["id", "listing_id", "customer_name", "start_date", "end_date", "status"],
+        "insert": "INSERT INTO Bookings (id, listing_id, customer_name, start_date, end_date, status) VALUES (?, ?, ?, ?, ?, ?)",
+        "select": "SELECT id, listing_id, customer_name, start_date, end_date, status FROM Bookings ORDER BY id",
+        "compact_insert": "INSERT INTO Bookings (id, listing_id, customer_name, start_date, end_date, status)"
+                          " VALUES (?, ?, ?, CAST(julianday(?) AS INTEGER), CAST(julianday(?) AS INTEGER), ?)",
+        "compact_select": "SELECT id, listing_id, customer_name, date(start_date + 0.5), date(end_date + 0.5), status"
+                          " FROM Bookings ORDER BY id",
+        "ids": "SELECT id FROM Bookings",
+        # Approved rows: skipped (rowcount 0) when an approved booking of the listing overlaps them
+        "insert_if_free": """
+            INSERT INTO Bookings (id, listing_id, customer_name, start_date, end_date, status)
+            SELECT ?1, ?2, ?3, ?4, ?5, ?6
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Bookings
+                WHERE listing_id = ?2 AND status = 'Approved' AND start_date <= ?5 AND end_date >= ?4
+            )
+        """,
+        "compact_insert_if_free": """
+            INSERT INTO Bookings (id, listing_id, customer_name, start_date, end_date, status)
+            SELECT ?1, ?2, ?3, CAST(julianday(?4) AS INTEGER), CAST(julianday(?5) AS INTEGER), ?6
+            WHERE NOT EXISTS (
+                SELECT 1 FROM Bookings
+                WHERE listing_id = ?2 AND status = 'Approved'
+                AND start_date <= CAST(julianday(?5) AS INTEGER) AND end_date >= CAST(julianday(?4) AS INTEGER)
+            )
+        """,
+    },
+}
+
+
+class RowError(ValueError):
+    """Raised when an input row breaks a table rule"""
+
+
+# Dates repeat heavily in bulk files, so validation results are memoized
+_valid_date = lru_cache(maxsize=65536)(validate_date)
+
+
+def _text(record, field):
+    value = (record.get(field) or "").strip()
+    if not value:
+        raise RowError(f"{field} cannot be empty")
+    return value
+
+
+def _optional_id(record, ids=None):
+    """The record's id, or None to let SQLite assign one; ids holds those already taken"""
+    value = record.get("id")
+    if value in (None, ""):
+        return None
+    try:
+        record_id = int(value)
+    except (TypeError, ValueError):
+        raise RowError("id must be an integer")
+    if ids is not None:
+        if record_id in ids:
+            raise RowError(f"id {record_id} already exists")
+        ids.add(record_id)
+    return record_id
+
+
+def validate_listing(record, listing_ids=None, ids=None):
+    """Return a Listings insert tuple for a record, or raise RowError"""
+    try:
+        price = float(record.get("price_per_day"))
+    except (TypeError, ValueError):
+        raise RowError("price_per_day must be a number")
+    if not math.isfinite(price) or price <= 0:
+        raise RowError("price_per_day must be positive")
+    title, location, host_name = _text(record, "title"), _text(record, "location"), _text(record, "host_name")
+    # Listing ids are taken from listing_ids, so later bookings rows can refer to them
+    return (_optional_id(record, listing_ids), title, location, price, host_name)
+
+
+def validate_booking(record, listing_ids=None, ids=None):
+    """Return a Bookings insert tuple for a record, or raise RowError"""
+    try:
+        listing_id = int(record.get("listing_id"))
+    except (TypeError, ValueError):
+        raise RowError("listing_id must be an integer")
+    if listing_ids is not None and listing_id not in listing_ids:
+        raise RowError(f"listing {listing_id} does not exist")
+    start_date = _text(record, "start_date")
+    end_date = _text(record, "end_date")
+    if not (_valid_date(start_date) and _valid_date(end_date)):
+        raise RowError("dates must use YYYY-MM-DD")
+    if end_date < start_date:
+        raise RowError("end_date is before start_date")
+    status = (record.get("status") or "Pending").strip().capitalize()
+    if status not in VALID_STATUSES:
+        raise RowError(f"invalid status {status!r}")
+    customer_name = _text(record, "customer_name")
+    return (_optional_id(record, ids), listing_id, customer_name, start_date, end_date, status)
+
+
+VALIDATORS = {"listings": validate_listing, "bookings": validate_booking}
+
+
+def _detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return "jsonl" if path.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def read_records(handle, fmt):
+    """Yield dict records from a CSV or JSONL stream one at a time"""
+    if fmt == "csv":
+        yield from csv.DictReader(handle)
+    else:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _report(progress, table, done, rejected, started):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    progress(f"  {table}: {done:,} rows imported, {rejected:,} rejected ({done / elapsed:,.0f} rows/sec)")
+
+
+def import_records(conn, table, records, chunk_size=CHUNK_SIZE, progress=print, max_errors=20):
+    """Validate and insert an iterable of dict records in batched transactions
+
+    Returns a dict with imported/rejected counts, elapsed seconds and the
+    first `max_errors` (line, message) validation errors.
+    """
+    spec = TABLES[table]
+    compact = storage.is_compact(conn)
+    insert = spec["compact_insert" if compact else "insert"]
+    insert_if_free = spec.get("compact_insert_if_free" if compact else "insert_if_free")
+    validate = VALIDATORS[table]
+    listing_ids = {row[0] for row in conn.execute("SELECT id FROM Listings")}
+    ids = {row[0] for row in conn.execute(spec["ids"])} if "ids" in spec else None
+
+    if table == "bookings":
+        # Derived tables are rebuilt once at the end instead of per-row triggers
+        availability.ensure_schema(conn)
+        availability.drop_triggers(conn)
+        earnings.drop_triggers(conn)
+
+    started = time.perf_counter()
+    imported = rejected = 0
+    errors = []
+    batch = []
+
+    def reject(line, message):
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < max_errors:
+            errors.append((line, message))
+
+    def flush():
+        nonlocal imported
+        with conn:
+            if insert_if_free is None:
+                conn.executemany(insert, [row for _, row in batch])
+                imported += len(batch)
+            else:
+                # Runs of other rows still go through executemany, in file order
+                run = []
+                for line, row in batch + [(None, None)]:
+                    if row is not None and row[5] != "Approved":
+                        run.append(row)
+                        continue
+                    conn.executemany(insert, run)
+                    imported += len(run)
+                    run.clear()
+                    if row is None:
+                        break
+                    if conn.execute(insert_if_free, row).rowcount:
+                        imported += 1
+                    else:
+                        reject(line, "overlaps an approved booking of the listing")
+        batch.clear()
+        if progress:
+            _report(progress, table, imported, rejected, started)
+
+    try:
+        for line, record in enumerate(records, start=1):
+            try:
+                batch.append((line, validate(record, listing_ids, ids)))
+            except RowError as e:
+                reject(line, str(e))
+                continue
+            if len(batch) >= chunk_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        if table == "bookings":
+            availability.rebuild_spans(conn)
+            earnings.rebuild(conn)
+        occupancy.invalidate(conn)
+        resultcache.invalidate(conn)
+
+    elapsed = time.perf_counter() - started
+    return {"imported": imported, "rejected": rejected, "seconds": elapsed, "errors": sorted(errors)}
+
+
+def import_file(conn, table, path, fmt=None, **kwargs):
+    """Stream a CSV or JSONL file into a table; see import_records"""
+    with open(path, newline="", encoding="utf-8") as handle:
+        return import_records(conn, table, read_records(handle, _detect_format(path, fmt)), **kwargs)
+
+
+def export_file(conn, table, path, fmt=None, chunk_size=CHUNK_SIZE):
+    """Stream a table to a CSV or JSONL file and return the row count"""
+    spec = TABLES[table]
+    columns = spec["columns"]
+    fmt = _detect_format(path, fmt)
+    cursor = conn.execute(spec["compact_select" if storage.is_compact(conn) else "select"])
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle) if fmt == "csv" else None
+        if writer:
+            writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            if writer:
+                writer.writerows(rows)
+            else:
+                handle.writelines(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+            count += len(rows)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import/export for House Rental CLI")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("table", choices=sorted(TABLES))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    with repository.connection() as conn:
+        if args.action == "import":
+            try:
+                result = import_file(conn, args.table, args.path, args.format, chunk_size=args.chunk_size)
+            except (sqlite3.Error, ValueError) as e:
+                # Chunks committed before the failing one stay imported
+                print(f"❌ Import failed: {e}")
+                return 1
+            for line, message in result["errors"]:
+                print(f"  row {line}: {message}")
+            rate = result["imported"] / max(result["seconds"], 1e-9)
+            print(f"✓ Imported {result['imported']:,} {args.table} in {result['seconds']:.2f}s "
+                  f"({rate:,.0f} rows/sec), rejected {result['rejected']:,}.")
+        else:
+            started = time.perf_counter()
+            count = export_file(conn, args.table, args.path, args.format, chunk_size=args.chunk_size)
+            print(f"✓ Exported {count:,} {args.table} to {args.path} in {time.perf_counter() - started:.2f}s.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Change-data-capture feed for House Rental CLI
+
+Triggers on Listings and Bookings append every insert, update and delete to
+ChangeLog, so downstream systems (search index, accounting export, caches)
+can follow the tables incrementally instead of re-reading them:
+
+    seq         AUTOINCREMENT sequence number; writes are serialized by the
+                SQLite write lock, so committed changes appear in seq order
+                with no gaps, and numbers are never reused after prune()
+    table_name  'Listings' or 'Bookings'
+    row_id      id of the changed row
+    operation   'insert', 'update', 'delete', or 'archive' for bookings moved
+                out by archive.py
+    data        the row as JSON after the change (before it, for deletes),
+                with 'YYYY-MM-DD' dates and decimal prices in both storage formats
+
+Updates that change no column are not logged. The log starts when the
+triggers are created: a new consumer exports the tables once (bulk.py), then
+tails from the head() it read in the same transaction.
+
+Consumers read batches after a cursor with read(), or tail() a database. A
+named consumer's cursor is kept in ChangeConsumers; tail() commits it after
+each batch has been processed, so delivery is at-least-once. prune() drops
+the entries every named consumer has passed. Each shard (see sharding.py)
+has its own log and sequence.
+
+Usage:
+    python changes.py [--database FILE] [--after SEQ | --consumer NAME] [--follow]
+    python changes.py --prune
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import namedtuple
+import config
+import repository
+import storage
+
+Change = namedtuple("Change", "seq table_name row_id operation data changed_at")
+
+# Row columns as JSON, per table and storage format; {row} is NEW or OLD
+ROW_JSON = {
+    "Listings": {
+        storage.TEXT: "json_object('id', {row}.id, 'title', {row}.title, 'location', {row}.location,"
+                      " 'price_per_day', {row}.price_per_day, 'host_name', {row}.host_name, 'created_at', {row}.created_at)",
+        storage.COMPACT: "json_object('id', {row}.id, 'title', {row}.title, 'location', {row}.location,"
+                         f" 'price_per_day', {storage.price_sql('{row}.price_per_day')}, 'host_name', {{row}}.host_name,"
+                         " 'created_at', {row}.created_at)",
+    },
+    "Bookings": {
+        storage.TEXT: "json_object('id', {row}.id, 'listing_id', {row}.listing_id, 'customer_name', {row}.customer_name,"
+                      " 'start_date', {row}.start_date, 'end_date', {row}.end_date, 'status', {row}.status,"
+                      " 'created_at', {row}.created_at, 'total', {row}.total)",
+        storage.COMPACT: "json_object('id', {row}.id, 'listing_id', {row}.listing_id, 'customer_name', {row}.customer_name,"
+                         f" 'start_date', {storage.date_sql('{row}.start_date')}, 'end_date', {storage.date_sql('{row}.end_date')},"
+                         " 'status', {row}.status, 'created_at', {row}.created_at,"
+                         f" 'total', {storage.price_sql('{row}.total')})",
+    },
+}
+
+COLUMNS = {
+    "Listings": ("title", "location", "price_per_day", "host_name"),
+    "Bookings": ("listing_id", "customer_name", "start_date", "end_date", "status", "total"),
+}
+
+TRIGGERS = [f"{table.lower()}_changes_{suffix}" for table in COLUMNS for suffix in ("ai", "au", "ad")]
+
+
+def _log(table, operation, row, fmt):
+    data = ROW_JSON[table][fmt].format(row=row)
+    return (f"INSERT INTO ChangeLog (table_name, row_id, operation, data)"
+            f" VALUES ('{table}', {row}.id, '{operation}', {data});")
+
+
+def schema_statements(fmt):
+    """The log and cursor tables and the Listings and Bookings triggers for a storage format"""
+    statements = [
+        """
+        CREATE TABLE IF NOT EXISTS ChangeLog (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            data TEXT NOT NULL,
+            changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ChangeConsumers (
+            name TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]
+    for table, columns in COLUMNS.items():
+        prefix = table.lower()
+        changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in columns)
+        statements += [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {prefix}_changes_ai AFTER INSERT ON {table}
+            BEGIN {_log(table, "insert", "NEW", fmt)} END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {prefix}_changes_au AFTER UPDATE ON {table}
+            WHEN {changed}
+            BEGIN {_log(table, "update", "NEW", fmt)} END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {prefix}_changes_ad AFTER DELETE ON {table}
+            BEGIN {_log(table, "delete", "OLD", fmt)} END
+            """,
+        ]
+    return statements
+
+
+SCHEMA_STATEMENTS = schema_statements(storage.TEXT)
+
+_ready = set()
+
+
+def ensure_schema(conn):
+    """Create the change log and its triggers if missing"""
+    key = repository.database_file(conn)
+    if key and key in _ready:
+        return
+    # The triggers log these columns; SQLite would only reject them when a trigger fires
+    repository.require_columns(conn, "Listings", ("created_at",))
+    repository.require_columns(conn, "Bookings", ("created_at", "total"))
+    # Join a caller's open transaction instead of committing it early
+    owns_transaction = not conn.in_transaction
+    for statement in schema_statements(storage.storage_format(conn)):
+        conn.execute(statement)
+    if owns_transaction:
+        conn.commit()
+        _ready.add(key)
+
+
+def drop_triggers(conn):
+    """Drop the logging triggers, e.g. before a storage conversion; ensure_schema() recreates them"""
+    for name in TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.commit()
+    _ready.discard(repository.database_file(conn))
+
+
+def head(conn):
+    """The last sequence number handed out (0 for an empty log)"""
+    ensure_schema(conn)
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'ChangeLog'").fetchone()
+    return row[0] if row else 0
+
+
+def read(conn, after=0, limit=None):
+    """Return up to `limit` Changes with seq > after, in seq order"""
+    ensure_schema(conn)
+    rows = conn.execute(
+        "SELECT seq, table_name, row_id, operation, data, changed_at FROM ChangeLog WHERE seq > ? ORDER BY seq LIMIT ?",
+        (after, limit or config.CHANGE_BATCH_SIZE),
+    )
+    return [Change(seq, table, row_id, operation, json.loads(data), changed_at)
+            for seq, table, row_id, operation, data, changed_at in rows]
+
+
+def position(conn, consumer):
+    """The committed cursor of a named consumer (0 if it has none)"""
+    ensure_schema(conn)
+    row = conn.execute("SELECT seq FROM ChangeConsumers WHERE name = ?", (consumer,)).fetchone()
+    return row[0] if row else 0
+
+
+def commit(conn, consumer, seq):
+    """Record that `consumer` has processed every change up to `seq`; cursors never move back"""
+    ensure_schema(conn)
+    with repository.write_transaction(conn):
+        conn.execute("""
+            INSERT INTO ChangeConsumers (name, seq) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET seq = max(seq, excluded.seq), updated_at = CURRENT_TIMESTAMP
+        """, (consumer, seq))
+
+
+def tail(database=None, after=None, consumer=None, batch_size=None, follow=False, poll=None):
+    """Yield lists of Changes after a cursor until the log is drained (or forever with follow=True)
+
+    Starts after `after`, else after the consumer's committed cursor. With a
+    consumer, each batch is committed when the next one is requested, so a
+    crash while processing a batch delivers it again on restart.
+    """
+    poll = config.CHANGE_POLL_INTERVAL if poll is None else poll
+    with repository.connection(database) as conn:
+        cursor = after if after is not None else position(conn, consumer) if consumer else 0
+        while True:
+            batch = read(conn, cursor, batch_size)
+            if not batch:
+                if not follow:
+                    return
+                time.sleep(poll)
+                continue
+            yield batch
+            cursor = batch[-1].seq
+            if consumer:
+                commit(conn, consumer, cursor)
+
+
+def mark_archived(conn, after):
+    """Relabel the Bookings deletes logged after seq `after` as 'archive' (see archive.py)"""
+    ensure_schema(conn)
+    conn.execute("UPDATE ChangeLog SET operation = 'archive'"
+                 " WHERE seq > ? AND table_name = 'Bookings' AND operation = 'delete'", (after,))
+
+
+def prune(conn, before=None):
+    """Delete the entries up to `before`, by default those every named consumer has passed; return the count"""
+    ensure_schema(conn)
+    with repository.write_transaction(conn):
+        if before is None:
+            before = conn.execute("SELECT MIN(seq) FROM ChangeConsumers").fetchone()[0]
+            if before is None:
+                return 0
+        return conn.execute("DELETE FROM ChangeLog WHERE seq <= ?", (before,)).rowcount
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print the change log of Listings and Bookings as JSON lines")
+    parser.add_argument("--database", default=config.DATABASE_NAME)
+    parser.add_argument("--after", type=int, help="start after this sequence number")
+    parser.add_argument("--consumer", help="start after, and commit, this named consumer's cursor")
+    parser.add_argument("--batch-size", type=int, default=config.CHANGE_BATCH_SIZE)
+    parser.add_argument("--follow", action="store_true", help="keep polling for new changes")
+    parser.add_argument("--prune", action="store_true", help="delete the entries every consumer has processed and exit")
+    args = parser.parse_args(argv)
+
+    if args.prune:
+        with repository.connection(args.database) as conn:
+            print(f"✓ Pruned {prune(conn):,} change(s)")
+        return 0
+    try:
+        for batch in tail(args.database, args.after, args.consumer, args.batch_size, args.follow):
+            for change in batch:
+                print(json.dumps(change._asdict()))
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
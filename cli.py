@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Non-interactive command mode for House Rental CLI
+
+Runs one operation, or a file of operations, in a single process and a single
+transaction, and prints the result as a table, JSON or CSV.
+
+Usage:
+    python main.py listings add --title "Loft" --location "Nairobi, CBD" --price 75 --host "Ann"
+    python main.py listings search nairobi apart --max-price 100 --format json
+    python main.py bookings quote 3 2025-03-01 2025-03-05
+    python main.py bookings create 3 "Jane Doe" 2025-03-01 2025-03-05
+    python main.py bookings approve 12 13 14
+    python main.py bookings approve-pending --listing 3 --from 2025-03-01 --to 2025-03-31 --policy highest_value
+    python main.py availability 2025-03-01 2025-03-05 --format csv
+    python main.py occupancy 2025-03-01 2025-03-31 --nights 5
+    python main.py report revenue 2025-01-01 2025-12-31 --by month city
+    python main.py earnings
+    python main.py batch operations.txt    # one command per line, '-' reads stdin
+    python main.py --profile profile.json earnings   # see profiling.py
+    python main.py --snapshot report status 2024-01-01 2025-12-31   # see snapshot.py
+
+Startup is kept short for scripts that call this many times: NumPy (reports)
+and tabulate (table output) are only imported by the commands that use them.
+
+With --snapshot, report commands (occupancy, report, earnings) read a
+consistent copy of the database taken once for the run, so long reports never
+hold a read transaction on the live file; other commands are unaffected.
+
+With SHARDS set in config.py and no --database, a command runs on the shards
+it touches (see sharding.py): writes on the shard of their listing or
+booking ids, reads on every shard in parallel with the rows merged in the
+order one database would return them. `report` and batch mode need a single
+database: run them per shard with --database.
+
+In batch mode every line is a command as it would be typed after
+`python main.py`; blank lines and lines starting with '#' are skipped. If any
+line fails, the whole batch is rolled back.
+
+Only runs containing a write take the write lock (BEGIN IMMEDIATE); reads
+share one deferred transaction and never wait for writers.
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import shlex
+import sqlite3
+import sys
+from collections import namedtuple
+import repository
+import profiling
+import availability
+import earnings
+import services
+import pagination
+import migrations
+import sharding
+import changes
+from services import ServiceError
+from config import DATABASE_NAME, TABLE_FORMAT, REPORT_DIMENSIONS, REPORT_METRICS, APPROVAL_POLICIES
+
+FORMATS = ["table", "json", "csv"]
+
+Result = namedtuple("Result", ["headers", "rows", "money"])
+
+LISTING_HEADERS = ["id", "title", "location", "price_per_day", "host_name"]
+BOOKING_HEADERS = ["id", "listing", "customer_name", "start_date", "end_date", "status"]
+
+
+def _listings_add(conn, args):
+    listing_id = services.add_listing(conn, args.title, args.location, args.price, args.host)
+    return Result(["id"], [(listing_id,)], ())
+
+
+def _listings_list(conn, args):
+    return Result(LISTING_HEADERS, services.iter_listings(conn), (3,))
+
+
+def _listings_search(conn, args):
+    rows = services.search_listings(conn, " ".join(args.text), args.min_price, args.max_price, args.limit,
+                                    args.location, args.host, args.free_from, args.free_to)
+    return Result(LISTING_HEADERS, rows, (3,))
+
+
+def _bookings_list(conn, args):
+    return Result(BOOKING_HEADERS, services.iter_bookings(conn), ())
+
+
+def _bookings_quote(conn, args):
+    quote = services.quote_booking(conn, args.listing_id, args.start, args.end)
+    return Result(list(quote._fields), [quote], (4, 5, 6))
+
+
+def _bookings_create(conn, args):
+    booking_id = services.create_booking(conn, args.listing_id, args.customer, args.start, args.end)
+    return Result(["id", "status"], [(booking_id, "Pending")], ())
+
+
+def _bookings_set_status(status):
+    def run(conn, args):
+        for booking_id in args.booking_ids:
+            services.update_booking_status(conn, booking_id, status)
+        return Result(["id", "status"], [(booking_id, status) for booking_id in args.booking_ids], ())
+    return run
+
+
+def _bookings_approve_pending(conn, args):
+    rows = services.approve_pending(conn, args.listing, args.start, args.end, args.policy, args.dry_run)
+    return Result(["id", "listing_id", "start_date", "end_date", "status"], rows, ())
+
+
+def _bookings_cancel(conn, args):
+    for booking_id in args.booking_ids:
+        services.cancel_booking(conn, booking_id)
+    return Result(["id", "status"], [(booking_id, "Cancelled") for booking_id in args.booking_ids], ())
+
+
+def _availability(conn, args):
+    rows = services.available_listings(conn, args.start, args.end)
+    return Result(["id", "title", "location", "price_per_day"], rows, (3,))
+
+
+def _occupancy(conn, args):
+    rows = services.occupancy_report(conn, args.start, args.end, args.nights)
+    return Result(["id", "title", "location", "booked_nights", "occupancy_pct", "next_free_start"], rows, ())
+
+
+def _report(conn, args):
+    by = tuple(args.by)
+    if args.kind == "status":
+        rows = services.status_report(conn, args.start, args.end, by)
+        return Result(list(by) + ["approved_nights", "pending_nights", "rejected_nights", "pending_pct", "rejected_pct"], rows, ())
+    rows = services.revenue_report(conn, args.start, args.end, by, args.top, args.metric)
+    return Result(list(by) + ["booked_nights", "occupancy_pct", "revenue", "adr"], rows, (len(by) + 2, len(by) + 3))
+
+
+def _earnings(conn, args):
+    return Result(["id", "title", "host_name", "earnings"], services.earnings_report(conn), (3,))
+
+
+def _by_location(shard_map, args):
+    return {shard_map.for_listing(args.location, args.host): args}
+
+
+def _by_listing_id(shard_map, args):
+    return {shard_map.for_id(args.listing_id): args}
+
+
+def _by_booking_ids(shard_map, args):
+    """One copy of args per shard, holding that shard's booking ids"""
+    groups = {}
+    for booking_id in args.booking_ids:
+        groups.setdefault(shard_map.for_id(booking_id), []).append(booking_id)
+    return {index: argparse.Namespace(**dict(vars(args), booking_ids=ids)) for index, ids in groups.items()}
+
+
+def _by_listing_option(shard_map, args):
+    if args.listing is None:
+        return {index: args for index in range(len(shard_map))}
+    return {shard_map.for_id(args.listing): args}
+
+
+def _merge_by_id(parts, args):
+    return sharding.gather(parts, key=lambda row: row[0])
+
+
+def _merge_search(parts, args):
+    if args.text:
+        # bm25 scores are relative to each shard's index, so alternate between shards
+        return sharding.gather(parts, limit=args.limit, interleave=True)
+    return sharding.gather(parts, key=lambda row: (row[3], row[0]), limit=args.limit)
+
+
+def _merge_earnings(parts, args):
+    return sharding.gather(parts, key=lambda row: row[3] or 0, reverse=True)
+
+
+def build_parser(batch=True):
+    """Build the argparse parser; batch=False leaves out the batch command"""
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--format", choices=FORMATS, default=argparse.SUPPRESS, help="output format (default: table)")
+
+    parser = argparse.ArgumentParser(prog="main.py", description="House Rental CLI command mode", parents=[common])
+    parser.add_argument("--database", help="database file (default: config.DATABASE_NAME)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile operations and SQL; write the summary to FILE (.json for JSON, '-' for stderr)")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="run report commands on a consistent snapshot instead of the live database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    listings = commands.add_parser("listings", help="add, list or search listings").add_subparsers(dest="action", required=True)
+    cmd = listings.add_parser("add", parents=[common])
+    cmd.add_argument("--title", required=True)
+    cmd.add_argument("--location", required=True)
+    cmd.add_argument("--price", type=float, required=True)
+    cmd.add_argument("--host", required=True)
+    cmd.set_defaults(run=_listings_add, route=_by_location, writes=True)
+    listings.add_parser("list", parents=[common]).set_defaults(run=_listings_list, merge=_merge_by_id)
+    cmd = listings.add_parser("search", parents=[common])
+    cmd.add_argument("text", nargs="*", help="words to match in title, location or host (prefixes allowed)")
+    cmd.add_argument("--limit", type=int)
+    cmd.add_argument("--min-price", type=float)
+    cmd.add_argument("--max-price", type=float)
+    cmd.add_argument("--location", help="location prefix, e.g. 'Nairobi'")
+    cmd.add_argument("--host", help="exact host name")
+    cmd.add_argument("--free-from", help="only listings free from this date (YYYY-MM-DD)")
+    cmd.add_argument("--free-to", help="... up to and including this date")
+    cmd.set_defaults(run=_listings_search, merge=_merge_search)
+
+    bookings = commands.add_parser("bookings", help="quote, create, approve, reject or cancel bookings").add_subparsers(dest="action", required=True)
+    bookings.add_parser("list", parents=[common]).set_defaults(run=_bookings_list, merge=_merge_by_id)
+    cmd = bookings.add_parser("quote", parents=[common], help="price a stay with seasonal rates and length-of-stay discounts")
+    cmd.add_argument("listing_id", type=int)
+    cmd.add_argument("start")
+    cmd.add_argument("end")
+    cmd.set_defaults(run=_bookings_quote, route=_by_listing_id)
+    cmd = bookings.add_parser("create", parents=[common])
+    cmd.add_argument("listing_id", type=int)
+    cmd.add_argument("customer")
+    cmd.add_argument("start")
+    cmd.add_argument("end")
+    cmd.set_defaults(run=_bookings_create, route=_by_listing_id, writes=True)
+    for action, run in [("approve", _bookings_set_status("Approved")),
+                        ("reject", _bookings_set_status("Rejected")),
+                        ("cancel", _bookings_cancel)]:
+        cmd = bookings.add_parser(action, parents=[common])
+        cmd.add_argument("booking_ids", type=int, nargs="+")
+        cmd.set_defaults(run=run, route=_by_booking_ids, writes=True)
+    cmd = bookings.add_parser("approve-pending", parents=[common],
+                              help="approve Pending bookings in bulk, rejecting the ones that conflict")
+    cmd.add_argument("--listing", type=int, help="only this listing's bookings")
+    cmd.add_argument("--from", dest="start", help="only bookings overlapping this date (YYYY-MM-DD) ...")
+    cmd.add_argument("--to", dest="end", help="... up to and including this date")
+    cmd.add_argument("--policy", choices=APPROVAL_POLICIES, default="first_come", help="which booking wins a conflict")
+    cmd.add_argument("--dry-run", action="store_true", help="show the decisions without applying them")
+    cmd.set_defaults(run=_bookings_approve_pending, route=_by_listing_option, writes=True)
+
+    cmd = commands.add_parser("availability", parents=[common], help="listings free for a date range")
+    cmd.add_argument("start")
+    cmd.add_argument("end")
+    cmd.set_defaults(run=_availability, merge=_merge_by_id)
+
+    cmd = commands.add_parser("occupancy", parents=[common], help="booked nights and next free window per listing")
+    cmd.add_argument("start")
+    cmd.add_argument("end")
+    cmd.add_argument("--nights", type=int, default=1, help="length of the free window to look for")
+    cmd.set_defaults(run=_occupancy, report=True, merge=_merge_by_id)
+
+    cmd = commands.add_parser("report", parents=[common], help="revenue/occupancy or booking status analytics for a date window")
+    cmd.add_argument("kind", choices=["revenue", "status"])
+    cmd.add_argument("start")
+    cmd.add_argument("end")
+    cmd.add_argument("--by", nargs="*", default=["month"], choices=REPORT_DIMENSIONS, help="grouping (default: month)")
+    cmd.add_argument("--top", type=int, help="only the N best groups of a single --by dimension")
+    cmd.add_argument("--metric", choices=REPORT_METRICS, default="revenue", help="ranking for --top")
+    cmd.set_defaults(run=_report, report=True)
+
+    commands.add_parser("earnings", parents=[common], help="earnings per listing").set_defaults(run=_earnings, report=True, merge=_merge_earnings)
+
+    if batch:
+        cmd = commands.add_parser("batch", parents=[common], help="run a file of commands in one transaction")
+        cmd.add_argument("file", help="command file, or '-' for stdin")
+    return parser
+
+
+def render(result, fmt, out=None):
+    """Write a Result to `out` as a table, JSON array or CSV
+
+    Rows may be a lazy iterator; they are written as they are produced.
+    Returns False if the reader closed the pipe (e.g. `main.py ... | head`).
+    """
+    out = out or sys.stdout
+    try:
+        if fmt == "json":
+            out.write("[")
+            for i, row in enumerate(result.rows):
+                out.write((", " if i else "") + json.dumps(dict(zip(result.headers, row))))
+            out.write("]\n")
+        elif fmt == "csv":
+            writer = csv.writer(out)
+            writer.writerow(result.headers)
+            writer.writerows(result.rows)
+        elif not pagination.stream_table(result.rows, result.headers, out, result.money):
+            from tabulate import tabulate
+            out.write(tabulate([], headers=result.headers, tablefmt=TABLE_FORMAT) + "\n")
+        out.flush()
+    except BrokenPipeError:
+        if out is sys.stdout:
+            # Send what is still buffered to devnull so the flush at exit does not fail again
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return False
+    return True
+
+
+def _transaction(conn, operations):
+    """BEGIN IMMEDIATE if any operation writes, otherwise a deferred read transaction"""
+    if any(getattr(op, "writes", False) and not getattr(op, "dry_run", False) for op in operations):
+        return repository.write_transaction(conn)
+    return repository.read_transaction(conn)
+
+
+def _read_batch(path):
+    handle = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for number, line in enumerate(handle, start=1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield number, line
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def _run_on_shard(conn, op):
+    """Run one command on one shard in its own transaction; rows are read before it ends"""
+    migrations.require_current(conn)
+    migrations.mark_ready(conn)
+    availability.ensure_schema(conn)
+    earnings.ensure_schema(conn)
+    changes.ensure_schema(conn)
+    with _transaction(conn, [op]):
+        result = op.run(conn, op)
+        return result._replace(rows=list(result.rows))
+
+
+def run_sharded(args, fmt):
+    """Run a single command across the configured shards and render the merged result"""
+    if args.command in ("batch", "report"):
+        print(f"Error: '{args.command}' needs a single database; pass --database with one shard's file.", file=sys.stderr)
+        return 1
+    shard_map = sharding.current()
+    missing = [database for database in shard_map.databases if not os.path.exists(database)]
+    if missing:
+        print(f"Shard {missing[0]} not found. Please run 'python sharding.py --init' first.", file=sys.stderr)
+        return 1
+
+    connect = repository.connection
+    if args.snapshot and getattr(args, "report", False):
+        import snapshot
+        connect = snapshot.reporting
+    try:
+        with profiling.operation(" ".join(filter(None, (args.command, getattr(args, "action", None))))):
+            routed = args.route(shard_map, args) if getattr(args, "route", None) else \
+                {index: args for index in range(len(shard_map))}
+            jobs = [(shard_map.databases[index], lambda conn, op=op: _run_on_shard(conn, op))
+                    for index, op in sorted(routed.items())]
+            parts = sharding.run_parallel(jobs, connect)
+    except (ServiceError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    merge = getattr(args, "merge", None)
+    rows = merge([part.rows for part in parts], args) if merge else sharding.gather(part.rows for part in parts)
+    render(parts[0]._replace(rows=rows), fmt)
+    return 0
+
+
+def main(argv=None):
+    """Entry point for `python main.py <command> ...`; returns the exit code"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    fmt = getattr(args, "format", "table")
+    if args.profile:
+        profiling.enable(args.profile)
+    if sharding.enabled() and not args.database:
+        return run_sharded(args, fmt)
+
+    if args.command == "batch":
+        line_parser = build_parser(batch=False)
+        operations = [(number, line, line_parser.parse_args(shlex.split(line))) for number, line in _read_batch(args.file)]
+    else:
+        operations = [(0, None, args)]
+
+    database = args.database or DATABASE_NAME
+    if not os.path.exists(database):
+        print(f"Database {database} not found. Please run 'python database.py' first.", file=sys.stderr)
+        return 1
+
+    results = []
+    with repository.connection(database) as conn, contextlib.ExitStack() as stack:
+        reports = None
+        if args.snapshot and any(getattr(op, "report", False) for _, _, op in operations):
+            import snapshot
+            reports = stack.enter_context(snapshot.reporting(database))
+        # Create derived schema up front so it never commits mid-batch; on an
+        # up-to-date database this is one sqlite_master lookup. Older databases
+        # must be migrated first: the derived triggers use the current columns.
+        try:
+            migrations.require_current(conn)
+        except sqlite3.Error as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        migrations.mark_ready(conn)
+        availability.ensure_schema(conn)
+        earnings.ensure_schema(conn)
+        changes.ensure_schema(conn)
+        number, line = 0, None
+        try:
+            with _transaction(conn, [op for _, _, op in operations]):
+                for number, line, op in operations:
+                    with profiling.operation(" ".join(filter(None, (op.command, getattr(op, "action", None))))):
+                        result = op.run(reports if reports and getattr(op, "report", False) else conn, op)
+                    if len(operations) > 1:
+                        # Later lines may write, so snapshot rows at this point of the batch
+                        result = result._replace(rows=list(result.rows))
+                    results.append((op, result))
+        except (ServiceError, sqlite3.Error) as e:
+            where = f"line {number} ({line}): " if line else ""
+            print(f"Error: {where}{e}", file=sys.stderr)
+            return 1
+
+        for op, result in results:
+            if not render(result, getattr(op, "format", fmt)):
+                break
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
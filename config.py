@@ -12,8 +12,83 @@ DATE_FORMAT = "%Y-%m-%d"
 # Valid booking statuses
 VALID_STATUSES = ["Pending", "Approved", "Rejected"]
 
+# Report groupings and ranking metrics (see analytics.py)
+REPORT_DIMENSIONS = ("month", "listing", "host", "city")
+REPORT_METRICS = ("booked_nights", "occupancy_pct", "revenue", "adr")
+
+# Which Pending booking wins a conflict in a bulk approval (see approvals.py)
+APPROVAL_POLICIES = ("first_come", "highest_value", "max_bookings")
+
 # Table formatting
 TABLE_FORMAT = "grid"
 
 # Currency symbol
-CURRENCY_SYMBOL = "$"
\ No newline at end of file
+CURRENCY_SYMBOL = "$"
+
+# Rows per page when browsing listings and bookings
+PAGE_SIZE = 20
+
+# Connection pool configuration
+POOL_SIZE = 4
+BUSY_TIMEOUT = 5.0
+WRITE_RETRIES = 5
+STATEMENT_CACHE_SIZE = 256
+
+# PRAGMAs applied to every pooled connection
+CONNECTION_PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("foreign_keys", "ON"),
+    ("mmap_size", 268435456),
+    ("cache_size", -16000),
+]
+
+# Online schema migrations (see migrations.py)
+MIGRATION_BATCH_SIZE = 5000
+MIGRATION_PAUSE = 0.01
+ANALYZE_LIMIT = 1000
+
+# Read-through result cache (see resultcache.py): entries kept, and seconds an entry
+# may be served (None: until the data changes)
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_TTL = None
+
+# Snapshot reporting (see snapshot.py): when REPORT_REPLICA_LAG is a number of seconds,
+# the menu's earnings report and the API's reports read a replica refreshed that often.
+# Snapshot files go to SNAPSHOT_DIR (None: the temp directory).
+REPORT_REPLICA_LAG = None
+SNAPSHOT_DIR = None
+
+# Sharding (see sharding.py): (name, database file) pairs, the first being the default
+# shard. With SHARD_KEY "city" a listing goes to the shard named after the city part of
+# its location (the default shard otherwise); with "host" to crc32(host_name) % shards.
+# None keeps everything in DATABASE_NAME.
+#   SHARDS = [("default", "house_rental.db"), ("Nairobi", "house_rental.nairobi.db"),
+#             ("Mombasa", "house_rental.mombasa.db")]
+SHARDS = None
+SHARD_KEY = "city"
+# Shard n allocates listing and booking ids from n << SHARD_ID_BITS
+SHARD_ID_BITS = 40
+SHARD_WORKERS = 8
+
+# Change feed (see changes.py): changes per batch, and seconds between polls when following
+CHANGE_BATCH_SIZE = 500
+CHANGE_POLL_INTERVAL = 1.0
+
+# Quote engine (see pricing.py): years after this one whose rate calendars precompute() stores
+PRICING_YEARS_AHEAD = 2
+
+# Bookings moved per transaction by archive.py
+ARCHIVE_BATCH_SIZE = 5000
+
+# Free pages released per transaction by `debug.py --vacuum`
+VACUUM_STEP = 1000
+
+# Command-mode startup budget; test_app.py reports the `python -X importtime` total against it
+STARTUP_BUDGET_MS = 50
+
+# JSON API server (see api.py)
+API_HOST = "127.0.0.1"
+API_PORT = 8080
+API_READERS = 4
+API_MAX_BODY = 1048576
@@ -8,42 +8,24 @@ It creates the necessary tables with proper constraints and populates them with
 
 import sqlite3
 import os
+import migrations
 from config import DATABASE_NAME
 
-def create_tables_with_data():
+def create_tables_with_data(database=DATABASE_NAME, sample_data=True):
+    conn = None
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
+        conn = sqlite3.connect(database)
         c = conn.cursor()
         
         # Enable foreign key constraints
         c.execute("PRAGMA foreign_keys = ON")
 
-        # Create Listings table with constraints
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS Listings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL CHECK(length(title) > 0),
-            location TEXT NOT NULL CHECK(length(location) > 0),
-            price_per_day REAL NOT NULL CHECK(price_per_day > 0),
-            host_name TEXT NOT NULL CHECK(length(host_name) > 0),
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-        """)
+        # Let `debug.py --vacuum` shrink the file online (only applies before the first table)
+        c.execute("PRAGMA auto_vacuum = INCREMENTAL")
 
-        # Create Bookings table with constraints
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS Bookings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            listing_id INTEGER NOT NULL,
-            customer_name TEXT NOT NULL CHECK(length(customer_name) > 0),
-            start_date TEXT NOT NULL,
-            end_date TEXT NOT NULL,
-            status TEXT NOT NULL DEFAULT 'Pending' CHECK(status IN ('Pending', 'Approved', 'Rejected')),
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(listing_id) REFERENCES Listings(id) ON DELETE CASCADE,
-            CHECK(start_date <= end_date)
-        )
-        """)
+        # Create the tables with their constraints (declared in migrations.TABLES)
+        c.execute(migrations.create_table_sql("Listings"))
+        c.execute(migrations.create_table_sql("Bookings"))
 
         # Pre-populate Listings with realistic locations in Kenya
         listings = [
@@ -59,11 +41,11 @@ def create_tables_with_data():
 
         # Insert listings if table is empty
         c.execute("SELECT COUNT(*) FROM Listings")
-        if c.fetchone()[0] == 0:
+        if c.fetchone()[0] > 0:
+            print("✓ Listings table already contains data.")
+        elif sample_data:
             c.executemany("INSERT INTO Listings (title, location, price_per_day, host_name) VALUES (?, ?, ?, ?)", listings)
             print("✓ Sample listings added successfully!")
-        else:
-            print("✓ Listings table already contains data.")
 
         # Pre-populate Bookings with some sample bookings
         bookings = [
@@ -76,13 +58,20 @@ def create_tables_with_data():
 
         # Insert bookings if table is empty
         c.execute("SELECT COUNT(*) FROM Bookings")
-        if c.fetchone()[0] == 0:
+        if c.fetchone()[0] > 0:
+            print("✓ Bookings table already contains data.")
+        elif sample_data:
             c.executemany("INSERT INTO Bookings (listing_id, customer_name, start_date, end_date, status) VALUES (?, ?, ?, ?, ?)", bookings)
             print("✓ Sample bookings added successfully!")
-        else:
-            print("✓ Bookings table already contains data.")
 
         conn.commit()
+        conn.close()
+        conn = None
+
+        # Bring older databases up to the current schema, then add the derived
+        # indexes, R*Tree, earnings aggregates and FTS index
+        migrations.migrate(database, progress=print)
+
         print("\n🎉 Database setup completed successfully!")
         print("You can now run 'python main.py' to start the House Rental CLI.")
         
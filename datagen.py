@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for House Rental CLI
+
+Produces reproducible listings and bookings with realistic shapes: prices are
+log-normal around a per-city median, a few listings get most of the demand,
+stays are mostly short with a long tail, start dates peak in July/August and
+December, and bookings of one listing never overlap. Output is a stream of
+dict records that bulk.import_records can load directly.
+
+Usage:
+    python datagen.py FILE.db --bookings 100000 [--listings 10000] [--seed 42]
+"""
+
+import argparse
+import itertools
+import math
+import os
+import random
+import sys
+from datetime import date, timedelta
+import database
+import repository
+import bulk
+
+CITIES = {
+    # city: (median price per day, neighbourhoods)
+    "Nairobi": (95, ["Westlands", "Karen", "Kilimani", "Lavington", "Ngong Hills", "CBD", "Runda"]),
+    "Mombasa": (110, ["Nyali", "Bamburi", "Shanzu", "Tudor", "Old Town"]),
+    "Diani Beach": (140, ["Kwale", "Galu", "Ukunda"]),
+    "Kisumu": (60, ["Milimani", "Riat Hills", "Dunga"]),
+    "Naivasha": (80, ["Lake Naivasha", "Kongoni", "Hell's Gate"]),
+    "Malindi": (100, ["Casuarina", "Silversands", "Watamu"]),
+    "Nakuru": (65, ["Milimani", "Section 58", "Lanet"]),
+    "Nanyuki": (85, ["Mount Kenya", "Likii", "Timau"]),
+}
+ADJECTIVES = ["Modern", "Cozy", "Luxury", "Seaside", "Urban", "Rustic", "Sunny", "Quiet", "Spacious", "Charming"]
+KINDS = ["Apartment", "Villa", "Bungalow", "Studio", "Cottage", "Retreat", "Loft", "Cabin", "Townhouse"]
+FIRST_NAMES = ["Alice", "John", "Mary", "Peter", "Grace", "James", "Susan", "David", "Faith", "Brian",
+               "Mercy", "Kevin", "Joy", "Daniel", "Esther", "Samuel", "Ann", "Paul", "Ruth", "Moses"]
+LAST_NAMES = ["Mwangi", "Otieno", "Wanjiku", "Oduor", "Njeri", "Kariuki", "Karanja", "Mutua", "Achieng",
+              "Kamau", "Wambui", "Ochieng", "Njoroge", "Chebet", "Kiprop", "Onyango", "Muthoni", "Barasa"]
+
+# Relative booking demand per calendar month (peaks in July/August and December)
+MONTH_WEIGHTS = [0.9, 0.8, 0.8, 0.9, 0.8, 0.9, 1.3, 1.4, 1.0, 0.9, 1.0, 1.6]
+STATUS_WEIGHTS = {"Approved": 0.65, "Pending": 0.2, "Rejected": 0.15}
+
+
+def _name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def generate_listings(count, seed=42):
+    """Yield `count` listing records"""
+    rng = random.Random(seed)
+    cities = list(CITIES)
+    for _ in range(count):
+        city = rng.choice(cities)
+        median, areas = CITIES[city]
+        price = round(max(15.0, rng.lognormvariate(math.log(median), 0.35)), 2)
+        yield {
+            "title": f"{rng.choice(ADJECTIVES)} {rng.choice(KINDS)}",
+            "location": f"{city}, {rng.choice(areas)}",
+            "price_per_day": price,
+            "host_name": _name(rng),
+        }
+
+
+def generate_bookings(count, listing_ids, start=date(2024, 1, 1), days=730, seed=42):
+    """Yield `count` booking records spread over `days` from `start`
+
+    Listing popularity follows a capped Pareto curve and start dates follow
+    MONTH_WEIGHTS. Each listing keeps a per-day occupancy map, and a stay that
+    would collide is moved to the next gap long enough to hold it, so no two
+    bookings of a listing overlap. Stays that no longer fit in the window are
+    placed after it.
+    """
+    rng = random.Random(seed + 1)
+    listing_ids = list(listing_ids)
+    popularity = list(itertools.accumulate(min(rng.paretovariate(2.0), 10.0) for _ in listing_ids))
+    months = list(itertools.accumulate(MONTH_WEIGHTS))
+    statuses = list(STATUS_WEIGHTS)
+    status_weights = list(STATUS_WEIGHTS.values())
+    occupied = {}
+
+    for _ in range(count):
+        listing_id = rng.choices(listing_ids, cum_weights=popularity)[0]
+        nights = min(1 + int(rng.expovariate(1 / 3.5)), 28)
+        month = rng.choices(range(12), cum_weights=months)[0]
+        year = rng.randrange(max(1, days // 365))
+        offset = (year * 365 + int(365 * (month + rng.random()) / 12)) % days
+
+        calendar = occupied.setdefault(listing_id, bytearray(days))
+        free = calendar.find(bytes(nights), offset)
+        if free == -1:
+            free = calendar.find(bytes(nights))
+        if free == -1 or free + nights > len(calendar):
+            free = len(calendar)
+            calendar.extend(bytes(nights))
+        calendar[free:free + nights] = b"\x01" * nights
+
+        begin = start + timedelta(days=free)
+        yield {
+            "listing_id": listing_id,
+            "customer_name": _name(rng),
+            "start_date": begin.isoformat(),
+            "end_date": (begin + timedelta(days=nights - 1)).isoformat(),
+            "status": rng.choices(statuses, weights=status_weights)[0],
+        }
+
+
+def populate(conn, listings, bookings, seed=42, progress=None):
+    """Load generated listings and bookings into an open database"""
+    bulk.import_records(conn, "listings", generate_listings(listings, seed), progress=progress)
+    listing_ids = [row[0] for row in conn.execute("SELECT id FROM Listings")]
+    bulk.import_records(conn, "bookings", generate_bookings(bookings, listing_ids, seed=seed), progress=progress)
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def create_database(path, listings, bookings, seed=42, progress=None):
+    """Create a fresh database file at `path` filled with synthetic data"""
+    if os.path.exists(path):
+        os.remove(path)
+    database.create_tables_with_data(path, sample_data=False)
+    with repository.connection(path) as conn:
+        populate(conn, listings, bookings, seed, progress)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic House Rental database")
+    parser.add_argument("path", help="database file to create (overwritten)")
+    parser.add_argument("--bookings", type=int, default=10000)
+    parser.add_argument("--listings", type=int, help="default: bookings / 10")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    listings = args.listings or max(1, args.bookings // 10)
+    create_database(args.path, listings, args.bookings, args.seed, progress=print)
+    print(f"✓ Wrote {listings:,} listings and {args.bookings:,} bookings to {args.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,55 +1,350 @@
 #!/usr/bin/env python3
+"""
+Database inspector and maintenance for House Rental CLI
+
+Without options, prints the schema, row counts and sample rows. --health adds
+a health and performance report:
+
+    storage    storage format, page size and count, freelist pages, auto_vacuum mode, file and WAL size
+    objects    bytes, pages and unused space of every table and index (dbstat)
+    plans      EXPLAIN QUERY PLAN of every statement in repository.STATEMENTS and of
+               common search facets, flagging full scans
+    indexes    which of those queries use each index, and indexes none of them use
+    integrity  overlapping approved bookings, orphaned bookings, foreign key
+               violations and earnings aggregate mismatches
+
+Maintenance actions work on a live database: each step is a short
+transaction, so the app can keep reading and writing meanwhile.
+
+    --analyze          refresh planner statistics (sampling, see config.ANALYZE_LIMIT)
+    --optimize         PRAGMA optimize
+    --checkpoint MODE  checkpoint the WAL (PASSIVE, FULL, RESTART or TRUNCATE)
+    --vacuum PAGES     return up to PAGES free pages to the OS with incremental vacuum
+    --enable-incremental-vacuum
+                       switch an older file to auto_vacuum=INCREMENTAL (runs one full
+                       VACUUM, so it needs the file to itself; new files have it already)
+
+Usage:
+    python debug.py [--database FILE]
+    python debug.py --health
+    python debug.py --analyze --optimize --checkpoint TRUNCATE --vacuum 10000
+"""
+
+import argparse
+import os
+import re
 import sqlite3
-from tabulate import tabulate
-from config import DATABASE_NAME
+import sys
+import time
+import repository
+import earnings
+import facets
+import migrations
+import profiling
+import storage
+from config import DATABASE_NAME, VACUUM_STEP, MIGRATION_PAUSE
+
+AUTO_VACUUM_MODES = {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}
+CHECKPOINT_MODES = ["PASSIVE", "FULL", "RESTART", "TRUNCATE"]
+USES_INDEX = re.compile(r"USING (?:COVERING )?INDEX (\w+)")
+
+# Representative search facet combinations (see facets.build_query)
+FACET_QUERIES = {
+    "facets.text": {"text": "nairobi", "limit": 50},
+    "facets.price_range": {"min_price": 50, "max_price": 100, "limit": 50},
+    "facets.location_price": {"location": "Nairobi", "max_price": 150, "limit": 50},
+    "facets.host": {"host": "Alice Mwangi", "limit": 50},
+    "facets.free_dates": {"location": "Nairobi", "free_from": "2025-01-01", "free_to": "2025-01-05", "limit": 50},
+}
 
-def debug_database():
+
+def debug_database(database=DATABASE_NAME):
     """Debug database structure and data"""
+    from tabulate import tabulate
     try:
-        conn = sqlite3.connect(DATABASE_NAME)
+        conn = sqlite3.connect(database)
         c = conn.cursor()
-        
+
         print("=== DATABASE DEBUG INFO ===\n")
-        
+
         # Show all tables
         c.execute("SELECT name FROM sqlite_master WHERE type='table'")
         tables = c.fetchall()
         print(f"Tables: {[t[0] for t in tables]}\n")
-        
+
         # Show Listings table info
         print("--- LISTINGS TABLE ---")
         c.execute("PRAGMA table_info(Listings)")
         columns = c.fetchall()
         print(tabulate(columns, headers=["ID", "Name", "Type", "NotNull", "Default", "PK"]))
-        
+
         c.execute("SELECT COUNT(*) FROM Listings")
         print(f"Total listings: {c.fetchone()[0]}")
-        
+
         c.execute("SELECT * FROM Listings LIMIT 3")
         sample_listings = c.fetchall()
         if sample_listings:
             print("\nSample listings:")
             print(tabulate(sample_listings, headers=["ID", "Title", "Location", "Price", "Host"]))
-        
+
         # Show Bookings table info
         print("\n--- BOOKINGS TABLE ---")
         c.execute("PRAGMA table_info(Bookings)")
         columns = c.fetchall()
         print(tabulate(columns, headers=["ID", "Name", "Type", "NotNull", "Default", "PK"]))
-        
+
         c.execute("SELECT COUNT(*) FROM Bookings")
         print(f"Total bookings: {c.fetchone()[0]}")
-        
+
         c.execute("SELECT status, COUNT(*) FROM Bookings GROUP BY status")
         status_counts = c.fetchall()
         if status_counts:
             print("\nBooking status counts:")
             print(tabulate(status_counts, headers=["Status", "Count"]))
-        
+
         conn.close()
-        
+
     except sqlite3.Error as e:
         print(f"Database error: {e}")
 
+
+# ---------------------- Health report ----------------------
+def _pragma(conn, name):
+    return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def storage_stats(conn):
+    """Return page, freelist and file size figures for the main database"""
+    path = repository.database_file(conn)
+    page_count = _pragma(conn, "page_count")
+    freelist = _pragma(conn, "freelist_count")
+    wal = path + "-wal"
+    return {
+        "format": storage.detect(conn),
+        "page_size": _pragma(conn, "page_size"),
+        "page_count": page_count,
+        "freelist_count": freelist,
+        "free_pct": round(100 * freelist / page_count, 1) if page_count else 0.0,
+        "auto_vacuum": AUTO_VACUUM_MODES.get(_pragma(conn, "auto_vacuum"), "?"),
+        "journal_mode": _pragma(conn, "journal_mode"),
+        "file_bytes": os.path.getsize(path) if path and os.path.exists(path) else 0,
+        "wal_bytes": os.path.getsize(wal) if path and os.path.exists(wal) else 0,
+    }
+
+
+def object_sizes(conn):
+    """Return (name, type, pages, bytes, unused_pct) per table and index, largest first"""
+    kinds = dict(conn.execute("SELECT name, type FROM sqlite_master"))
+    rows = conn.execute("SELECT name, pageno, pgsize, unused FROM dbstat WHERE aggregate = TRUE").fetchall()
+    sizes = [(name, kinds.get(name, "table"), pages, size, round(100 * unused / size, 1) if size else 0.0)
+             for name, pages, size, unused in rows]
+    return sorted(sizes, key=lambda row: row[3], reverse=True)
+
+
+def _placeholders(sql):
+    """NULL parameters for every placeholder in a statement (plans do not depend on values)"""
+    numbered = [int(n) for n in re.findall(r"\?(\d+)", sql)]
+    return (None,) * (max(numbered) if numbered else sql.count("?"))
+
+
+def known_queries(compact=False):
+    """Return {name: (sql, params)} for the queries the app runs on a database of either storage format"""
+    import occupancy
+    statements = repository.COMPACT_STATEMENTS if compact else repository.STATEMENTS
+    queries = {name: (sql, _placeholders(sql)) for name, sql in statements.items()}
+    queries.update({name: facets.build_query(**spec, compact=compact) for name, spec in FACET_QUERIES.items()})
+    queries["occupancy.spans_in_range"] = (occupancy.SPANS_IN_RANGE, (None, None))
+    return queries
+
+
+def query_plans(conn):
+    """Return (name, plan lines, full scans, indexes used) for every known query"""
+    plans = []
+    for name, (sql, params) in known_queries(storage.is_compact(conn)).items():
+        try:
+            lines = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        except sqlite3.Error as e:
+            lines = [f"error: {e}"]
+        scans = [line for line in lines if profiling.FULL_SCAN.match(line)]
+        indexes = sorted({index for line in lines for index in USES_INDEX.findall(line)})
+        plans.append((name, lines, scans, indexes))
+    return plans
+
+
+def index_usage(conn, plans):
+    """Return (index, table, known queries using it, sqlite_stat1 figures) per index"""
+    used_by = {}
+    for name, _, _, indexes in plans:
+        for index in indexes:
+            used_by.setdefault(index, []).append(name)
+    stats = {}
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        stats = {index: stat for index, stat in conn.execute("SELECT idx, stat FROM sqlite_stat1 WHERE idx IS NOT NULL")}
+    indexes = conn.execute("""
+        SELECT name, tbl_name FROM sqlite_master
+        WHERE type = 'index' AND tbl_name IN ('Listings', 'Bookings')
+        ORDER BY tbl_name, name
+    """).fetchall()
+    return [(index, table, used_by.get(index, []), stats.get(index)) for index, table in indexes]
+
+
+def integrity_issues(conn):
+    """Return {check: rows} for data anomalies; every list is empty on a healthy database"""
+    issues = {
+        "overlapping approved bookings": repository.execute(conn, "booking.approved_overlaps").fetchall(),
+        "orphaned bookings": repository.execute(conn, "booking.orphans").fetchall(),
+        "foreign key violations": conn.execute("PRAGMA foreign_key_check").fetchall(),
+    }
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'ListingEarnings'").fetchone():
+        issues["earnings mismatches"] = earnings.verify(conn)
+    return issues
+
+
+def _names(names, shown=4):
+    if not names:
+        return "-"
+    more = f" (+{len(names) - shown} more)" if len(names) > shown else ""
+    return ", ".join(names[:shown]) + more
+
+
+def _megabytes(size):
+    return f"{size / 1048576:.2f} MiB"
+
+
+def print_health(conn):
+    """Print the full health report"""
+    from tabulate import tabulate
+    figures = storage_stats(conn)
+    print("=== STORAGE ===")
+    print(tabulate([
+        ["Storage format", figures["format"]],
+        ["Page size", figures["page_size"]],
+        ["Pages", figures["page_count"]],
+        ["Free pages", f"{figures['freelist_count']} ({figures['free_pct']}%)"],
+        ["auto_vacuum", figures["auto_vacuum"]],
+        ["Journal mode", figures["journal_mode"]],
+        ["File size", _megabytes(figures["file_bytes"])],
+        ["WAL size", _megabytes(figures["wal_bytes"])],
+    ]))
+    if figures["free_pct"] >= 10:
+        hint = "--vacuum" if figures["auto_vacuum"] == "INCREMENTAL" else "--enable-incremental-vacuum"
+        print(f"⚠ {figures['free_pct']}% of the file is free pages; run debug.py {hint}")
+
+    print("\n=== TABLES AND INDEXES ===")
+    print(tabulate([(name, kind, pages, _megabytes(size), f"{unused}%")
+                    for name, kind, pages, size, unused in object_sizes(conn)],
+                   headers=["Name", "Type", "Pages", "Size", "Unused"]))
+
+    plans = query_plans(conn)
+    print("\n=== QUERY PLANS ===")
+    for name, lines, scans, _ in plans:
+        flag = "  ⚠ full scan" if scans else ""
+        print(f"{name}{flag}")
+        for line in lines:
+            print(f"    {line}")
+
+    print("\n=== INDEX USAGE ===")
+    usage = index_usage(conn, plans)
+    print(tabulate([(index, table, _names(queries), stat or "-") for index, table, queries, stat in usage],
+                   headers=["Index", "Table", "Used by", "sqlite_stat1"]))
+    unused = [index for index, _, queries, _ in usage if not queries and not index.startswith("sqlite_autoindex")]
+    if unused:
+        print(f"⚠ Not used by any known query: {', '.join(unused)}")
+
+    print("\n=== INTEGRITY ===")
+    for check, rows in integrity_issues(conn).items():
+        print(f"{'⚠' if rows else '✓'} {check}: {len(rows)}")
+        for row in rows[:10]:
+            print(f"    {row}")
+
+
+# ---------------------- Maintenance ----------------------
+def optimize(conn):
+    """Run PRAGMA optimize (re-analyzes only tables whose statistics look stale)"""
+    conn.execute("PRAGMA optimize")
+
+
+def checkpoint(conn, mode="PASSIVE"):
+    """Checkpoint the WAL; return (busy, wal_pages, checkpointed_pages)"""
+    mode = mode.upper()
+    if mode not in CHECKPOINT_MODES:
+        raise ValueError(f"Unknown checkpoint mode: {mode}")
+    return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+
+
+def incremental_vacuum(conn, pages, step=None, pause=None):
+    """Release up to `pages` free pages, `step` pages per short write transaction; return pages released
+
+    Requires auto_vacuum=INCREMENTAL (see enable_incremental_vacuum).
+    """
+    if _pragma(conn, "auto_vacuum") != 2:
+        raise ValueError("auto_vacuum is not INCREMENTAL; run with --enable-incremental-vacuum first.")
+    step = step or VACUUM_STEP
+    pause = MIGRATION_PAUSE if pause is None else pause
+    released = 0
+    while released < pages:
+        before = _pragma(conn, "freelist_count")
+        if not before:
+            break
+        with repository.write_transaction(conn):
+            # The pragma frees one page per step, so it must be run to completion
+            conn.execute(f"PRAGMA incremental_vacuum({min(step, pages - released)})").fetchall()
+        freed = before - _pragma(conn, "freelist_count")
+        if freed <= 0:
+            break
+        released += freed
+        time.sleep(pause)
+    return released
+
+
+def enable_incremental_vacuum(conn):
+    """Switch the file to auto_vacuum=INCREMENTAL; the VACUUM this takes rewrites the whole file"""
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and maintain a House Rental database")
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument("--health", action="store_true", help="print the health and performance report")
+    parser.add_argument("--analyze", action="store_true", help="refresh planner statistics")
+    parser.add_argument("--optimize", action="store_true", help="run PRAGMA optimize")
+    parser.add_argument("--checkpoint", choices=CHECKPOINT_MODES, type=str.upper, help="checkpoint the WAL")
+    parser.add_argument("--vacuum", type=int, metavar="PAGES", help="release up to PAGES free pages")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        print(f"Database {args.database} not found. Please run 'python database.py' first.")
+        return 1
+    maintenance = args.analyze or args.optimize or args.checkpoint or args.vacuum or args.enable_incremental_vacuum
+    if not (args.health or maintenance):
+        debug_database(args.database)
+        return 0
+
+    with repository.connection(args.database) as conn:
+        try:
+            if args.enable_incremental_vacuum:
+                enable_incremental_vacuum(conn)
+                print("✓ auto_vacuum is now INCREMENTAL")
+            if args.vacuum:
+                print(f"✓ Released {incremental_vacuum(conn, args.vacuum)} free pages")
+            if args.analyze:
+                migrations.analyze(conn)
+                print("✓ Planner statistics refreshed")
+            if args.optimize:
+                optimize(conn)
+                print("✓ PRAGMA optimize done")
+            if args.checkpoint:
+                busy, wal_pages, done = checkpoint(conn, args.checkpoint)
+                print(f"✓ Checkpoint {args.checkpoint}: {done}/{wal_pages} WAL pages copied" + (" (busy)" if busy else ""))
+            if args.health:
+                print_health(conn)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"Database error: {e}")
+            return 1
+    return 0
+
+
 if __name__ == "__main__":
-    debug_database()
\ No newline at end of file
+    sys.exit(main())
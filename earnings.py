@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Materialized earnings aggregates for House Rental CLI
+
+Approved nights are kept per listing (ListingEarnings) and per listing and
+calendar month (ListingEarningsMonthly) by triggers on Bookings, so the
+earnings report reads one row per listing instead of re-summing every
+approved booking. Bookings carrying the total quoted when they were made
+(see pricing.py) also add it to quoted_cents and their nights to
+quoted_nights; the rest of the nights are priced at read time at
+price_per_day, so the report never re-prices a quoted stay and bookings
+without a total (bulk imports, older rows) follow price changes with no
+update. Monthly buckets keep the same three figures, a quoted total being
+spread over the months by night: night k of an n-night stay is worth
+total * (k + 1) // n - total * k // n cents, so the months add up to the
+total exactly.
+Approved stays moved out by archive.py keep their nights in ArchivedEarnings
+and stay counted in both aggregates. The trigger and rebuild SQL depend on
+the storage format (see storage.py): compact databases count nights by
+subtracting day numbers and turn them back into dates only to find month
+boundaries.
+
+Usage:
+    python earnings.py verify    # compare aggregates against the full query
+    python earnings.py rebuild   # recompute aggregates from Bookings
+"""
+
+import itertools
+import sys
+import repository
+import storage
+from config import TABLE_FORMAT
+
+NIGHTS = {
+    storage.TEXT: "CAST(julianday({row}.end_date) - julianday({row}.start_date) + 1 AS INTEGER)",
+    storage.COMPACT: "({row}.end_date - {row}.start_date + 1)",
+}
+
+# A booking's quoted total in integer cents (NULL without one)
+TOTAL_CENTS = {
+    storage.TEXT: storage.cents_sql("{row}.total"),
+    storage.COMPACT: "{row}.total",
+}
+
+# Added to ListingEarnings, ListingEarningsMonthly and ArchivedEarnings by migration 4
+QUOTED_COLUMNS = ["quoted_nights INTEGER NOT NULL DEFAULT 0", "quoted_cents INTEGER NOT NULL DEFAULT 0"]
+
+
+def _quoted(row, fmt):
+    """SQL for (nights, nights with a quoted total, total cents) of a booking row"""
+    nights = NIGHTS[fmt].format(row=row)
+    return (nights, f"CASE WHEN {row}.total IS NULL THEN 0 ELSE {nights} END",
+            f"COALESCE({TOTAL_CENTS[fmt].format(row=row)}, 0)")
+
+
+# Split a booking into (month, nights, earlier) pieces, prorating across month
+# boundaries; earlier is the number of the stay's nights before the piece.
+# {start} and {end} are the booking's dates as 'YYYY-MM-DD' text.
+MONTH_PIECES = """
+    WITH RECURSIVE months(month_start) AS (
+        SELECT date({start}, 'start of month')
+        UNION ALL
+        SELECT date(month_start, '+1 month') FROM months
+        WHERE date(month_start, '+1 month') <= {end}
+    )
+    SELECT {row}.listing_id AS listing_id, strftime('%Y-%m', month_start) AS month,
+           CAST(julianday(min({end}, date(month_start, '+1 month', '-1 day')))
+                - julianday(max({start}, month_start)) + 1 AS INTEGER) AS nights,
+           CAST(julianday(max({start}, month_start)) - julianday({start}) AS INTEGER) AS earlier
+    FROM months
+"""
+
+
+def _piece_cents(cents, stay_nights):
+    """SQL for the share of `cents` earned by the `nights` of a piece after `earlier` nights (integer division)"""
+    return f"COALESCE({cents} * (earlier + nights) / {stay_nights} - {cents} * earlier / {stay_nights}, 0)"
+
+
+def _dates(row, fmt):
+    """SQL for a booking's start and end dates as 'YYYY-MM-DD' text"""
+    if fmt == storage.COMPACT:
+        return storage.date_sql(f"{row}.start_date"), storage.date_sql(f"{row}.end_date")
+    return f"{row}.start_date", f"{row}.end_date"
+
+
+_ADD_TOTALS = ("approved_nights = approved_nights + excluded.approved_nights,"
+               " quoted_nights = quoted_nights + excluded.quoted_nights,"
+               " quoted_cents = quoted_cents + excluded.quoted_cents")
+
+
+def _apply(row, sign, fmt):
+    """Trigger body statements adding (sign=+1) or removing (sign=-1) a booking"""
+    nights, quoted_nights, quoted_cents = _quoted(row, fmt)
+    start, end = _dates(row, fmt)
+    return f"""
+        INSERT INTO ListingEarnings (listing_id, approved_nights, quoted_nights, quoted_cents)
+        SELECT {row}.listing_id, {sign} * {nights}, {sign} * {quoted_nights}, {sign} * {quoted_cents} WHERE true
+        ON CONFLICT(listing_id) DO UPDATE SET {_ADD_TOTALS};
+        INSERT INTO ListingEarningsMonthly (listing_id, month, approved_nights, quoted_nights, quoted_cents)
+        SELECT listing_id, month, {sign} * nights,
+               {sign} * CASE WHEN {row}.total IS NULL THEN 0 ELSE nights END,
+               {sign} * {_piece_cents(TOTAL_CENTS[fmt].format(row=row), nights)}
+        FROM ({MONTH_PIECES.format(row=row, start=start, end=end)}) WHERE true
+        ON CONFLICT(listing_id, month) DO UPDATE SET {_ADD_TOTALS};
+    """
+
+
+def schema_statements(fmt):
+    """The aggregate tables and the Bookings triggers for a storage format"""
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS ListingEarnings (
+            listing_id INTEGER PRIMARY KEY,
+            approved_nights INTEGER NOT NULL DEFAULT 0,
+            quoted_nights INTEGER NOT NULL DEFAULT 0,
+            quoted_cents INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ListingEarningsMonthly (
+            listing_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            approved_nights INTEGER NOT NULL DEFAULT 0,
+            quoted_nights INTEGER NOT NULL DEFAULT 0,
+            quoted_cents INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (listing_id, month)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ArchivedEarnings (
+            listing_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            approved_nights INTEGER NOT NULL DEFAULT 0,
+            quoted_nights INTEGER NOT NULL DEFAULT 0,
+            quoted_cents INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (listing_id, month)
+        ) WITHOUT ROWID
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS bookings_earnings_ai AFTER INSERT ON Bookings
+        WHEN NEW.status = 'Approved'
+        BEGIN {_apply("NEW", 1, fmt)} END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS bookings_earnings_au_old AFTER UPDATE OF listing_id, status, start_date, end_date, total ON Bookings
+        WHEN OLD.status = 'Approved'
+        BEGIN {_apply("OLD", -1, fmt)} END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS bookings_earnings_au_new AFTER UPDATE OF listing_id, status, start_date, end_date, total ON Bookings
+        WHEN NEW.status = 'Approved'
+        BEGIN {_apply("NEW", 1, fmt)} END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS bookings_earnings_ad AFTER DELETE ON Bookings
+        WHEN OLD.status = 'Approved'
+        BEGIN {_apply("OLD", -1, fmt)} END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_earnings_ad AFTER DELETE ON Listings
+        BEGIN
+            DELETE FROM ListingEarnings WHERE listing_id = OLD.id;
+            DELETE FROM ListingEarningsMonthly WHERE listing_id = OLD.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS listings_archived_earnings_ad AFTER DELETE ON Listings
+        BEGIN
+            DELETE FROM ArchivedEarnings WHERE listing_id = OLD.id;
+        END
+        """,
+    ]
+
+
+def monthly_nights(fmt, where="status = 'Approved'"):
+    """SELECT of (listing_id, month, nights, quoted_nights, quoted_cents) summed over the Bookings rows matching `where`"""
+    start, end = _dates("Bookings", fmt)
+    return f"""
+        WITH RECURSIVE pieces(listing_id, start_date, end_date, cents, stay_nights, month_start) AS (
+            SELECT listing_id, {start}, {end}, {TOTAL_CENTS[fmt].format(row="Bookings")},
+                   {NIGHTS[fmt].format(row="Bookings")}, date({start}, 'start of month')
+            FROM Bookings WHERE {where}
+            UNION ALL
+            SELECT listing_id, start_date, end_date, cents, stay_nights, date(month_start, '+1 month') FROM pieces
+            WHERE date(month_start, '+1 month') <= end_date
+        ),
+        sized AS (
+            SELECT listing_id, strftime('%Y-%m', month_start) AS month, cents, stay_nights,
+                   CAST(julianday(min(end_date, date(month_start, '+1 month', '-1 day')))
+                        - julianday(max(start_date, month_start)) + 1 AS INTEGER) AS nights,
+                   CAST(julianday(max(start_date, month_start)) - julianday(start_date) AS INTEGER) AS earlier
+            FROM pieces
+        )
+        SELECT listing_id, month, SUM(nights), SUM(CASE WHEN cents IS NULL THEN 0 ELSE nights END),
+               SUM({_piece_cents("cents", "stay_nights")})
+        FROM sized
+        GROUP BY listing_id, month
+    """
+
+
+def rebuild_statements(fmt):
+    """Statements recomputing both aggregate tables from Bookings and ArchivedEarnings for a storage format"""
+    sums = ", ".join(f"SUM({expression})" for expression in _quoted("Bookings", fmt))
+    return [
+        "DELETE FROM ListingEarnings",
+        "DELETE FROM ListingEarningsMonthly",
+        f"""
+        INSERT INTO ListingEarnings (listing_id, approved_nights, quoted_nights, quoted_cents)
+        SELECT listing_id, {sums}
+        FROM Bookings WHERE status = 'Approved'
+        GROUP BY listing_id
+        """,
+        f"INSERT INTO ListingEarningsMonthly (listing_id, month, approved_nights, quoted_nights, quoted_cents) {monthly_nights(fmt)}",
+        f"""
+        INSERT INTO ListingEarnings (listing_id, approved_nights, quoted_nights, quoted_cents)
+        SELECT listing_id, SUM(approved_nights), SUM(quoted_nights), SUM(quoted_cents)
+        FROM ArchivedEarnings WHERE true GROUP BY listing_id
+        ON CONFLICT(listing_id) DO UPDATE SET {_ADD_TOTALS}
+        """,
+        f"""
+        INSERT INTO ListingEarningsMonthly (listing_id, month, approved_nights, quoted_nights, quoted_cents)
+        SELECT listing_id, month, approved_nights, quoted_nights, quoted_cents FROM ArchivedEarnings WHERE true
+        ON CONFLICT(listing_id, month) DO UPDATE SET {_ADD_TOTALS}
+        """,
+    ]
+
+
+SCHEMA_STATEMENTS = schema_statements(storage.TEXT)
+REBUILD_STATEMENTS = rebuild_statements(storage.TEXT)
+
+BOOKING_TRIGGERS = ["bookings_earnings_ai", "bookings_earnings_au_old", "bookings_earnings_au_new", "bookings_earnings_ad"]
+# Everything schema_statements() creates; when all of it exists there is no DDL to run
+SCHEMA_OBJECTS = ("ListingEarnings", "ListingEarningsMonthly", "ArchivedEarnings", *BOOKING_TRIGGERS,
+                  "listings_earnings_ad", "listings_archived_earnings_ad")
+
+_ready = set()
+
+
+def ensure_schema(conn):
+    """Create the aggregate tables and triggers, backfilling them on first use
+
+    Raises repository.SchemaOutdated on a database whose Bookings predate
+    quoted totals (migration 4). Existence is checked with a plain read;
+    only missing objects take the write lock, and then the DDL and backfill
+    run in one transaction, so a failure leaves nothing half-created.
+    """
+    key = repository.database_file(conn)
+    if key and key in _ready:
+        return
+    repository.require_columns(conn, "Bookings", ("total",))
+    # Join a caller's open transaction instead of committing it early
+    owns_transaction = not conn.in_transaction
+    placeholders = ", ".join("?" * len(SCHEMA_OBJECTS))
+    found = conn.execute(f"SELECT COUNT(*) FROM sqlite_master WHERE name IN ({placeholders})", SCHEMA_OBJECTS).fetchone()[0]
+    if found < len(SCHEMA_OBJECTS):
+        with repository.write_transaction(conn):
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ListingEarnings'"
+            ).fetchone()
+            fmt = storage.storage_format(conn)
+            for statement in schema_statements(fmt):
+                conn.execute(statement)
+            if not exists:
+                for statement in rebuild_statements(fmt):
+                    conn.execute(statement)
+    if owns_transaction:
+        _ready.add(key)
+
+
+def drop_triggers(conn):
+    """Drop the Bookings sync triggers for a bulk load; call rebuild() afterwards"""
+    for name in BOOKING_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.commit()
+    _ready.discard(repository.database_file(conn))
+
+
+def rebuild(conn):
+    """Recompute both aggregate tables from Bookings and ArchivedEarnings"""
+    ensure_schema(conn)
+    for statement in rebuild_statements(storage.storage_format(conn)):
+        conn.execute(statement)
+    conn.commit()
+
+
+def keep_archived(conn, where, params=()):
+    """Move the approved nights of the Bookings rows matching `where` into ArchivedEarnings
+
+    Call it in the transaction that deletes those rows, before the DELETE:
+    the nights are added to the aggregates here and subtracted again by the
+    delete triggers, so the totals keep counting the archived stays.
+    """
+    ensure_schema(conn)
+    fmt = storage.storage_format(conn)
+    approved = f"status = 'Approved' AND ({where})"
+    for table in ("ArchivedEarnings", "ListingEarningsMonthly"):
+        conn.execute(f"""
+            INSERT INTO {table} (listing_id, month, approved_nights, quoted_nights, quoted_cents)
+            SELECT * FROM ({monthly_nights(fmt, approved)}) WHERE true
+            ON CONFLICT(listing_id, month) DO UPDATE SET {_ADD_TOTALS}
+        """, params)
+    nights, quoted_nights, quoted_cents = _quoted("Bookings", fmt)
+    conn.execute(f"""
+        INSERT INTO ListingEarnings (listing_id, approved_nights, quoted_nights, quoted_cents)
+        SELECT listing_id, SUM({nights}), SUM({quoted_nights}), SUM({quoted_cents})
+        FROM Bookings WHERE {approved} GROUP BY listing_id
+        ON CONFLICT(listing_id) DO UPDATE SET {_ADD_TOTALS}
+    """, params)
+
+
+def earnings_by_listing(conn):
+    """Return (id, title, host_name, earnings) rows from the aggregates, highest first"""
+    ensure_schema(conn)
+    return repository.execute(conn, "earnings.summary").fetchall()
+
+
+def monthly_earnings(conn, listing_id=None):
+    """Return (listing_id, month, nights, earnings) rows, optionally for one listing"""
+    ensure_schema(conn)
+    if listing_id is None:
+        return repository.execute(conn, "earnings.monthly").fetchall()
+    return repository.execute(conn, "earnings.monthly_for_listing", (listing_id,)).fetchall()
+
+
+def verify(conn):
+    """Compare the aggregates with the full recomputation plus the archived nights
+
+    Returns a list of (listing_id, stored, expected) for every mismatch.
+    Money is compared per listing and per month, each month against its
+    recomputed nights and quoted cents, and the months of a listing must add
+    up to its total.
+    """
+    ensure_schema(conn)
+    stored = {row[0]: round(row[3], 2) for row in repository.execute(conn, "earnings.summary")}
+    archived = dict(repository.execute(conn, "earnings.archived").fetchall())
+    expected = {row[0]: round(row[3] + archived.get(row[0], 0), 2) for row in repository.execute(conn, "earnings.by_listing")}
+    mismatches = [
+        (listing_id, stored.get(listing_id), amount)
+        for listing_id, amount in expected.items()
+        if stored.get(listing_id) != amount
+    ]
+
+    fmt = storage.storage_format(conn)
+    price = storage.price_sql("price_per_day") if fmt == storage.COMPACT else "price_per_day"
+    prices = dict(conn.execute(f"SELECT id, {price} FROM Listings"))
+
+    def money(listing_id, figures):
+        nights, quoted_nights, quoted_cents = figures
+        return round(quoted_cents / 100 + (nights - quoted_nights) * prices.get(listing_id, 0), 2)
+
+    recomputed = {}
+    for listing_id, month, *figures in itertools.chain(
+        conn.execute(monthly_nights(fmt)),
+        conn.execute("SELECT listing_id, month, approved_nights, quoted_nights, quoted_cents FROM ArchivedEarnings"),
+    ):
+        totals = recomputed.setdefault((listing_id, month), [0, 0, 0])
+        for index, value in enumerate(figures):
+            totals[index] += value
+    months = {(listing_id, month): tuple(figures) for listing_id, month, *figures in conn.execute(
+        "SELECT listing_id, month, approved_nights, quoted_nights, quoted_cents FROM ListingEarningsMonthly")}
+    by_listing = {}
+    for (listing_id, month) in sorted(set(recomputed) | set(months)):
+        figures = months.get((listing_id, month), (0, 0, 0))
+        wanted = tuple(recomputed.get((listing_id, month), (0, 0, 0)))
+        if figures != wanted:
+            mismatches.append((listing_id, f"{month}: {money(listing_id, figures):.2f} ({figures[0]} nights)",
+                               f"{month}: {money(listing_id, wanted):.2f} ({wanted[0]} nights)"))
+        by_listing[listing_id] = by_listing.get(listing_id, 0) + money(listing_id, figures)
+    mismatches.extend(
+        (listing_id, f"{round(amount, 2)} by month", stored.get(listing_id, 0))
+        for listing_id, amount in by_listing.items()
+        if round(amount, 2) != stored.get(listing_id, 0)
+    )
+    return mismatches
+
+
+if __name__ == "__main__":
+    import migrations
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    with repository.connection() as conn:
+        try:
+            migrations.require_current(conn)
+        except repository.SchemaOutdated as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        if command == "rebuild":
+            rebuild(conn)
+            print("✓ Earnings aggregates rebuilt.")
+        elif command == "verify":
+            problems = verify(conn)
+            if problems:
+                from tabulate import tabulate
+                print(tabulate(problems, headers=["Listing ID", "Stored", "Expected"], tablefmt=TABLE_FORMAT))
+                print(f"❌ {len(problems)} listing(s) out of sync. Run 'python earnings.py rebuild'.")
+                sys.exit(1)
+            print("✓ Earnings aggregates match the full query.")
+        else:
+            print(__doc__)
+            sys.exit(2)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Faceted listing queries for House Rental CLI
+
+find_listings() composes any mix of text, price range, location prefix, host
+and free-for-dates filters into a single statement. Each facet is backed by an
+index so the planner never has to scan Listings:
+
+    price range      idx_listings_price (price_per_day)
+    location prefix  idx_listings_location (location COLLATE NOCASE, price_per_day)
+    host             idx_listings_host (host_name COLLATE NOCASE, price_per_day)
+    free for dates   BookingSpans R*Tree (see availability.py)
+    text             ListingsFts (see search.py)
+
+Location and host indexes carry price_per_day so a combined price filter is
+checked from the index before the row is read.
+"""
+
+import repository
+import availability
+import search
+import storage
+
+SCHEMA_STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS idx_listings_price ON Listings (price_per_day)",
+    "CREATE INDEX IF NOT EXISTS idx_listings_location ON Listings (location COLLATE NOCASE, price_per_day)",
+    "CREATE INDEX IF NOT EXISTS idx_listings_host ON Listings (host_name COLLATE NOCASE, price_per_day)",
+]
+
+COLUMNS = "L.id, L.title, L.location, L.price_per_day, L.host_name"
+# Compact storage keeps prices in cents (see storage.py)
+COMPACT_COLUMNS = "L.id, L.title, L.location, L.price_per_day / 100.0, L.host_name"
+
+_ready = set()
+
+
+def ensure_schema(conn):
+    """Create the facet indexes if missing"""
+    key = repository.database_file(conn)
+    if key and key in _ready:
+        return
+    # Join a caller's open transaction instead of committing it early
+    owns_transaction = not conn.in_transaction
+    for statement in SCHEMA_STATEMENTS:
+        conn.execute(statement)
+    if owns_transaction:
+        conn.commit()
+        _ready.add(key)
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_query(text=None, min_price=None, max_price=None, location=None, host=None,
+                free_from=None, free_to=None, limit=None, compact=False):
+    """Return (sql, params) for a facet combination; unset facets are left out
+
+    compact=True builds the query for a database in the compact storage format.
+    """
+    match = search.to_match_query(text)
+    clauses, params = [], []
+    columns = COMPACT_COLUMNS if compact else COLUMNS
+    price = "? * 100" if compact else "?"
+
+    if match:
+        sql = f"SELECT {columns} FROM ListingsFts F JOIN Listings L ON L.id = F.rowid"
+        clauses.append("ListingsFts MATCH ?")
+        params.append(match)
+    else:
+        sql = f"SELECT {columns} FROM Listings L"
+
+    if min_price is not None:
+        clauses.append(f"L.price_per_day >= {price}")
+        params.append(min_price)
+    if max_price is not None:
+        clauses.append(f"L.price_per_day <= {price}")
+        params.append(max_price)
+    if location:
+        clauses.append("L.location LIKE ? ESCAPE '\\'")
+        params.append(_escape_like(location.strip()) + "%")
+    if host:
+        clauses.append("L.host_name = ? COLLATE NOCASE")
+        params.append(host.strip())
+    if free_from and free_to:
+        clauses.append("""L.id NOT IN (
+            SELECT B.listing_id FROM BookingSpans S JOIN Bookings B ON B.id = S.id
+            WHERE S.start_day <= CAST(julianday(?) AS INTEGER)
+            AND S.end_day >= CAST(julianday(?) AS INTEGER))""")
+        params.extend([free_to, free_from])
+
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if match:
+        sql += " ORDER BY bm25(ListingsFts, {}, {}, {})".format(*search.RANK_WEIGHTS)
+    else:
+        sql += " ORDER BY L.price_per_day, L.id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+
+def find_listings(conn, **facets):
+    """Return (id, title, location, price_per_day, host_name) rows matching every given facet
+
+    Facets: text, min_price, max_price, location (prefix, case-insensitive),
+    host (exact, case-insensitive), free_from/free_to (YYYY-MM-DD), limit.
+    """
+    ensure_schema(conn)
+    if facets.get("text"):
+        search.ensure_schema(conn)
+    if facets.get("free_from") and facets.get("free_to"):
+        availability.ensure_schema(conn)
+    sql, params = build_query(**facets, compact=storage.is_compact(conn))
+    return conn.execute(sql, params).fetchall()
+
+
+def explain(conn, **facets):
+    """Return the EXPLAIN QUERY PLAN detail lines for a facet combination"""
+    sql, params = build_query(**facets, compact=storage.is_compact(conn))
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
@@ -1,71 +1,101 @@
 #!/usr/bin/env python3
 """
 Additional features for House Rental CLI
+
+With SHARDS set in config.py, searches, availability and occupancy read every
+shard and merge the rows (see sharding.py); a cancellation goes to the shard
+of its booking id.
 """
 
-import sqlite3
-from tabulate import tabulate
-from datetime import datetime, timedelta
-from config import DATABASE_NAME, CURRENCY_SYMBOL, TABLE_FORMAT
+import repository
+import profiling
+import services
+import sharding
+from services import ServiceError
+from config import CURRENCY_SYMBOL, TABLE_FORMAT
+
+def get_optional_price(prompt):
+    """Get an optional non-negative price; blank means no limit"""
+    while True:
+        value = input(prompt).strip()
+        if not value:
+            return None
+        try:
+            price = float(value)
+            if price >= 0:
+                return price
+        except ValueError:
+            pass
+        print("Please enter a valid price or leave blank.")
 
+@profiling.profiled
 def search_listings():
-    """Search listings by location or price range"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
+    """Search listings by title, location or host, optionally within a price range"""
+    from tabulate import tabulate
+    text = input("Search title, location or host (blank for any): ").strip()
+    min_price = get_optional_price("Minimum price (blank for none): ")
+    max_price = get_optional_price("Maximum price (blank for none): ")
     
-    print("1. Search by location")
-    print("2. Search by price range")
-    choice = input("Choose search type: ").strip()
-    
-    if choice == "1":
-        location = input("Enter location to search: ").strip()
-        c.execute("SELECT * FROM Listings WHERE location LIKE ?", (f"%{location}%",))
-    elif choice == "2":
-        min_price = float(input("Minimum price: "))
-        max_price = float(input("Maximum price: "))
-        c.execute("SELECT * FROM Listings WHERE price_per_day BETWEEN ? AND ?", (min_price, max_price))
+    try:
+        parts = sharding.scatter(lambda conn: services.search_listings(conn, text, min_price, max_price))
+    except ServiceError as e:
+        print(e)
+        return
+    # bm25 scores are relative to each shard's index, so alternate between shards
+    rows = sharding.gather(parts, interleave=True) if text else sharding.gather(parts, key=lambda row: (row[3], row[0]))
     
-    rows = c.fetchall()
     if rows:
         formatted_rows = [[r[0], r[1], r[2], f"{CURRENCY_SYMBOL}{r[3]:.2f}", r[4]] for r in rows]
         print(tabulate(formatted_rows, headers=["ID", "Title", "Location", "Price/day", "Host"], tablefmt=TABLE_FORMAT))
     else:
         print("No listings found.")
-    conn.close()
 
+@profiling.profiled
 def view_availability():
     """Check availability for specific dates"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
-    
-    start_date = input("Check availability from (YYYY-MM-DD): ")
-    end_date = input("To (YYYY-MM-DD): ")
-    
-    c.execute("""
-        SELECT L.id, L.title, L.location, L.price_per_day 
-        FROM Listings L 
-        WHERE L.id NOT IN (
-            SELECT DISTINCT B.listing_id FROM Bookings B 
-            WHERE B.status = 'Approved' 
-            AND ((B.start_date <= ? AND B.end_date >= ?) OR (B.start_date <= ? AND B.end_date >= ?))
-        )
-    """, (start_date, start_date, end_date, end_date))
+    from tabulate import tabulate
+    start_date = input("Check availability from (YYYY-MM-DD): ").strip()
+    end_date = input("To (YYYY-MM-DD): ").strip()
+    try:
+        parts = sharding.scatter(lambda conn: services.available_listings(conn, start_date, end_date))
+    except ServiceError as e:
+        print(e)
+        return
+    rows = sharding.gather(parts, key=lambda row: row[0])
     
-    rows = c.fetchall()
     if rows:
         formatted_rows = [[r[0], r[1], r[2], f"{CURRENCY_SYMBOL}{r[3]:.2f}"] for r in rows]
         print(tabulate(formatted_rows, headers=["ID", "Title", "Location", "Price/day"], tablefmt=TABLE_FORMAT))
     else:
         print("No available listings for these dates.")
-    conn.close()
 
+@profiling.profiled
+def view_occupancy():
+    """Show occupancy and the next free window of each listing for a date range"""
+    from tabulate import tabulate
+    start_date = input("From (YYYY-MM-DD): ").strip()
+    end_date = input("To (YYYY-MM-DD): ").strip()
+    nights = input("Free window length in nights (default 1): ").strip() or "1"
+    try:
+        nights = int(nights)
+        parts = sharding.scatter(lambda conn: services.occupancy_report(conn, start_date, end_date, nights))
+    except (ServiceError, ValueError) as e:
+        print(e)
+        return
+    rows = sharding.gather(parts, key=lambda row: row[0])
+    
+    if rows:
+        formatted_rows = [[r[0], r[1], r[2], r[3], f"{r[4]:.1f}%", r[5] or "-"] for r in rows]
+        print(tabulate(formatted_rows, headers=["ID", "Title", "Location", "Booked", "Occupancy", "Next free"], tablefmt=TABLE_FORMAT))
+    else:
+        print("No listings found.")
+
+@profiling.profiled
 def cancel_booking():
     """Cancel a pending booking"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
-    
-    c.execute("SELECT * FROM Bookings WHERE status = 'Pending'")
-    bookings = c.fetchall()
+    from tabulate import tabulate
+    parts = sharding.scatter(lambda conn: repository.execute(conn, "booking.pending").fetchall())
+    bookings = sharding.gather(parts)
     if not bookings:
         print("No pending bookings to cancel.")
         return
@@ -73,11 +103,13 @@ def cancel_booking():
     print(tabulate(bookings, headers=["ID", "Listing", "Customer", "Start", "End", "Status"]))
     booking_id = int(input("Enter booking ID to cancel: "))
     
-    c.execute("DELETE FROM Bookings WHERE id = ? AND status = 'Pending'", (booking_id,))
-    if c.rowcount > 0:
-        print("Booking cancelled successfully!")
-    else:
-        print("Booking not found or cannot be cancelled.")
-    
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    # A booking lives in the shard of its id (the default database without SHARDS)
+    with sharding.connection_for_id(booking_id) as conn:
+        try:
+            services.cancel_booking(conn, booking_id)
+        except ServiceError as e:
+            print(e)
+            return
+        
+        conn.commit()
+    print("Booking cancelled successfully!")
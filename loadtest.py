@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Load test for the House Rental JSON API
+
+Opens a number of keep-alive client connections and fires a weighted mix of
+API requests at a running server (see api.py) for a fixed duration, then
+reports requests/sec and p50/p95/p99 latency per endpoint and overall.
+Writes create far-future bookings and approve about half of them.
+
+With --database the server is started in a child process on a free port, so
+one command measures a whole box:
+
+    python loadtest.py --database /tmp/bench/bench_100000_42.db --duration 10
+    python loadtest.py --url http://127.0.0.1:8080 --clients 64 --writes 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+from tabulate import tabulate
+from benchmark import SEARCH_WORDS, percentile
+from config import TABLE_FORMAT
+
+WRITE_START = date(2045, 1, 1)
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=None):
+        """Send a request and return (status, decoded JSON)"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(body).encode() if body is not None else b""
+        self.writer.write((f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                           f"Content-Length: {len(data)}\r\n\r\n").encode("latin-1") + data)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+class Workload:
+    """Picks the next request; shared by all clients of one run"""
+
+    def __init__(self, max_listing, writes, seed):
+        self.rng = random.Random(seed)
+        self.max_listing = max_listing
+        self.writes = writes
+        self.next_day = 0
+
+    def _dates(self, nights=3):
+        start = date(2024, 1, 1) + timedelta(days=self.rng.randrange(700))
+        return start.isoformat(), (start + timedelta(days=nights - 1)).isoformat()
+
+    def read(self):
+        """Return (name, method, path) of a random read"""
+        rng = self.rng
+        choice = rng.random()
+        if choice < 0.35:
+            return "listings_page", "GET", f"/listings?after={rng.randrange(self.max_listing)}"
+        if choice < 0.65:
+            return "search", "GET", f"/listings/search?q={rng.choice(SEARCH_WORDS)}&limit=20"
+        if choice < 0.85:
+            start, end = self._dates()
+            return "listing_available", "GET", f"/listings/{rng.randint(1, self.max_listing)}/available?start={start}&end={end}"
+        if choice < 0.95:
+            return "bookings_page", "GET", f"/bookings?after={rng.randrange(self.max_listing * 10)}"
+        start, end = self._dates()
+        return "search_facets", "GET", f"/listings/search?location=Nairobi&max_price=150&free_from={start}&free_to={end}&limit=20"
+
+    def booking(self):
+        self.next_day += 2
+        start = (WRITE_START + timedelta(days=self.next_day)).isoformat()
+        return {"listing_id": self.rng.randint(1, self.max_listing), "customer_name": "Load Test",
+                "start_date": start, "end_date": start}
+
+
+async def client_loop(client, workload, deadline, timings, errors):
+    while time.perf_counter() < deadline:
+        requests = []
+        if workload.rng.random() < workload.writes:
+            requests.append(("create_booking", "POST", "/bookings", workload.booking()))
+        else:
+            requests.append(workload.read() + (None,))
+        while requests:
+            name, method, path, body = requests.pop(0)
+            started = time.perf_counter()
+            try:
+                status, payload = await client.request(method, path, body)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                errors[name] = errors.get(name, 0) + 1
+                client.close()
+                client.writer = None
+                continue
+            timings.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+            if status >= 500:
+                errors[name] = errors.get(name, 0) + 1
+            if name == "create_booking" and status == 201 and workload.rng.random() < 0.5:
+                requests.append(("approve_booking", "POST", f"/bookings/{payload['id']}/approve", None))
+
+
+async def run(host, port, clients=32, duration=10.0, writes=0.05, seed=42):
+    """Drive the API for `duration` seconds and return {endpoint: stats} plus an "all" row"""
+    probe = Client(host, port)
+    _, page = await probe.request("GET", "/listings?before=999999999999&size=1")
+    probe.close()
+    max_listing = page["items"][-1]["id"] if page["items"] else 1
+
+    workload = Workload(max_listing, writes, seed)
+    timings, errors = {}, {}
+    connections = [Client(host, port) for _ in range(clients)]
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop(c, workload, started + duration, timings, errors) for c in connections))
+    elapsed = time.perf_counter() - started
+    for client in connections:
+        client.close()
+
+    timings["all"] = [value for values in timings.values() for value in values]
+    errors["all"] = sum(errors.values())
+    results = {}
+    for name, values in timings.items():
+        values.sort()
+        results[name] = {
+            "requests": len(values),
+            "rps": len(values) / elapsed,
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+            "errors": errors.get(name, 0),
+        }
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database, port, readers=None):
+    """Start api.py on `port` in a child process and wait until it accepts connections"""
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api.py"),
+               "--database", database, "--port", str(port)]
+    if readers:
+        command += ["--readers", str(readers)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("API server did not start")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the House Rental JSON API")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://127.0.0.1:8080", help="server to test")
+    target.add_argument("--database", help="start api.py on this database instead")
+    parser.add_argument("--readers", type=int, help="reader threads for the started server")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent keep-alive connections")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--writes", type=float, default=0.05, help="share of requests that create bookings")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="also write the raw results to this file")
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.database:
+        host, port = "127.0.0.1", _free_port()
+        process = start_server(args.database, port, args.readers)
+    else:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    try:
+        results = asyncio.run(run(host, port, args.clients, args.duration, args.writes, args.seed))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    rows = [[name, stats["requests"], f"{stats['rps']:.0f}", f"{stats['p50']:.2f}", f"{stats['p95']:.2f}",
+             f"{stats['p99']:.2f}", stats["errors"]] for name, stats in results.items()]
+    print(tabulate(rows, headers=["Endpoint", "Requests", "Req/s", "p50 ms", "p95 ms", "p99 ms", "Errors"],
+                   tablefmt=TABLE_FORMAT))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as handle:
+            json.dump(results, handle, indent=2)
+    return 1 if results["all"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
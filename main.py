@@ -1,23 +1,24 @@
 import sqlite3
-from tabulate import tabulate
-from datetime import datetime
 import os
-from config import DATABASE_NAME, DATE_FORMAT, VALID_STATUSES, TABLE_FORMAT, CURRENCY_SYMBOL
+import sys
+import repository
+import profiling
+import services
+import pagination
+import sharding
+from services import ServiceError, validate_date
+from config import DATABASE_NAME, VALID_STATUSES, TABLE_FORMAT, CURRENCY_SYMBOL, APPROVAL_POLICIES
 
 def get_db_connection():
-    """Create and return database connection"""
+    """Borrow a pooled database connection"""
     if not os.path.exists(DATABASE_NAME):
         print(f"Database {DATABASE_NAME} not found. Please run 'python database.py' first.")
         return None
-    return sqlite3.connect(DATABASE_NAME)
+    return repository.get_pool().acquire()
 
-def validate_date(date_string):
-    """Validate date format"""
-    try:
-        datetime.strptime(date_string, DATE_FORMAT)
-        return True
-    except ValueError:
-        return False
+def release_db_connection(conn):
+    """Return a connection borrowed with get_db_connection"""
+    repository.get_pool().release(conn)
 
 def get_positive_float(prompt):
     """Get positive float input with validation"""
@@ -44,14 +45,13 @@ def get_positive_int(prompt):
             print("Please enter a valid number.")
 
 # ---------------------- Listings ----------------------
+@profiling.profiled
 def add_listing():
     conn = get_db_connection()
     if not conn:
         return
     
     try:
-        c = conn.cursor()
-        
         title = input("House/Apartment Title: ").strip()
         if not title:
             print("Title cannot be empty.")
@@ -69,171 +69,192 @@ def add_listing():
             print("Host name cannot be empty.")
             return
 
-        c.execute("INSERT INTO Listings (title, location, price_per_day, host_name) VALUES (?, ?, ?, ?)",
-                  (title, location, price_per_day, host_name))
-        conn.commit()
+        # With SHARDS set the listing goes to its region's file, else to this same connection
+        with sharding.connection_for_listing(location, host_name) as shard_conn:
+            services.add_listing(shard_conn, title, location, price_per_day, host_name)
+            shard_conn.commit()
         print("Listing added successfully!")
+    except ServiceError as e:
+        print(e)
     except sqlite3.Error as e:
         print(f"Database error: {e}")
     finally:
-        conn.close()
+        release_db_connection(conn)
 
+@profiling.profiled
 def view_listings():
     conn = get_db_connection()
     if not conn:
         return
     
     try:
-        c = conn.cursor()
-        c.execute("SELECT * FROM Listings ORDER BY id")
-        rows = c.fetchall()
-        
-        if rows:
-            formatted_rows = []
-            for row in rows:
-                formatted_row = list(row)
-                formatted_row[3] = f"{CURRENCY_SYMBOL}{row[3]:.2f}"
-                formatted_rows.append(formatted_row)
-            print(tabulate(formatted_rows, headers=["ID", "Title", "Location", "Price/day", "Host"], tablefmt=TABLE_FORMAT))
-        else:
-            print("No listings found.")
+        pagination.browse(conn, "listings", "No listings found.", fetch=sharding.page_fetcher())
     except sqlite3.Error as e:
         print(f"Database error: {e}")
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 # ---------------------- Bookings ----------------------
+@profiling.profiled
 def create_booking():
     conn = get_db_connection()
     if not conn:
         return
     
     try:
-        c = conn.cursor()
-        
         view_listings()
         
         listing_id = get_positive_int("Enter Listing ID to book: ")
-        c.execute("SELECT id FROM Listings WHERE id = ?", (listing_id,))
-        if not c.fetchone():
-            print("Invalid listing ID.")
-            return
-        
-        customer_name = input("Customer Name: ").strip()
-        if not customer_name:
-            print("Customer name cannot be empty.")
-            return
-        
-        while True:
-            start_date = input("Start Date (YYYY-MM-DD): ").strip()
-            if validate_date(start_date):
-                break
-            print("Invalid date format. Please use YYYY-MM-DD.")
-        
-        while True:
-            end_date = input("End Date (YYYY-MM-DD): ").strip()
-            if validate_date(end_date):
-                if end_date >= start_date:
+        # A listing and its bookings live in one shard (this same connection without SHARDS)
+        with sharding.connection_for_id(listing_id) as shard_conn:
+            c = shard_conn.cursor()
+            repository.execute(c, "listing.exists", (listing_id,))
+            if not c.fetchone():
+                print("Invalid listing ID.")
+                return
+            
+            customer_name = input("Customer Name: ").strip()
+            if not customer_name:
+                print("Customer name cannot be empty.")
+                return
+            
+            while True:
+                start_date = input("Start Date (YYYY-MM-DD): ").strip()
+                if validate_date(start_date):
                     break
-                else:
-                    print("End date must be after start date.")
-            else:
                 print("Invalid date format. Please use YYYY-MM-DD.")
-        
-        c.execute("""
-            SELECT COUNT(*) FROM Bookings 
-            WHERE listing_id = ? AND status = 'Approved' 
-            AND NOT (end_date < ? OR start_date > ?)
-        """, (listing_id, start_date, end_date))
-        
-        if c.fetchone()[0] > 0:
-            print("This listing is already booked for the selected dates.")
-            return
-
-        c.execute("INSERT INTO Bookings (listing_id, customer_name, start_date, end_date, status) VALUES (?, ?, ?, ?, ?)",
-                  (listing_id, customer_name, start_date, end_date, "Pending"))
-        conn.commit()
+            
+            while True:
+                end_date = input("End Date (YYYY-MM-DD): ").strip()
+                if validate_date(end_date):
+                    if end_date >= start_date:
+                        break
+                    else:
+                        print("End date must be after start date.")
+                else:
+                    print("Invalid date format. Please use YYYY-MM-DD.")
+            
+            quote = services.quote_booking(shard_conn, listing_id, start_date, end_date)
+            discount = f" - {CURRENCY_SYMBOL}{quote.discount:.2f} length-of-stay discount" if quote.discount else ""
+            print(f"Quote: {quote.nights} night(s), {CURRENCY_SYMBOL}{quote.subtotal:.2f}{discount}"
+                  f" = {CURRENCY_SYMBOL}{quote.total:.2f}")
+            services.create_booking(shard_conn, listing_id, customer_name, start_date, end_date)
+            shard_conn.commit()
         print("Booking created and is Pending approval!")
+    except ServiceError as e:
+        print(e)
     except sqlite3.Error as e:
         print(f"Database error: {e}")
     finally:
-        conn.close()
+        release_db_connection(conn)
 
+@profiling.profiled
 def manage_bookings():
     conn = get_db_connection()
     if not conn:
         return
     
     try:
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT B.id, L.title, B.customer_name, B.start_date, B.end_date, B.status 
-            FROM Bookings B 
-            JOIN Listings L ON B.listing_id = L.id 
-            ORDER BY B.id
-        """)
-        rows = c.fetchall()
-
-        if not rows:
-            print("No bookings found.")
+        if not pagination.browse(conn, "bookings", "No bookings found.", fetch=sharding.page_fetcher()):
             return
 
-        print(tabulate(rows, headers=["Booking ID", "Listing", "Customer", "Start", "End", "Status"], tablefmt=TABLE_FORMAT))
-
         booking_id = get_positive_int("Enter Booking ID to update: ")
         
-        c.execute("SELECT status FROM Bookings WHERE id = ?", (booking_id,))
-        result = c.fetchone()
-        if not result:
-            print("Invalid booking ID.")
+        with sharding.connection_for_id(booking_id) as shard_conn:
+            c = shard_conn.cursor()
+            repository.execute(c, "booking.status", (booking_id,))
+            result = c.fetchone()
+            if not result:
+                print("Invalid booking ID.")
+                return
+            
+            current_status = result[0]
+            if current_status != "Pending":
+                print(f"Booking is already {current_status}. Only Pending bookings can be updated.")
+                return
+            
+            while True:
+                status = input("Enter new status (Approved/Rejected): ").strip().capitalize()
+                if status in VALID_STATUSES[1:]:
+                    break
+                print("Invalid status. Must be Approved or Rejected.")
+
+            services.update_booking_status(shard_conn, booking_id, status)
+            shard_conn.commit()
+        print(f"Booking {booking_id} updated to {status}!")
+    except ServiceError as e:
+        print(e)
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+    finally:
+        release_db_connection(conn)
+
+@profiling.profiled
+def approve_pending_bookings():
+    from tabulate import tabulate
+    conn = get_db_connection()
+    if not conn:
+        return
+
+    try:
+        listing = input("Listing ID (blank for all listings): ").strip()
+        start_date = input("Bookings overlapping from (YYYY-MM-DD, blank for any date): ").strip() or None
+        end_date = input("To (YYYY-MM-DD): ").strip() if start_date else None
+        print("Policies: " + ", ".join(f"{i}. {policy}" for i, policy in enumerate(APPROVAL_POLICIES, start=1)))
+        choice = input("Which booking wins a conflict? (1-3, blank for first_come): ").strip()
+        policy = APPROVAL_POLICIES[int(choice) - 1] if choice in ("1", "2", "3") else APPROVAL_POLICIES[0]
+        listing_id = int(listing) if listing.isdigit() else None
+
+        # Conflicts are per listing, so every shard resolves its own bookings
+        shard_map = sharding.current()
+        only = [shard_map.for_id(listing_id)] if listing_id else None
+
+        def decide(dry_run):
+            parts = sharding.scatter(
+                lambda shard_conn: services.approve_pending(shard_conn, listing_id, start_date, end_date, policy, dry_run),
+                shard_map, only)
+            return sharding.gather(parts)
+
+        decisions = decide(dry_run=True)
+        if not decisions:
+            print("No pending bookings found.")
             return
-        
-        current_status = result[0]
-        if current_status != "Pending":
-            print(f"Booking is already {current_status}. Only Pending bookings can be updated.")
+        print(tabulate(decisions, headers=["Booking ID", "Listing ID", "Start", "End", "Decision"], tablefmt=TABLE_FORMAT))
+        if input(f"Apply these {len(decisions)} decision(s)? (y/n): ").strip().lower() != "y":
+            print("Nothing changed.")
             return
-        
-        while True:
-            status = input("Enter new status (Approved/Rejected): ").strip().capitalize()
-            if status in VALID_STATUSES[1:]:
-                break
-            print("Invalid status. Must be Approved or Rejected.")
 
-        c.execute("UPDATE Bookings SET status = ? WHERE id = ?", (status, booking_id))
-        conn.commit()
-        print(f"Booking {booking_id} updated to {status}!")
+        decisions = decide(dry_run=False)
+        approved = sum(decision.status == "Approved" for decision in decisions)
+        print(f"{approved} booking(s) approved, {len(decisions) - approved} rejected.")
+    except ServiceError as e:
+        print(e)
     except sqlite3.Error as e:
         print(f"Database error: {e}")
     finally:
-        conn.close()
+        release_db_connection(conn)
 
+@profiling.profiled
 def view_earnings():
+    from tabulate import tabulate
+    import snapshot
     conn = get_db_connection()
     if not conn:
         return
     
     try:
-        c = conn.cursor()
-        
-        c.execute("""
-            SELECT L.id, L.title, L.host_name,
-                   COALESCE(SUM((julianday(B.end_date) - julianday(B.start_date) + 1) * L.price_per_day), 0) AS earnings
-            FROM Listings L
-            LEFT JOIN Bookings B ON L.id = B.listing_id AND B.status = 'Approved'
-            GROUP BY L.id, L.title, L.host_name
-            ORDER BY earnings DESC
-        """)
-        rows = c.fetchall()
+        # Each shard is read from its reporting replica when REPORT_REPLICA_LAG is set, else live
+        parts = sharding.scatter(services.earnings_report, connect=snapshot.report_connection)
+        rows = sharding.gather(parts, key=lambda row: row[3] or 0, reverse=True)
         
         if rows:
             formatted_rows = []
             total_earnings = 0
             for row in rows:
                 formatted_row = list(row)
-                earnings = row[3] if row[3] else 0
-                formatted_row[3] = f"{CURRENCY_SYMBOL}{earnings:.2f}"
-                total_earnings += earnings
+                amount = row[3] if row[3] else 0
+                formatted_row[3] = f"{CURRENCY_SYMBOL}{amount:.2f}"
+                total_earnings += amount
                 formatted_rows.append(formatted_row)
             
             print(tabulate(formatted_rows, headers=["Listing ID", "Title", "Host", "Earnings"], tablefmt=TABLE_FORMAT))
@@ -243,7 +264,7 @@ def view_earnings():
     except sqlite3.Error as e:
         print(f"Database error: {e}")
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 def menu():
     print("Welcome to House Rental CLI!")
@@ -256,10 +277,11 @@ def menu():
             print("2. View All Listings")
             print("3. Create Booking")
             print("4. Approve/Reject Booking")
-            print("5. View Earnings Report")
-            print("6. Exit")
+            print("5. Approve Pending Bookings in Bulk")
+            print("6. View Earnings Report")
+            print("7. Exit")
             
-            choice = input("Select an option (1-6): ").strip()
+            choice = input("Select an option (1-7): ").strip()
 
             if choice == "1":
                 add_listing()
@@ -270,12 +292,14 @@ def menu():
             elif choice == "4":
                 manage_bookings()
             elif choice == "5":
-                view_earnings()
+                approve_pending_bookings()
             elif choice == "6":
+                view_earnings()
+            elif choice == "7":
                 print("Thank you for using House Rental CLI. Goodbye!")
                 break
             else:
-                print("Invalid choice. Please enter a number between 1 and 6.")
+                print("Invalid choice. Please enter a number between 1 and 7.")
         except KeyboardInterrupt:
             print("\n\nExiting House Rental CLI. Goodbye!")
             break
@@ -284,4 +308,8 @@ def menu():
             print("Please try again.")
 
 if __name__ == "__main__":
+    profiling.enable_from_environment()
+    if len(sys.argv) > 1:
+        import cli
+        sys.exit(cli.main(sys.argv[1:]))
     menu()
\ No newline at end of file
@@ -0,0 +1,780 @@
+#!/usr/bin/env python3
+"""
+Schema migrations for House Rental CLI
+
+PRAGMA user_version records how many of MIGRATIONS a database has had, and
+migrate() applies the missing ones in order:
+
+    1  rebuild Listings and Bookings with the constraints declared in V1_TABLES
+       (CHECKs, created_at, ON DELETE CASCADE), zero-padding legacy dates
+    2  create the derived indexes, R*Tree, earnings aggregates and FTS index
+    3  create the change log and its triggers (changes.py)
+    4  add the quoted Bookings.total and its earnings columns, recreate the
+       triggers that read it, and create the rate tables of pricing.py
+
+and then refreshes planner statistics with a bounded ANALYZE. A shipped
+migration is never changed: migrations 1 to 3 keep their own copies of the
+schema they created (V1_TABLES, V2_EARNINGS, v3_change_log()), and new
+columns, tables and triggers only come with a new migration. TABLES is the
+current layout, i.e. what all of them together produce.
+
+--storage compact|text converts an up-to-date database between the storage
+formats of storage.py by rebuilding both tables the same way, with the
+date and price columns converted in the copy (COMPACT_TABLES, STORAGE_RULES).
+The earnings triggers are recreated for the new format, derived data is
+recomputed and the file is vacuumed. Other processes should stop using the
+database for the conversion, since their statements are chosen per format.
+
+Tables are rebuilt online so the CLI keeps working during an upgrade: a shadow
+table is created, triggers mirror every write on the live table into it,
+existing rows are copied in short batches (each its own BEGIN IMMEDIATE, with a
+pause in between so other connections get the write lock), and the swap at the
+end is one short DROP + RENAME transaction. Rows that break the new
+constraints are kept in MigrationRejects rather than dropped.
+
+Usage:
+    python migrations.py [--database FILE] [--status] [--batch-size N] [--pause SECONDS]
+    python migrations.py --storage compact
+"""
+
+import argparse
+import re
+import sqlite3
+import sys
+import time
+import config
+import repository
+import availability
+import earnings
+import search
+import facets
+import changes
+import pricing
+import storage
+
+# The current layout, used for new databases and storage conversions
+TABLES = {
+    "Listings": """
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL CHECK(length(title) > 0),
+            location TEXT NOT NULL CHECK(length(location) > 0),
+            price_per_day REAL NOT NULL CHECK(price_per_day > 0),
+            host_name TEXT NOT NULL CHECK(length(host_name) > 0),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    "Bookings": """
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            listing_id INTEGER NOT NULL,
+            customer_name TEXT NOT NULL CHECK(length(customer_name) > 0),
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'Pending' CHECK(status IN ('Pending', 'Approved', 'Rejected')),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            total REAL,
+            FOREIGN KEY(listing_id) REFERENCES Listings(id) ON DELETE CASCADE,
+            CHECK(start_date <= end_date)
+        )
+    """,
+}
+
+# The compact storage format: day numbers and integer cents (see storage.py)
+COMPACT_TABLES = {
+    "Listings": """
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL CHECK(length(title) > 0),
+            location TEXT NOT NULL CHECK(length(location) > 0),
+            price_per_day INTEGER NOT NULL CHECK(typeof(price_per_day) = 'integer' AND price_per_day > 0),
+            host_name TEXT NOT NULL CHECK(length(host_name) > 0),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    "Bookings": """
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            listing_id INTEGER NOT NULL,
+            customer_name TEXT NOT NULL CHECK(length(customer_name) > 0),
+            start_date INTEGER NOT NULL CHECK(typeof(start_date) = 'integer'),
+            end_date INTEGER NOT NULL CHECK(typeof(end_date) = 'integer'),
+            status TEXT NOT NULL DEFAULT 'Pending' CHECK(status IN ('Pending', 'Approved', 'Rejected')),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            total INTEGER CHECK(total IS NULL OR typeof(total) = 'integer'),
+            FOREIGN KEY(listing_id) REFERENCES Listings(id) ON DELETE CASCADE,
+            CHECK(start_date <= end_date)
+        )
+    """,
+}
+
+# Listings and Bookings as migration 1 builds them, before the quoted total of migration 4
+V1_TABLES = {
+    "Listings": TABLES["Listings"],
+    "Bookings": """
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            listing_id INTEGER NOT NULL,
+            customer_name TEXT NOT NULL CHECK(length(customer_name) > 0),
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'Pending' CHECK(status IN ('Pending', 'Approved', 'Rejected')),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(listing_id) REFERENCES Listings(id) ON DELETE CASCADE,
+            CHECK(start_date <= end_date)
+        )
+    """,
+}
+
+# Modules whose ensure_schema builds derived objects, in their current layout
+DERIVED_MODULES = (availability, earnings, search, facets, changes, pricing)
+# The ones migration 2 creates as they are; its earnings aggregates are V2_EARNINGS
+V2_MODULES = (availability, search, facets)
+CREATED_NAME = re.compile(r"IF NOT EXISTS (\w+)")
+
+REJECTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS MigrationRejects (
+        id INTEGER PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        row_id INTEGER,
+        data TEXT NOT NULL,
+        rejected_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+def create_table_sql(table, name=None, tables=None):
+    """Return the CREATE TABLE statement for `table`, optionally under another name"""
+    return (tables or TABLES)[table].format(name=name or table)
+
+
+def _normalized_date(value):
+    """SQL expression zero-padding a Y-M-D date ('2025-12-3' -> '2025-12-03')
+
+    Values that are not three dash-separated numbers are returned unchanged.
+    Plain SQL rather than a Python function, because the mirror triggers also
+    fire on connections that never registered one.
+    """
+    rest = f"substr({value}, instr({value}, '-') + 1)"
+    day = f"substr({rest}, instr({rest}, '-') + 1)"
+    padded = f"printf('%04d-%02d-%02d', CAST({value} AS INTEGER), CAST({rest} AS INTEGER), CAST({day} AS INTEGER))"
+    return f"COALESCE(date({padded}), {value})"
+
+
+# How migration 1 fills each column of the rebuilt table from a legacy row ({row}
+# is the source alias) and which legacy rows satisfy the new constraints
+COPY_RULES = {
+    "Listings": {
+        "columns": {
+            "id": "{row}.id",
+            "title": "{row}.title",
+            "location": "{row}.location",
+            "price_per_day": "{row}.price_per_day",
+            "host_name": "{row}.host_name",
+            "created_at": "{row}.created_at",
+        },
+        "valid": "length({row}.title) > 0 AND length({row}.location) > 0"
+                 " AND {row}.price_per_day > 0 AND length({row}.host_name) > 0",
+    },
+    "Bookings": {
+        "columns": {
+            "id": "{row}.id",
+            "listing_id": "{row}.listing_id",
+            "customer_name": "{row}.customer_name",
+            "start_date": _normalized_date("{row}.start_date"),
+            "end_date": _normalized_date("{row}.end_date"),
+            "status": "{row}.status",
+            "created_at": "{row}.created_at",
+        },
+        "valid": "length({row}.customer_name) > 0 AND {row}.status IN ('Pending', 'Approved', 'Rejected')"
+                 f" AND {_normalized_date('{row}.start_date')} <= {_normalized_date('{row}.end_date')}"
+                 " AND {row}.listing_id IN (SELECT id FROM Listings)",
+    },
+}
+
+
+
+def _storage_rules(date, price):
+    """Copy rules converting the date and price columns with the given SQL helpers"""
+    start, end, cost = date("{row}.start_date"), date("{row}.end_date"), price("{row}.price_per_day")
+    total = price("{row}.total")
+    return {
+        "Listings": {
+            "columns": dict(COPY_RULES["Listings"]["columns"], price_per_day=cost),
+            "valid": f"{cost} > 0",
+        },
+        "Bookings": {
+            "columns": dict(COPY_RULES["Bookings"]["columns"], start_date=start, end_date=end, total=total),
+            "valid": f"{start} IS NOT NULL AND {end} IS NOT NULL AND {start} <= {end}"
+                     " AND {row}.listing_id IN (SELECT id FROM Listings)",
+        },
+    }
+
+
+# (table definitions, copy rules) for converting a database to each storage format
+STORAGE_RULES = {
+    storage.COMPACT: (COMPACT_TABLES, _storage_rules(storage.day_sql, storage.cents_sql)),
+    storage.TEXT: (TABLES, _storage_rules(storage.date_sql, storage.price_sql)),
+}
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def is_current(conn, table, tables=None):
+    """Return True if `table` already has the column, constraint and foreign key layout of TABLES
+
+    `tables` replaces TABLES, e.g. with the V1_TABLES layout migration 1 builds.
+    """
+    reference = sqlite3.connect(":memory:")
+    try:
+        for name in TABLES:
+            reference.execute(create_table_sql(name, tables=tables))
+        for pragma in ("table_info", "foreign_key_list"):
+            if conn.execute(f"PRAGMA {pragma}({table})").fetchall() != reference.execute(f"PRAGMA {pragma}({table})").fetchall():
+                return False
+        sql = lambda db: db.execute("SELECT sql FROM sqlite_master WHERE name = ?", (table,)).fetchone()[0]
+        return sql(conn).upper().count("CHECK") == sql(reference).upper().count("CHECK")
+    finally:
+        reference.close()
+
+
+def _copy_plan(conn, table, rules=None):
+    """Return (columns, expressions, valid, changed) SQL templates for copying a legacy table"""
+    rules = (rules or COPY_RULES)[table]
+    legacy = set(_columns(conn, table))
+    columns, expressions = [], []
+    for column, expression in rules["columns"].items():
+        columns.append(column)
+        # Columns the legacy table never had (e.g. created_at) are left NULL
+        expressions.append(expression if column in legacy else "NULL")
+    valid = f"COALESCE(({rules['valid']}), 0)"
+    changed = " OR ".join(
+        f"({expression}) IS NOT {{row}}.{column}"
+        for column, expression in zip(columns, expressions)
+        if expression not in ("NULL", f"{{row}}.{column}")
+    ) or "0"
+    return columns, expressions, valid, changed
+
+
+def _legacy_json(conn, table, row):
+    return "json_object({})".format(", ".join(f"'{column}', {row}.{column}" for column in _columns(conn, table)))
+
+
+def _mirror_triggers(conn, table, shadow, rules=None):
+    """Triggers copying every write on the live table into the shadow table"""
+    columns, expressions, valid, _ = _copy_plan(conn, table, rules)
+    column_list = ", ".join(columns)
+    values = ", ".join(expression.format(row="NEW") for expression in expressions)
+    insert = f"""
+        INSERT OR REPLACE INTO {shadow} ({column_list}) SELECT {values} WHERE {valid.format(row='NEW')};
+        INSERT INTO MigrationRejects (table_name, row_id, data)
+        SELECT '{table}', NEW.id, {_legacy_json(conn, table, 'NEW')} WHERE NOT {valid.format(row='NEW')};
+    """
+    delete = f"DELETE FROM {shadow} WHERE id = OLD.id;"
+    return {
+        f"{table}_migrate_ai": f"CREATE TRIGGER {table}_migrate_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"{table}_migrate_au": f"CREATE TRIGGER {table}_migrate_au AFTER UPDATE ON {table} BEGIN {delete} {insert} END",
+        f"{table}_migrate_ad": f"CREATE TRIGGER {table}_migrate_ad AFTER DELETE ON {table} BEGIN {delete} END",
+    }
+
+
+def rebuild_table(conn, table, batch_size=None, pause=None, progress=None, tables=None, rules=None):
+    """Rebuild `table` online with the TABLES definition; return (copied, rejected, changed)
+
+    `tables` and `rules` replace TABLES and COPY_RULES, e.g. to change the storage format.
+    """
+    batch_size = batch_size or config.MIGRATION_BATCH_SIZE
+    pause = config.MIGRATION_PAUSE if pause is None else pause
+    shadow = f"{table}_new"
+    triggers = _mirror_triggers(conn, table, shadow, rules)
+    columns, expressions, valid, changed = _copy_plan(conn, table, rules)
+    source = [expression.format(row="old") for expression in expressions]
+
+    # An interrupted earlier run leaves a stale shadow table behind; start over
+    with repository.write_transaction(conn):
+        for name in triggers:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"DROP TABLE IF EXISTS {shadow}")
+        conn.execute(REJECTS_TABLE)
+        conn.execute(create_table_sql(table, shadow, tables))
+        for statement in triggers.values():
+            conn.execute(statement)
+
+    copied = rejected = modified = 0
+    last_id = 0
+    while True:
+        with repository.write_transaction(conn):
+            bound = conn.execute(
+                f"SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > ? ORDER BY id LIMIT ?)",
+                (last_id, batch_size),
+            ).fetchone()[0]
+            if bound is None:
+                break
+            window = "old.id > ? AND old.id <= ?"
+            copied += conn.execute(
+                f"INSERT OR IGNORE INTO {shadow} ({', '.join(columns)}) SELECT {', '.join(source)}"
+                f" FROM {table} AS old WHERE {window} AND {valid.format(row='old')}",
+                (last_id, bound),
+            ).rowcount
+            rejected += conn.execute(
+                f"INSERT INTO MigrationRejects (table_name, row_id, data)"
+                f" SELECT '{table}', old.id, {_legacy_json(conn, table, 'old')}"
+                f" FROM {table} AS old WHERE {window} AND NOT {valid.format(row='old')}",
+                (last_id, bound),
+            ).rowcount
+            modified += conn.execute(
+                f"SELECT COUNT(*) FROM {table} AS old WHERE {window} AND ({changed.format(row='old')})",
+                (last_id, bound),
+            ).fetchone()[0]
+        last_id = bound
+        if progress:
+            progress(f"  {table}: {copied:,} rows copied, {rejected:,} rejected")
+        time.sleep(pause)
+
+    _swap(conn, table, shadow, triggers)
+    return copied, rejected, modified
+
+
+def _swap(conn, table, shadow, mirror_triggers):
+    """Replace `table` with its shadow, keeping its other triggers, indexes and AUTOINCREMENT counter"""
+    with repository.write_transaction(conn):
+        for name in mirror_triggers:
+            conn.execute(f"DROP TRIGGER {name}")
+        kept_triggers = [row[0] for row in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (table,))]
+        indexes = [row[0] for row in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,))]
+        sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {shadow} RENAME TO {table}")
+        for statement in kept_triggers:
+            conn.execute(statement)
+        if sequence:
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+            conn.execute(f"INSERT INTO sqlite_sequence (name, seq) SELECT ?, MAX(?, COALESCE(MAX(id), 0)) FROM {table}",
+                         (table, sequence[0]))
+
+    # Index builds take the write lock for their duration, so each gets its own transaction
+    for statement in indexes:
+        with repository.write_transaction(conn):
+            conn.execute(statement)
+
+
+# Migration 2's earnings aggregates: approved nights per listing and per month,
+# counted by Bookings triggers. Migration 1 leaves text storage, so only that format.
+_V2_NIGHTS = "CAST(julianday({row}.end_date) - julianday({row}.start_date) + 1 AS INTEGER)"
+_V2_MONTH_PIECES = """
+    WITH RECURSIVE months(month_start) AS (
+        SELECT date({row}.start_date, 'start of month')
+        UNION ALL
+        SELECT date(month_start, '+1 month') FROM months
+        WHERE date(month_start, '+1 month') <= {row}.end_date
+    )
+    SELECT {row}.listing_id AS listing_id, strftime('%Y-%m', month_start) AS month,
+           CAST(julianday(min({row}.end_date, date(month_start, '+1 month', '-1 day')))
+                - julianday(max({row}.start_date, month_start)) + 1 AS INTEGER) AS nights
+    FROM months
+"""
+
+
+def _v2_apply(row, sign):
+    return f"""
+        INSERT INTO ListingEarnings (listing_id, approved_nights)
+        SELECT {row}.listing_id, {sign} * {_V2_NIGHTS.format(row=row)} WHERE true
+        ON CONFLICT(listing_id) DO UPDATE SET approved_nights = approved_nights + excluded.approved_nights;
+        INSERT INTO ListingEarningsMonthly (listing_id, month, approved_nights)
+        SELECT listing_id, month, {sign} * nights FROM ({_V2_MONTH_PIECES.format(row=row)}) WHERE true
+        ON CONFLICT(listing_id, month) DO UPDATE SET approved_nights = approved_nights + excluded.approved_nights;
+    """
+
+
+V2_EARNINGS = [
+    """
+    CREATE TABLE IF NOT EXISTS ListingEarnings (
+        listing_id INTEGER PRIMARY KEY,
+        approved_nights INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ListingEarningsMonthly (
+        listing_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        approved_nights INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (listing_id, month)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ArchivedEarnings (
+        listing_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        approved_nights INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (listing_id, month)
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bookings_earnings_ai AFTER INSERT ON Bookings
+    WHEN NEW.status = 'Approved'
+    BEGIN {_v2_apply("NEW", 1)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bookings_earnings_au_old AFTER UPDATE OF listing_id, status, start_date, end_date ON Bookings
+    WHEN OLD.status = 'Approved'
+    BEGIN {_v2_apply("OLD", -1)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bookings_earnings_au_new AFTER UPDATE OF listing_id, status, start_date, end_date ON Bookings
+    WHEN NEW.status = 'Approved'
+    BEGIN {_v2_apply("NEW", 1)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS bookings_earnings_ad AFTER DELETE ON Bookings
+    WHEN OLD.status = 'Approved'
+    BEGIN {_v2_apply("OLD", -1)} END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_earnings_ad AFTER DELETE ON Listings
+    BEGIN
+        DELETE FROM ListingEarnings WHERE listing_id = OLD.id;
+        DELETE FROM ListingEarningsMonthly WHERE listing_id = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_archived_earnings_ad AFTER DELETE ON Listings
+    BEGIN
+        DELETE FROM ArchivedEarnings WHERE listing_id = OLD.id;
+    END
+    """,
+]
+
+V2_EARNINGS_REBUILD = [
+    "DELETE FROM ListingEarnings",
+    "DELETE FROM ListingEarningsMonthly",
+    f"""
+    INSERT INTO ListingEarnings (listing_id, approved_nights)
+    SELECT listing_id, SUM({_V2_NIGHTS.format(row="Bookings")})
+    FROM Bookings WHERE status = 'Approved'
+    GROUP BY listing_id
+    """,
+    """
+    INSERT INTO ListingEarningsMonthly (listing_id, month, approved_nights)
+    WITH RECURSIVE pieces(listing_id, start_date, end_date, month_start) AS (
+        SELECT listing_id, start_date, end_date, date(start_date, 'start of month')
+        FROM Bookings WHERE status = 'Approved'
+        UNION ALL
+        SELECT listing_id, start_date, end_date, date(month_start, '+1 month') FROM pieces
+        WHERE date(month_start, '+1 month') <= end_date
+    )
+    SELECT listing_id, strftime('%Y-%m', month_start),
+           SUM(CAST(julianday(min(end_date, date(month_start, '+1 month', '-1 day')))
+                    - julianday(max(start_date, month_start)) + 1 AS INTEGER))
+    FROM pieces
+    GROUP BY listing_id, strftime('%Y-%m', month_start)
+    """,
+    """
+    INSERT INTO ListingEarnings (listing_id, approved_nights)
+    SELECT listing_id, SUM(approved_nights) FROM ArchivedEarnings WHERE true GROUP BY listing_id
+    ON CONFLICT(listing_id) DO UPDATE SET approved_nights = approved_nights + excluded.approved_nights
+    """,
+    """
+    INSERT INTO ListingEarningsMonthly (listing_id, month, approved_nights)
+    SELECT listing_id, month, approved_nights FROM ArchivedEarnings WHERE true
+    ON CONFLICT(listing_id, month) DO UPDATE SET approved_nights = approved_nights + excluded.approved_nights
+    """,
+]
+
+
+def _v2_earnings(conn, rebuild=False):
+    """Create migration 2's earnings aggregates and triggers, backfilling them when new or when `rebuild`"""
+    with repository.write_transaction(conn):
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ListingEarnings'"
+        ).fetchone()
+        for statement in V2_EARNINGS:
+            conn.execute(statement)
+        if rebuild or not exists:
+            for statement in V2_EARNINGS_REBUILD:
+                conn.execute(statement)
+
+
+# Migration 3's change log: rows as JSON per table and storage format ({row} is
+# NEW or OLD), and the columns whose update is logged; Bookings.total came later
+_V3_ROW_JSON = {
+    "Listings": {
+        storage.TEXT: "json_object('id', {row}.id, 'title', {row}.title, 'location', {row}.location,"
+                      " 'price_per_day', {row}.price_per_day, 'host_name', {row}.host_name, 'created_at', {row}.created_at)",
+        storage.COMPACT: "json_object('id', {row}.id, 'title', {row}.title, 'location', {row}.location,"
+                         f" 'price_per_day', {storage.price_sql('{row}.price_per_day')}, 'host_name', {{row}}.host_name,"
+                         " 'created_at', {row}.created_at)",
+    },
+    "Bookings": {
+        storage.TEXT: "json_object('id', {row}.id, 'listing_id', {row}.listing_id, 'customer_name', {row}.customer_name,"
+                      " 'start_date', {row}.start_date, 'end_date', {row}.end_date, 'status', {row}.status,"
+                      " 'created_at', {row}.created_at)",
+        storage.COMPACT: "json_object('id', {row}.id, 'listing_id', {row}.listing_id, 'customer_name', {row}.customer_name,"
+                         f" 'start_date', {storage.date_sql('{row}.start_date')}, 'end_date', {storage.date_sql('{row}.end_date')},"
+                         " 'status', {row}.status, 'created_at', {row}.created_at)",
+    },
+}
+_V3_LOGGED_COLUMNS = {
+    "Listings": ("title", "location", "price_per_day", "host_name"),
+    "Bookings": ("listing_id", "customer_name", "start_date", "end_date", "status"),
+}
+
+
+def v3_change_log(fmt):
+    """Migration 3's ChangeLog and ChangeConsumers tables and logging triggers for a storage format"""
+    statements = [
+        """
+        CREATE TABLE IF NOT EXISTS ChangeLog (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            operation TEXT NOT NULL,
+            data TEXT NOT NULL,
+            changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ChangeConsumers (
+            name TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]
+
+    def log(table, operation, row):
+        return (f"INSERT INTO ChangeLog (table_name, row_id, operation, data)"
+                f" VALUES ('{table}', {row}.id, '{operation}', {_V3_ROW_JSON[table][fmt].format(row=row)});")
+
+    for table, columns in _V3_LOGGED_COLUMNS.items():
+        prefix = table.lower()
+        changed = " OR ".join(f"OLD.{column} IS NOT NEW.{column}" for column in columns)
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {prefix}_changes_ai AFTER INSERT ON {table} BEGIN {log(table, 'insert', 'NEW')} END",
+            f"CREATE TRIGGER IF NOT EXISTS {prefix}_changes_au AFTER UPDATE ON {table} WHEN {changed}"
+            f" BEGIN {log(table, 'update', 'NEW')} END",
+            f"CREATE TRIGGER IF NOT EXISTS {prefix}_changes_ad AFTER DELETE ON {table} BEGIN {log(table, 'delete', 'OLD')} END",
+        ]
+    return statements
+
+
+def _forget_ready(conn):
+    key = repository.database_file(conn)
+    for module in DERIVED_MODULES:
+        module._ready.discard(key)
+
+
+def mark_ready(conn):
+    """Skip the ensure_schema work of every module whose derived objects already exist
+
+    One sqlite_master lookup replaces the CREATE ... IF NOT EXISTS statements
+    each module would otherwise run on its first call in a process.
+    """
+    if user_version(conn) < LATEST_VERSION:
+        return
+    key = repository.database_file(conn)
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    for module in DERIVED_MODULES:
+        if set(CREATED_NAME.findall(" ".join(module.SCHEMA_STATEMENTS))) <= names:
+            module._ready.add(key)
+
+
+def constrain_tables(conn, batch_size=None, pause=None, progress=None):
+    """Migration 1: rebuild legacy Listings and Bookings with the constrained schema"""
+    for table in ("Listings", "Bookings"):
+        # New databases are created with the current TABLES and need no rebuild either
+        if is_current(conn, table, V1_TABLES) or is_current(conn, table):
+            continue
+        if progress:
+            progress(f"Rebuilding {table}...")
+        copied, rejected, modified = rebuild_table(conn, table, batch_size, pause, progress, tables=V1_TABLES)
+        if progress:
+            progress(f"✓ {table}: {copied:,} rows copied, {modified:,} normalized, {rejected:,} moved to MigrationRejects")
+        if not (rejected or modified):
+            continue
+        # Derived data was computed from the legacy rows; refresh whatever exists
+        _forget_ready(conn)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if table == "Listings" and "ListingsFts" in tables:
+            with repository.write_transaction(conn):
+                search.rebuild(conn)
+        if "BookingSpans" in tables:
+            availability.rebuild_spans(conn)
+        if "ListingEarnings" in tables:
+            _v2_earnings(conn, rebuild=True)
+
+
+def derived_schema(conn, batch_size=None, pause=None, progress=None):
+    """Migration 2: overlap and facet indexes, availability R*Tree, earnings aggregates, FTS index"""
+    _forget_ready(conn)
+    for module in V2_MODULES:
+        module.ensure_schema(conn)
+    _v2_earnings(conn)
+
+
+def change_log(conn, batch_size=None, pause=None, progress=None):
+    """Migration 3: change log and its Listings and Bookings triggers"""
+    with repository.write_transaction(conn):
+        for statement in v3_change_log(storage.storage_format(conn)):
+            conn.execute(statement)
+
+
+def booking_totals(conn, batch_size=None, pause=None, progress=None):
+    """Migration 4: quoted booking totals, earnings counted from them, and the pricing tables"""
+    compact = storage.detect(conn) == storage.COMPACT
+    columns = {
+        "Bookings": ["total INTEGER CHECK(total IS NULL OR typeof(total) = 'integer')" if compact else "total REAL"],
+        "ListingEarnings": earnings.QUOTED_COLUMNS,
+        "ListingEarningsMonthly": earnings.QUOTED_COLUMNS,
+        "ArchivedEarnings": earnings.QUOTED_COLUMNS,
+    }
+    with repository.write_transaction(conn):
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table, definitions in columns.items():
+            if table not in tables:
+                continue
+            existing = set(_columns(conn, table))
+            for definition in definitions:
+                if definition.split()[0] not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {definition}")
+    # The earnings and change log triggers predate the column; recreate them
+    earnings.drop_triggers(conn)
+    changes.drop_triggers(conn)
+    _forget_ready(conn)
+    for module in DERIVED_MODULES:
+        module.ensure_schema(conn)
+    earnings.rebuild(conn)
+
+
+# Position in this list + 1 is the user_version a database has after the migration
+MIGRATIONS = [
+    constrain_tables,
+    derived_schema,
+    change_log,
+    booking_totals,
+]
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def user_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def require_current(conn):
+    """Raise repository.SchemaOutdated unless every migration has been applied to the database"""
+    version = user_version(conn)
+    if version < LATEST_VERSION:
+        raise repository.SchemaOutdated(
+            f"Database schema is at version {version} of {LATEST_VERSION}. Please run 'python migrations.py' first.")
+
+
+def analyze(conn):
+    """Refresh planner statistics, sampling at most config.ANALYZE_LIMIT rows per index"""
+    conn.execute(f"PRAGMA analysis_limit = {config.ANALYZE_LIMIT}")
+    with repository.write_transaction(conn):
+        conn.execute("ANALYZE")
+
+
+def connect(database):
+    """Open the migration connection; foreign keys are off so the table swap can DROP a referenced table"""
+    conn = sqlite3.connect(database, timeout=config.BUSY_TIMEOUT)
+    repository.configure_connection(conn)
+    conn.execute("PRAGMA foreign_keys = OFF")
+    return conn
+
+
+def migrate(database=None, batch_size=None, pause=None, progress=None):
+    """Apply pending migrations to `database` and return the list of versions applied"""
+    conn = connect(database or config.DATABASE_NAME)
+    try:
+        applied = []
+        for version, migration in enumerate(MIGRATIONS, start=1):
+            if version <= user_version(conn):
+                continue
+            if progress:
+                progress(f"Migration {version}: {migration.__doc__.split(': ', 1)[-1]}")
+            migration(conn, batch_size, pause, progress)
+            with repository.write_transaction(conn):
+                conn.execute(f"PRAGMA user_version = {version}")
+            applied.append(version)
+        if applied:
+            problems = conn.execute("PRAGMA foreign_key_check").fetchall()
+            if problems and progress:
+                progress(f"⚠ {len(problems)} foreign key violation(s) remain")
+            analyze(conn)
+        return applied
+    finally:
+        conn.close()
+
+
+def convert_storage(database=None, fmt=storage.COMPACT, batch_size=None, pause=None, progress=None):
+    """Migrate `database` if needed and convert it to storage format `fmt`; return False if it already was"""
+    database = database or config.DATABASE_NAME
+    migrate(database, batch_size, pause, progress)
+    conn = connect(database)
+    try:
+        if storage.detect(conn) == fmt:
+            return False
+        tables, rules = STORAGE_RULES[fmt]
+        for table in ("Listings", "Bookings"):
+            if progress:
+                progress(f"Converting {table} to {fmt} storage...")
+            copied, rejected, _ = rebuild_table(conn, table, batch_size, pause, progress, tables, rules)
+            if progress:
+                progress(f"✓ {table}: {copied:,} rows converted, {rejected:,} moved to MigrationRejects")
+        # The kept earnings and change log triggers were written for the old format
+        earnings.drop_triggers(conn)
+        changes.drop_triggers(conn)
+        _forget_ready(conn)
+        for module in DERIVED_MODULES:
+            module.ensure_schema(conn)
+        earnings.rebuild(conn)
+        availability.rebuild_spans(conn)
+        analyze(conn)
+        # The old tables' pages are free now; give them back
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+        # Idle pooled connections of this process cached the old format
+        repository.get_pool(database).close_all()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upgrade a House Rental database to the current schema")
+    parser.add_argument("--database", default=config.DATABASE_NAME)
+    parser.add_argument("--status", action="store_true", help="show the schema version and exit")
+    parser.add_argument("--batch-size", type=int, default=config.MIGRATION_BATCH_SIZE, help="rows copied per transaction")
+    parser.add_argument("--pause", type=float, default=config.MIGRATION_PAUSE, help="seconds to yield between batches")
+    parser.add_argument("--storage", choices=storage.FORMATS, help="also convert to this storage format")
+    args = parser.parse_args(argv)
+
+    if args.status:
+        conn = connect(args.database)
+        try:
+            print(f"Schema version {user_version(conn)} of {LATEST_VERSION}")
+        finally:
+            conn.close()
+        return 0
+
+    if args.storage:
+        if convert_storage(args.database, args.storage, args.batch_size, args.pause, progress=print):
+            print(f"✓ Converted {args.database} to {args.storage} storage")
+        else:
+            print(f"✓ {args.database} already uses {args.storage} storage")
+        return 0
+
+    applied = migrate(args.database, args.batch_size, args.pause, progress=print)
+    if applied:
+        print(f"✓ Applied migration(s) {', '.join(map(str, applied))}; schema is at version {LATEST_VERSION}")
+    else:
+        print(f"✓ Schema already at version {LATEST_VERSION}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+In-process occupancy cache for House Rental CLI
+
+Approved nights are held as one boolean NumPy array per calendar year, with a
+row per listing id and a column per day, loaded in a single R*Tree range query
+(see availability.py) plus the archived bookings of archive.py, the first
+time a year is asked about. Questions across all listings then become array
+operations over the requested columns:
+
+    free_listings      listings with no approved night in a range
+    occupancy          booked nights and occupancy rate per listing
+    first_free_window  first run of N free nights per listing
+
+Rows are listing ids minus `offset`, the start of the database's id range
+(non-zero on the shards of sharding.py). The cache follows writes three ways:
+
+    other connections  PRAGMA data_version, checked on every lookup as in
+                       resultcache.py, drops the cache when any other
+                       connection or process commits
+    own approvals      services.py patches the cached nights
+    own bulk writes    bulk.py and archive.py call invalidate()
+"""
+
+import threading
+from datetime import date
+import numpy as np
+import repository
+import availability
+import archive
+import storage
+from storage import JULIAN_OFFSET
+from config import SHARD_ID_BITS
+
+SPANS_IN_RANGE = """
+    SELECT B.listing_id, S.start_day, S.end_day
+    FROM BookingSpans S JOIN Bookings B ON B.id = S.id
+    WHERE S.start_day <= ? AND S.end_day >= ?
+"""
+
+
+def expand_nights(starts, ends):
+    """Expand inclusive [start, end] ranges into one entry per night
+
+    Returns (owner, night): owner[i] is the index of the range that night[i]
+    belongs to, so any per-range column can be spread with column[owner].
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    nights = np.maximum(np.asarray(ends, dtype=np.int64) - starts + 1, 0)
+    owner = np.repeat(np.arange(len(starts)), nights)
+    first = np.cumsum(nights) - nights
+    night = np.arange(len(owner), dtype=np.int64) - first[owner] + starts[owner]
+    return owner, night
+
+
+class OccupancyCache:
+    """Approved nights of every listing, one (listing id - offset x day) array per year"""
+
+    def __init__(self):
+        self.years = {}
+        self.listing_ids = None
+        self.rows = 0
+        self.offset = 0
+        self._lock = threading.Lock()
+
+    def ids(self, conn):
+        """Sorted array of existing listing ids"""
+        if self.listing_ids is None:
+            self.listing_ids = np.fromiter((row[0] for row in conn.execute("SELECT id FROM Listings ORDER BY id")),
+                                           dtype=np.int64)
+            if len(self.listing_ids) and not self.rows:
+                self.offset = _range_start(int(self.listing_ids[0]))
+        return self.listing_ids
+
+    def _grow(self, rows):
+        if rows <= self.rows:
+            return
+        for year, grid in self.years.items():
+            self.years[year] = np.vstack([grid, np.zeros((rows - grid.shape[0], grid.shape[1]), dtype=bool)])
+        self.rows = rows
+
+    def year(self, conn, year):
+        """Return the occupancy array for `year`, loading it on first use"""
+        with self._lock:
+            ids = self.ids(conn)
+            self._grow(int(ids[-1]) - self.offset + 1 if len(ids) else 0)
+            grid = self.years.get(year)
+            if grid is None:
+                grid = self._load(conn, year)
+                self.years[year] = grid
+            return grid
+
+    def _load(self, conn, year):
+        first = date(year, 1, 1).toordinal()
+        days = date(year + 1, 1, 1).toordinal() - first
+        base = first + JULIAN_OFFSET
+        availability.ensure_schema(conn)
+        rows = conn.execute(SPANS_IN_RANGE, (base + days - 1, base)).fetchall()
+        rows += [row[:3] for row in archive.spans(conn, f"{year}-01-01", f"{year}-12-31", approved_only=True)]
+        spans = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        listing, start, end = spans.T
+        listing = listing - self.offset
+        start = np.maximum(start - base, 0)
+        end = np.minimum(end - base, days - 1)
+        keep = (listing >= 0) & (listing < self.rows)
+        owner, night = expand_nights(start[keep], end[keep])
+        grid = np.zeros((self.rows, days), dtype=bool)
+        grid[listing[keep][owner], night] = True
+        return grid
+
+    def window(self, conn, start, end):
+        """Return the (listing id - offset x day) occupancy for the inclusive date range"""
+        parts = []
+        for year in range(start.year, end.year + 1):
+            grid = self.year(conn, year)
+            first = date(year, 1, 1)
+            low = (max(start, first) - first).days
+            high = (min(end, date(year, 12, 31)) - first).days + 1
+            parts.append(grid[:, low:high])
+        return parts[0] if len(parts) == 1 else np.hstack(parts)
+
+    def _add_listing(self, listing_id):
+        if not self.rows:
+            self.offset = _range_start(listing_id)
+        if self.listing_ids is not None and listing_id not in self.listing_ids:
+            self.listing_ids = np.union1d(self.listing_ids, [listing_id])
+        self._grow(listing_id - self.offset + 1)
+
+    def add_listing(self, listing_id):
+        """Start tracking a newly added listing"""
+        with self._lock:
+            self._add_listing(listing_id)
+
+    def set_nights(self, listing_id, start, end, occupied):
+        """Mark a listing's nights in the loaded years as booked or free"""
+        with self._lock:
+            self._add_listing(listing_id)
+            for year, grid in self.years.items():
+                first = date(year, 1, 1)
+                low = max((start - first).days, 0)
+                high = min((end - first).days + 1, grid.shape[1])
+                if low < high:
+                    grid[listing_id - self.offset, low:high] = occupied
+
+
+def _range_start(listing_id):
+    """First id of the shard id range holding `listing_id` (0 without sharding)"""
+    return listing_id >> SHARD_ID_BITS << SHARD_ID_BITS
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_for(conn):
+    """Return the OccupancyCache of the connection's database
+
+    The cache is dropped if another connection committed since `conn` last
+    looked. Plain sqlite3 connections cannot remember data_version, and
+    in-memory databases have no name to key on: they get a fresh cache.
+    """
+    key = repository.database_file(conn)
+    if not key or not isinstance(conn, storage.Connection):
+        return OccupancyCache()
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    with _caches_lock:
+        if conn.occupancy_version != version:
+            # A connection seen for the first time has no trusted baseline either
+            _caches.pop(key, None)
+            conn.occupancy_version = version
+        return _caches.setdefault(key, OccupancyCache())
+
+
+def invalidate(conn):
+    """Drop the cached occupancy of the connection's database"""
+    forget(repository.database_file(conn))
+
+
+def forget(database):
+    """Drop the cached occupancy of a database file"""
+    with _caches_lock:
+        _caches.pop(database, None)
+
+
+def booking_changed(conn, listing_id, start_date, end_date, occupied):
+    """Patch the cache after a booking's nights were approved (occupied=True) or released
+
+    Inside a caller's open transaction the change may still be rolled back,
+    so the cache is dropped instead of patched.
+    """
+    cache = _caches.get(repository.database_file(conn))
+    if cache is None:
+        return
+    if conn.in_transaction:
+        invalidate(conn)
+        return
+    cache.set_nights(listing_id, date.fromisoformat(start_date), date.fromisoformat(end_date), occupied)
+
+
+def listing_added(conn, listing_id):
+    """Make a newly added listing part of the cached listing set"""
+    cache = _caches.get(repository.database_file(conn))
+    if cache is None:
+        return
+    if conn.in_transaction:
+        invalidate(conn)
+        return
+    cache.add_listing(listing_id)
+
+
+def _range(conn, start_date, end_date):
+    """Return (ids, rows): every listing id and its occupancy row over the range"""
+    cache = cache_for(conn)
+    ids = cache.ids(conn)
+    grid = cache.window(conn, date.fromisoformat(start_date), date.fromisoformat(end_date))
+    return ids, grid[ids - cache.offset]
+
+
+def free_listings(conn, start_date, end_date):
+    """Return the ids of listings with no approved night between the dates (inclusive)"""
+    ids, rows = _range(conn, start_date, end_date)
+    return ids[~rows.any(axis=1)]
+
+
+def occupancy(conn, start_date, end_date):
+    """Return (ids, booked_nights, rate) arrays for every listing over the range"""
+    ids, rows = _range(conn, start_date, end_date)
+    booked = np.count_nonzero(rows, axis=1)
+    return ids, booked, booked / rows.shape[1]
+
+
+def first_free_window(conn, nights, start_date, end_date):
+    """Return (ids, offsets): days from start_date to each listing's first N free nights, -1 if none
+
+    The window must fit inside the range. Runs are found by doubling: each
+    step ANDs the free mask with itself shifted, so free[i] comes to mean
+    "the next 1, 2, 4, ... N nights from i are free" in log2(N) steps.
+    """
+    ids, rows = _range(conn, start_date, end_date)
+    free = ~rows
+    days = free.shape[1]
+    if nights > days:
+        return ids, np.full(len(ids), -1, dtype=np.int64)
+    length = 1
+    while length < nights:
+        step = min(length, nights - length)
+        free[:, :days - step] &= free[:, step:]
+        free[:, days - step:] = False
+        length += step
+    offsets = free.argmax(axis=1)
+    offsets[~free[np.arange(len(ids)), offsets]] = -1
+    return ids, offsets
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Keyset pagination and streaming output for House Rental CLI
+
+Pages are fetched with `WHERE id > ? ORDER BY id LIMIT ?` (or the reverse for
+the previous page), so each page costs an index seek no matter how deep the
+user browses, and only one page is ever held in memory. Pages and their
+rendered tables are kept in resultcache.py until the data changes. Streaming
+helpers format rows straight from a cursor for non-interactive output.
+"""
+
+import itertools
+import repository
+import resultcache
+from config import TABLE_FORMAT, CURRENCY_SYMBOL, PAGE_SIZE
+
+VIEWS = {
+    "listings": {
+        "after": "listing.page_after",
+        "before": "listing.page_before",
+        "headers": ["ID", "Title", "Location", "Price/day", "Host"],
+        "money": (3,),
+    },
+    "bookings": {
+        "after": "booking.page_after",
+        "before": "booking.page_before",
+        "headers": ["Booking ID", "Listing", "Customer", "Start", "End", "Status"],
+        "money": (),
+    },
+}
+
+
+def fetch_page(conn, view, after=None, before=None, size=PAGE_SIZE):
+    """Return up to `size` rows with id > after (default) or id < before, in id order"""
+    return resultcache.cached(conn, ("page", view, after, before, size), lambda: _fetch_page(conn, view, after, before, size))
+
+
+def _fetch_page(conn, view, after, before, size):
+    spec = VIEWS[view]
+    if before is not None:
+        rows = repository.execute(conn, spec["before"], (before, size)).fetchall()
+        rows.reverse()
+        return rows
+    return repository.execute(conn, spec["after"], (after if after is not None else 0, size)).fetchall()
+
+
+def format_money(rows, money):
+    """Yield rows with the given column indexes formatted as currency"""
+    if not money:
+        yield from rows
+        return
+    for row in rows:
+        yield [f"{CURRENCY_SYMBOL}{value:.2f}" if i in money and value is not None else value
+               for i, value in enumerate(row)]
+
+
+def render_page(view, rows):
+    """Return the tabulate text for one page of a view"""
+    from tabulate import tabulate
+    spec = VIEWS[view]
+    return tabulate(list(format_money(rows, spec["money"])), headers=spec["headers"], tablefmt=TABLE_FORMAT)
+
+
+def iter_cursor(cursor, size=PAGE_SIZE):
+    """Yield rows from a cursor using fetchmany so memory stays bounded"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def stream_table(rows, headers, out, money=(), size=PAGE_SIZE):
+    """Write rows as a sequence of tables of at most `size` rows each"""
+    from tabulate import tabulate
+    rows = iter(rows)
+    wrote = False
+    while True:
+        chunk = list(format_money(itertools.islice(rows, size), money))
+        if not chunk:
+            return wrote
+        out.write(tabulate(chunk, headers=headers, tablefmt=TABLE_FORMAT) + "\n")
+        wrote = True
+
+
+def browse(conn, view, empty_message, size=PAGE_SIZE, fetch=None):
+    """Interactive pager: [n]ext, [p]rev, [j]ump <id>; Enter or q leaves
+
+    `fetch(view, after, before, size)` replaces fetch_page on `conn`, e.g.
+    sharding.fetch_page to page across every shard. Returns False when there
+    was nothing to show.
+    """
+    if fetch is None:
+        def fetch(view, after=None, before=None, size=size):
+            return fetch_page(conn, view, after, before, size)
+
+        def render(rows):
+            # Within one data version a page is identified by its ids
+            key = ("page.text", view, tuple(row[0] for row in rows))
+            return resultcache.cached(conn, key, lambda: render_page(view, rows))
+    else:
+        def render(rows):
+            return render_page(view, rows)
+
+    rows = fetch(view, size=size)
+    if not rows:
+        print(empty_message)
+        return False
+
+    while True:
+        print(render(rows))
+        command = input("[n]ext, [p]rev, [j]ump <id>, Enter to continue: ").strip().lower()
+        if command in ("", "q"):
+            return True
+        if command == "n":
+            page = fetch(view, after=rows[-1][0], size=size)
+        elif command == "p":
+            page = fetch(view, before=rows[0][0], size=size)
+        elif command.startswith("j"):
+            try:
+                target = int(command[1:].strip())
+            except ValueError:
+                print("Usage: j <id>")
+                continue
+            page = fetch(view, after=target - 1, size=size)
+        else:
+            print("Invalid choice.")
+            continue
+
+        if page:
+            rows = page
+        else:
+            print("No more rows in that direction.")
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Booking quote engine for House Rental CLI
+
+A stay is priced night by night from a per-listing rate calendar, then
+discounted by length of stay:
+
+    SeasonalRates  nightly price for a date range, replacing price_per_day
+                   (a later-starting season wins where two overlap)
+    RatePlans      weekend_uplift    percent added to Friday and Saturday nights
+                   weekly_discount   percent off stays of WEEKLY_NIGHTS or more
+                   monthly_discount  percent off stays of MONTHLY_NIGHTS or more
+
+Nights are the days start_date..end_date inclusive, as everywhere else, so a
+listing with no rates is quoted nights * price_per_day. Amounts are integer
+cents throughout.
+
+Each (listing, year) calendar is stored in RateCalendars as running totals
+(days + 1 little-endian int64 cents), so the price of any range is
+prefix[last + 1] - prefix[first] per calendar year touched: O(1) however long
+the stay. quote() keeps decoded calendars in memory; triggers bump
+PricingVersion and drop the stored calendars whenever a rate or a
+price_per_day changes, and quote() reloads when it sees a new version.
+Calendars missing from RateCalendars are built on demand and only stored by
+precompute(), so read-only connections can quote too.
+
+services.create_booking stores the quoted total on the booking, and the
+earnings aggregates add up stored totals (see earnings.py).
+
+Usage:
+    python pricing.py plan 3 --weekend-uplift 20 --weekly-discount 10 --monthly-discount 25
+    python pricing.py season 3 2025-12-15 2026-01-05 150
+    python pricing.py quote 3 2025-12-20 2025-12-27
+    python pricing.py precompute [--years 2]
+"""
+
+import argparse
+import calendar
+import itertools
+import sys
+import threading
+from array import array
+from collections import namedtuple
+from datetime import date
+import config
+import repository
+import storage
+
+Quote = namedtuple("Quote", "listing_id start_date end_date nights subtotal discount total")
+
+WEEKLY_NIGHTS = 7
+MONTHLY_NIGHTS = 28
+# date.weekday() of the nights that get the weekend uplift: Friday and Saturday
+WEEKEND = (4, 5)
+
+
+def _invalidate(listing):
+    return f"""
+        UPDATE PricingVersion SET version = version + 1;
+        DELETE FROM RateCalendars WHERE listing_id = {listing};
+    """
+
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS RatePlans (
+        listing_id INTEGER PRIMARY KEY REFERENCES Listings(id) ON DELETE CASCADE,
+        weekend_uplift REAL NOT NULL DEFAULT 0 CHECK(weekend_uplift >= 0),
+        weekly_discount REAL NOT NULL DEFAULT 0 CHECK(weekly_discount BETWEEN 0 AND 100),
+        monthly_discount REAL NOT NULL DEFAULT 0 CHECK(monthly_discount BETWEEN 0 AND 100)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS SeasonalRates (
+        listing_id INTEGER NOT NULL REFERENCES Listings(id) ON DELETE CASCADE,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        price_cents INTEGER NOT NULL CHECK(price_cents > 0),
+        PRIMARY KEY (listing_id, start_date),
+        CHECK(start_date <= end_date)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS RateCalendars (
+        listing_id INTEGER NOT NULL,
+        year INTEGER NOT NULL,
+        prefix BLOB NOT NULL,
+        PRIMARY KEY (listing_id, year)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS PricingVersion (
+        id INTEGER PRIMARY KEY CHECK(id = 0),
+        version INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO PricingVersion (id, version) VALUES (0, 0)",
+    *(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table.lower()}_pricing_{suffix} AFTER {event} ON {table}
+        BEGIN {_invalidate(f"{row}.listing_id")} END
+        """
+        for table in ("RatePlans", "SeasonalRates")
+        for suffix, event, row in (("ai", "INSERT", "NEW"), ("au", "UPDATE", "NEW"), ("ad", "DELETE", "OLD"))
+    ),
+    f"""
+    CREATE TRIGGER IF NOT EXISTS listings_pricing_au AFTER UPDATE OF price_per_day ON Listings
+    BEGIN {_invalidate("NEW.id")} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS listings_pricing_ad AFTER DELETE ON Listings
+    BEGIN {_invalidate("OLD.id")} END
+    """,
+]
+
+_ready = set()
+
+
+def ensure_schema(conn):
+    """Create the rate tables, calendar store and invalidation triggers if missing"""
+    key = repository.database_file(conn)
+    if key and key in _ready:
+        return
+    # Join a caller's open transaction instead of committing it early
+    owns_transaction = not conn.in_transaction
+    for statement in SCHEMA_STATEMENTS:
+        conn.execute(statement)
+    if owns_transaction:
+        conn.commit()
+        _ready.add(key)
+
+
+# ---------------------- Rates ----------------------
+def set_plan(conn, listing_id, weekend_uplift=None, weekly_discount=None, monthly_discount=None):
+    """Create or change a listing's rate plan; settings left as None keep their value (0 for a new plan)"""
+    ensure_schema(conn)
+    settings = {"weekend_uplift": weekend_uplift, "weekly_discount": weekly_discount, "monthly_discount": monthly_discount}
+    with repository.write_transaction(conn):
+        conn.execute("INSERT OR IGNORE INTO RatePlans (listing_id) VALUES (?)", (listing_id,))
+        for column, value in settings.items():
+            if value is not None:
+                conn.execute(f"UPDATE RatePlans SET {column} = ? WHERE listing_id = ?", (value, listing_id))
+        precompute(conn, [listing_id])
+
+
+def add_season(conn, listing_id, start_date, end_date, price_per_day):
+    """Charge price_per_day for every night from start_date to end_date (replacing a season starting that day)"""
+    ensure_schema(conn)
+    with repository.write_transaction(conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO SeasonalRates (listing_id, start_date, end_date, price_cents) VALUES (?, ?, ?, ?)",
+            (listing_id, start_date, end_date, round(price_per_day * 100)),
+        )
+        years = range(date.fromisoformat(start_date).year, date.fromisoformat(end_date).year + 1)
+        precompute(conn, [listing_id], sorted(set(years) | set(_default_years())))
+
+
+def clear_seasons(conn, listing_id):
+    """Remove every seasonal rate of a listing; return how many there were"""
+    ensure_schema(conn)
+    with repository.write_transaction(conn):
+        count = conn.execute("DELETE FROM SeasonalRates WHERE listing_id = ?", (listing_id,)).rowcount
+        precompute(conn, [listing_id])
+    return count
+
+
+def rates(conn, listing_id):
+    """Return (plan (uplift, weekly, monthly) or None, [(start, end, price_per_day)]) of a listing"""
+    ensure_schema(conn)
+    plan = conn.execute("SELECT weekend_uplift, weekly_discount, monthly_discount FROM RatePlans WHERE listing_id = ?",
+                        (listing_id,)).fetchone()
+    seasons = conn.execute("SELECT start_date, end_date, price_cents / 100.0 FROM SeasonalRates"
+                           " WHERE listing_id = ? ORDER BY start_date", (listing_id,)).fetchall()
+    return plan, seasons
+
+
+# ---------------------- Calendars ----------------------
+def _default_years():
+    this_year = date.today().year
+    return range(this_year, this_year + config.PRICING_YEARS_AHEAD + 1)
+
+
+def _build(conn, listing_id, year):
+    """Running totals of the nightly prices of one listing and year, or None if the listing does not exist"""
+    row = conn.execute("SELECT price_per_day FROM Listings WHERE id = ?", (listing_id,)).fetchone()
+    if row is None:
+        return None
+    base = row[0] if storage.is_compact(conn) else round(row[0] * 100)
+    first = date(year, 1, 1)
+    days = 366 if calendar.isleap(year) else 365
+    nightly = [base] * days
+    for start, end, cents in conn.execute(
+        "SELECT start_date, end_date, price_cents FROM SeasonalRates"
+        " WHERE listing_id = ? AND end_date >= ? AND start_date <= ? ORDER BY start_date",
+        (listing_id, first.isoformat(), date(year, 12, 31).isoformat()),
+    ):
+        low = max((date.fromisoformat(start) - first).days, 0)
+        high = min((date.fromisoformat(end) - first).days, days - 1)
+        nightly[low:high + 1] = [cents] * (high - low + 1)
+    plan = conn.execute("SELECT weekend_uplift FROM RatePlans WHERE listing_id = ?", (listing_id,)).fetchone()
+    if plan and plan[0]:
+        factor = 1 + plan[0] / 100
+        for weekday in WEEKEND:
+            for day in range((weekday - first.weekday()) % 7, days, 7):
+                nightly[day] = round(nightly[day] * factor)
+    return array("q", itertools.accumulate(nightly, initial=0))
+
+
+def precompute(conn, listing_ids=None, years=None):
+    """Store the calendars of the given listings (default all) and years (default this year and PRICING_YEARS_AHEAD more)"""
+    ensure_schema(conn)
+    years = list(years or _default_years())
+    with repository.write_transaction(conn):
+        if listing_ids is None:
+            listing_ids = [row[0] for row in conn.execute("SELECT id FROM Listings")]
+        rows = []
+        for listing_id in listing_ids:
+            for year in years:
+                prefix = _build(conn, listing_id, year)
+                if prefix is not None:
+                    # Stored little-endian whatever the machine, decoded with byteswap() where needed
+                    if sys.byteorder == "big":
+                        prefix.byteswap()
+                    rows.append((listing_id, year, prefix.tobytes()))
+        conn.executemany("INSERT OR REPLACE INTO RateCalendars (listing_id, year, prefix) VALUES (?, ?, ?)", rows)
+    return len(rows)
+
+
+class PricingCache:
+    """Decoded calendars and rate plans of one database, valid for one PricingVersion"""
+
+    def __init__(self, version):
+        self.version = version
+        self.calendars = {}
+        self.plans = {}
+
+    def calendar(self, conn, listing_id, year):
+        key = (listing_id, year)
+        prefix = self.calendars.get(key)
+        if prefix is None:
+            row = conn.execute("SELECT prefix FROM RateCalendars WHERE listing_id = ? AND year = ?", key).fetchone()
+            if row:
+                prefix = array("q")
+                prefix.frombytes(row[0])
+                if sys.byteorder == "big":
+                    prefix.byteswap()
+            else:
+                prefix = _build(conn, listing_id, year)
+                if prefix is None:
+                    return None
+            self.calendars[key] = prefix
+        return prefix
+
+    def plan(self, conn, listing_id):
+        plan = self.plans.get(listing_id)
+        if plan is None:
+            row = conn.execute("SELECT weekly_discount, monthly_discount FROM RatePlans WHERE listing_id = ?",
+                               (listing_id,)).fetchone()
+            plan = self.plans[listing_id] = row or (0, 0)
+        return plan
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_for(conn):
+    """The PricingCache of the connection's database, replaced when PricingVersion moved on"""
+    ensure_schema(conn)
+    version = conn.execute("SELECT version FROM PricingVersion").fetchone()[0]
+    key = repository.database_file(conn)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None or cache.version != version:
+            cache = PricingCache(version)
+            # Rates changed inside an open transaction may still be rolled back
+            if not conn.in_transaction:
+                _caches[key] = cache
+        return cache
+
+
+def forget(database):
+    """Drop the cached calendars of a database (e.g. a deleted snapshot)"""
+    with _caches_lock:
+        _caches.pop(database, None)
+
+
+def quote_cents(conn, listing_id, start, end):
+    """(nights, subtotal, discount) in cents for the dates start..end inclusive, or None for an unknown listing"""
+    cache = cache_for(conn)
+    subtotal = 0
+    for year in range(start.year, end.year + 1):
+        prefix = cache.calendar(conn, listing_id, year)
+        if prefix is None:
+            return None
+        first = date(year, 1, 1)
+        low = (max(start, first) - first).days
+        high = (min(end, date(year, 12, 31)) - first).days
+        subtotal += prefix[high + 1] - prefix[low]
+    nights = (end - start).days + 1
+    weekly, monthly = cache.plan(conn, listing_id)
+    percent = monthly if nights >= MONTHLY_NIGHTS else weekly if nights >= WEEKLY_NIGHTS else 0
+    return nights, subtotal, round(subtotal * percent / 100)
+
+
+def quote(conn, listing_id, start_date, end_date):
+    """Return the Quote of a stay (amounts in currency), or None if the listing does not exist"""
+    cents = quote_cents(conn, listing_id, date.fromisoformat(start_date), date.fromisoformat(end_date))
+    if cents is None:
+        return None
+    nights, subtotal, discount = cents
+    return Quote(listing_id, start_date, end_date, nights, subtotal / 100, discount / 100, (subtotal - discount) / 100)
+
+
+def main(argv=None):
+    import services
+    from tabulate import tabulate
+    parser = argparse.ArgumentParser(description="Set listing rates and quote stays")
+    parser.add_argument("--database", default=config.DATABASE_NAME)
+    commands = parser.add_subparsers(dest="command", required=True)
+    cmd = commands.add_parser("plan", help="set weekend uplift and length-of-stay discounts (percent)")
+    cmd.add_argument("listing_id", type=int)
+    cmd.add_argument("--weekend-uplift", type=float)
+    cmd.add_argument("--weekly-discount", type=float)
+    cmd.add_argument("--monthly-discount", type=float)
+    cmd = commands.add_parser("season", help="seasonal nightly price for a date range")
+    cmd.add_argument("listing_id", type=int)
+    cmd.add_argument("start")
+    cmd.add_argument("end")
+    cmd.add_argument("price", type=float)
+    cmd = commands.add_parser("clear-seasons", help="remove a listing's seasonal prices")
+    cmd.add_argument("listing_id", type=int)
+    cmd = commands.add_parser("show", help="a listing's rate plan and seasons")
+    cmd.add_argument("listing_id", type=int)
+    cmd = commands.add_parser("quote", help="price a stay")
+    cmd.add_argument("listing_id", type=int)
+    cmd.add_argument("start")
+    cmd.add_argument("end")
+    cmd = commands.add_parser("precompute", help="store the rate calendars of every listing")
+    cmd.add_argument("--years", type=int, default=config.PRICING_YEARS_AHEAD, help="years ahead of this one")
+    args = parser.parse_args(argv)
+
+    with repository.connection(args.database) as conn:
+        try:
+            if args.command == "plan":
+                services.set_rate_plan(conn, args.listing_id, args.weekend_uplift, args.weekly_discount, args.monthly_discount)
+                print(f"✓ Rate plan of listing {args.listing_id} saved")
+            elif args.command == "season":
+                services.add_seasonal_rate(conn, args.listing_id, args.start, args.end, args.price)
+                print(f"✓ {args.start} to {args.end} priced at {config.CURRENCY_SYMBOL}{args.price:.2f} per night")
+            elif args.command == "clear-seasons":
+                print(f"✓ Removed {clear_seasons(conn, args.listing_id)} season(s)")
+            elif args.command == "show":
+                plan, seasons = rates(conn, args.listing_id)
+                print(tabulate([plan or (0, 0, 0)], headers=["Weekend +%", "Weekly -%", "Monthly -%"], tablefmt=config.TABLE_FORMAT))
+                if seasons:
+                    print(tabulate(seasons, headers=["From", "To", "Price/night"], tablefmt=config.TABLE_FORMAT))
+            elif args.command == "quote":
+                q = services.quote_booking(conn, args.listing_id, args.start, args.end)
+                print(tabulate([q], headers=list(Quote._fields), tablefmt=config.TABLE_FORMAT))
+            else:
+                years = range(date.today().year, date.today().year + args.years + 1)
+                print(f"✓ Stored {precompute(conn, years=years):,} calendar(s)")
+        except services.ServiceError as e:
+            print(f"❌ {e}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
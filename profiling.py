@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Opt-in profiling for House Rental CLI
+
+When enabled, every connection the pool opens is a ProfiledConnection. Its
+cursors time each execute and fetch, count rows, and look up the statement's
+query plan once to flag full-table SCANs. SQLite's trace callback counts
+every statement the engine runs, including trigger bodies and implicit
+BEGIN/COMMIT. Its progress handler counts virtual machine steps per
+statement, a cost measure that does not depend on machine load. Menu and
+command-mode actions are timed as operations (for menu actions the wall time
+includes time spent at prompts; the SQL time does not), and a summary is
+printed, or written as JSON, when the process exits.
+
+Enable with the HOUSE_RENTAL_PROFILE environment variable, or with --profile
+in command mode. "-" prints the summary tables to stderr; a file name ending in
+.json gets JSON, any other file the tables:
+
+    HOUSE_RENTAL_PROFILE=- python main.py
+    HOUSE_RENTAL_PROFILE=profile.json python main.py
+    python main.py --profile profile.json report revenue 2025-01-01 2025-12-31
+"""
+
+import atexit
+import functools
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import storage
+from config import TABLE_FORMAT
+
+ENVIRONMENT_VARIABLE = "HOUSE_RENTAL_PROFILE"
+# The progress handler runs every this many virtual machine instructions
+PROGRESS_STEPS = 1000
+# Plan lines that read a whole table or index. R*Tree/FTS5 lookups also show up
+# as SCAN ... VIRTUAL TABLE, and schema lookups scan the (small) sqlite_master.
+FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(?!sqlite_)(?!.*VIRTUAL TABLE)")
+PLANNED = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+SUMMARY_STATEMENTS = 25
+
+_profiler = None
+
+
+def _counters(**extra):
+    return dict({"calls": 0, "ms": 0.0, "rows": 0}, **extra)
+
+
+class Profiler:
+    """Collects operation and statement statistics for the whole process"""
+
+    def __init__(self, output=None):
+        self.output = output
+        self.started = time.perf_counter()
+        self.operations = {}
+        self.statements = {}
+        self.connections_opened = 0
+        self.engine_statements = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # ---- bookkeeping called by connections and cursors ----
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def statement(self, conn, sql, parameters):
+        """Return the stats entry for a statement, explaining its plan the first time it is seen"""
+        key = " ".join(sql.split())
+        entry = self.statements.get(key)
+        if entry is not None:
+            return entry
+        full_scans = []
+        if key.split(None, 1)[0].upper() in PLANNED and parameters is not None:
+            try:
+                plan = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+                full_scans = [row[-1] for row in plan if FULL_SCAN.match(row[-1])]
+            except (sqlite3.Error, ValueError):
+                pass
+        with self._lock:
+            return self.statements.setdefault(key, _counters(vm_steps=0, full_scans=full_scans))
+
+    def record(self, entry, seconds, rows, executed):
+        """Add one execute or fetch to a statement and to the innermost running operation"""
+        ms = seconds * 1000
+        stack = self._stack()
+        with self._lock:
+            entry["calls"] += executed
+            entry["ms"] += ms
+            entry["rows"] += rows
+            if stack:
+                operation = stack[-1]
+                operation["statements"] += executed
+                operation["sql_ms"] += ms
+                operation["rows"] += rows
+
+    def running(self, entry):
+        """Mark the statement the calling thread is stepping, for the progress handler"""
+        self._local.current = entry
+
+    def trace(self, sql):
+        if sql.startswith("EXPLAIN"):
+            return
+        stack = self._stack()
+        with self._lock:
+            self.engine_statements += 1
+            if stack:
+                stack[-1]["engine_statements"] += 1
+
+    def progress(self):
+        entry = getattr(self._local, "current", None)
+        if entry is not None:
+            entry["vm_steps"] += PROGRESS_STEPS
+        return 0
+
+    @contextmanager
+    def operation(self, name):
+        with self._lock:
+            stats = self.operations.setdefault(
+                name, _counters(max_ms=0.0, sql_ms=0.0, statements=0, engine_statements=0))
+        stack = self._stack()
+        stack.append(stats)
+        started = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            ms = (time.perf_counter() - started) * 1000
+            stack.pop()
+            with self._lock:
+                stats["calls"] += 1
+                stats["ms"] += ms
+                stats["max_ms"] = max(stats["max_ms"], ms)
+
+    # ---- reporting ----
+    def summary(self):
+        """Return all statistics as a JSON-ready dict"""
+        # Only report the result cache when something used it
+        resultcache = sys.modules.get("resultcache")
+        with self._lock:
+            statements = sorted(({"sql": sql, **stats, "full_scans": list(stats["full_scans"])}
+                                 for sql, stats in self.statements.items()), key=lambda s: s["ms"], reverse=True)
+            return {
+                "wall_ms": (time.perf_counter() - self.started) * 1000,
+                "connections_opened": self.connections_opened,
+                "engine_statements": self.engine_statements,
+                "operations": {name: dict(stats) for name, stats in self.operations.items()},
+                "statements": statements,
+                "result_cache": resultcache.stats() if resultcache else None,
+            }
+
+    def render(self, summary=None):
+        """Return the summary as text tables"""
+        from tabulate import tabulate
+        summary = summary or self.summary()
+        operations = [[name, s["calls"], f"{s['ms']:.2f}", f"{s['ms'] / max(s['calls'], 1):.2f}", f"{s['max_ms']:.2f}",
+                       f"{s['sql_ms']:.2f}", s["statements"], s["engine_statements"], s["rows"]]
+                      for name, s in sorted(summary["operations"].items(), key=lambda item: -item[1]["ms"])]
+        statements = [[_shorten(s["sql"]), s["calls"], f"{s['ms']:.2f}", f"{s['ms'] / max(s['calls'], 1):.3f}",
+                       s["rows"], s["vm_steps"], "; ".join(s["full_scans"])]
+                      for s in summary["statements"][:SUMMARY_STATEMENTS]]
+        lines = [
+            f"=== Profile: {summary['wall_ms']:.0f} ms, {summary['connections_opened']} connection(s) opened, "
+            f"{summary['engine_statements']} statements run by SQLite ===",
+            tabulate(operations, headers=["Operation", "Calls", "Total ms", "Mean ms", "Max ms", "SQL ms",
+                                          "Statements", "Engine stmts", "Rows"], tablefmt=TABLE_FORMAT),
+            tabulate(statements, headers=["Statement", "Calls", "Total ms", "Mean ms", "Rows", "VM steps",
+                                          "Full scans"], tablefmt=TABLE_FORMAT),
+        ]
+        cache = summary.get("result_cache")
+        if cache:
+            lines.append(f"Result cache: {cache['hits']} hit(s), {cache['misses']} miss(es), "
+                         f"{cache['hit_rate']:.0%} hit rate, {cache['entries']}/{cache['size']} entries, "
+                         f"{cache['evictions']} eviction(s), {cache['invalidations']} invalidation(s)")
+        flagged = [s for s in summary["statements"] if s["full_scans"]]
+        if flagged:
+            lines.append(f"⚠ {len(flagged)} statement(s) scan a whole table or index:")
+            lines.extend(f"  {_shorten(s['sql'], 100)}  [{'; '.join(s['full_scans'])}]" for s in flagged)
+        return "\n".join(lines)
+
+    def write(self):
+        """Print the summary or save it to self.output (called at exit)"""
+        if self.output in (None, "", "-"):
+            print(self.render(), file=sys.stderr)
+            return
+        with open(self.output, "w", encoding="utf-8") as handle:
+            if self.output.endswith(".json"):
+                import json
+                json.dump(self.summary(), handle, indent=2)
+            else:
+                handle.write(self.render() + "\n")
+
+
+def _shorten(sql, width=70):
+    return sql if len(sql) <= width else sql[:width - 3] + "..."
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports execute/fetch time and rows to the connection's profiler"""
+
+    _entry = None
+
+    def _timed(self, method, args, executed):
+        profiler = self.connection.profiler
+        profiler.running(self._entry)
+        started = time.perf_counter()
+        try:
+            result = method(*args)
+        finally:
+            profiler.running(None)
+        seconds = time.perf_counter() - started
+        if executed:
+            rows = max(self.rowcount, 0)
+        elif result is None:
+            rows = 0
+        elif isinstance(result, list):
+            rows = len(result)
+        else:
+            rows = 1
+        profiler.record(self._entry, seconds, rows, executed)
+        return result
+
+    def execute(self, sql, parameters=()):
+        self._entry = self.connection.profiler.statement(self.connection, sql, parameters)
+        return self._timed(super().execute, (sql, parameters), 1)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._entry = self.connection.profiler.statement(self.connection, sql, None)
+        return self._timed(super().executemany, (sql, seq_of_parameters), 1)
+
+    def executescript(self, script):
+        self._entry = self.connection.profiler.statement(self.connection, script, None)
+        return self._timed(super().executescript, (script,), 1)
+
+    def fetchone(self):
+        return self._timed(super().fetchone, (), 0)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, (self.arraysize if size is None else size,), 0)
+
+    def fetchall(self):
+        return self._timed(super().fetchall, (), 0)
+
+    def __next__(self):
+        row = self._timed(super().fetchone, (), 0)
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class ProfiledConnection(storage.Connection):
+    """Connection whose cursors, trace callback and progress handler feed a Profiler"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiler = _profiler
+        self.profiler.connection_opened()
+        self.set_trace_callback(self.profiler.trace)
+        self.set_progress_handler(self.profiler.progress, PROGRESS_STEPS)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection's shortcuts create a plain cursor internally
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+
+def connection_factory():
+    """The sqlite3.connect factory for new pooled connections"""
+    return ProfiledConnection if _profiler else storage.Connection
+
+
+def enable(output=None):
+    """Start profiling connections opened from now on; the summary is written at exit"""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(output)
+        atexit.register(_profiler.write)
+    elif output:
+        _profiler.output = output
+    return _profiler
+
+
+def enable_from_environment():
+    """Enable profiling if HOUSE_RENTAL_PROFILE is set"""
+    output = os.environ.get(ENVIRONMENT_VARIABLE)
+    if output:
+        enable(output)
+
+
+def disable():
+    """Stop profiling new connections and return the collected Profiler (nothing is written at exit)"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler:
+        atexit.unregister(profiler.write)
+    return profiler
+
+
+@contextmanager
+def operation(name):
+    """Time a block as an operation when profiling is enabled"""
+    profiler = _profiler
+    if profiler is None:
+        yield None
+        return
+    with profiler.operation(name) as stats:
+        yield stats
+
+
+def profiled(func):
+    """Decorator: time every call of a menu action as an operation"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _profiler is None:
+            return func(*args, **kwargs)
+        with _profiler.operation(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""
+Shared data-access layer for House Rental CLI
+
+Every menu action borrows a connection from a process-wide pool instead of
+opening its own, so a whole CLI session runs on a single configured connection.
+SQL text lives in STATEMENTS so sqlite3's per-connection statement cache is hit
+on every repeated call. Databases in the compact storage format (see
+storage.py) run the COMPACT_STATEMENTS version of a statement where the two
+differ; it takes and returns the same values.
+"""
+
+import atexit
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import config
+import profiling
+import storage
+
+STATEMENTS = {
+    "listing.exists": "SELECT id FROM Listings WHERE id = ?",
+    "listing.insert": "INSERT INTO Listings (title, location, price_per_day, host_name) VALUES (?, ?, ?, ?)",
+    "listing.all": "SELECT id, title, location, price_per_day, host_name FROM Listings ORDER BY id",
+    "listing.page_after": "SELECT id, title, location, price_per_day, host_name FROM Listings WHERE id > ? ORDER BY id LIMIT ?",
+    "listing.page_before": "SELECT id, title, location, price_per_day, host_name FROM Listings WHERE id < ? ORDER BY id DESC LIMIT ?",
+    "listing.available": """
+        SELECT L.id, L.title, L.location, L.price_per_day
+        FROM Listings L
+        WHERE L.id NOT IN (
+            SELECT B.listing_id FROM BookingSpans S
+            JOIN Bookings B ON B.id = S.id
+            WHERE S.start_day <= CAST(julianday(?) AS INTEGER)
+            AND S.end_day >= CAST(julianday(?) AS INTEGER)
+        )
+        ORDER BY L.id
+    """,
+    "booking.overlap_count": """
+        SELECT COUNT(*) FROM Bookings
+        WHERE listing_id = ? AND status = 'Approved'
+        AND start_date <= ? AND end_date >= ?
+    """,
+    "booking.insert_if_free": """
+        INSERT INTO Bookings (listing_id, customer_name, start_date, end_date, status, total)
+        SELECT ?1, ?2, ?3, ?4, 'Pending', ?5
+        WHERE NOT EXISTS (
+            SELECT 1 FROM Bookings
+            WHERE listing_id = ?1 AND status = 'Approved'
+            AND start_date <= ?4 AND end_date >= ?3
+        )
+    """,
+    "booking.approve_if_free": """
+        UPDATE Bookings SET status = 'Approved'
+        WHERE id = ?1 AND status = 'Pending'
+        AND NOT EXISTS (
+            SELECT 1 FROM Bookings O
+            WHERE O.listing_id = Bookings.listing_id AND O.status = 'Approved'
+            AND O.start_date <= Bookings.end_date AND O.end_date >= Bookings.start_date
+        )
+    """,
+    "booking.reject_pending": "UPDATE Bookings SET status = 'Rejected' WHERE id = ? AND status = 'Pending'",
+    "booking.approved_overlaps": """
+        SELECT A.listing_id, A.id, B.id
+        FROM Bookings A
+        JOIN Bookings B ON B.listing_id = A.listing_id AND B.id > A.id
+        WHERE A.status = 'Approved' AND B.status = 'Approved'
+        AND B.start_date <= A.end_date AND B.end_date >= A.start_date
+    """,
+    "booking.orphans": """
+        SELECT B.id, B.listing_id FROM Bookings B
+        WHERE NOT EXISTS (SELECT 1 FROM Listings L WHERE L.id = B.listing_id)
+    """,
+    "booking.all": """
+        SELECT B.id, L.title, B.customer_name, B.start_date, B.end_date, B.status
+        FROM Bookings B
+        JOIN Listings L ON B.listing_id = L.id
+        ORDER BY B.id
+    """,
+    "booking.page_after": """
+        SELECT B.id, L.title, B.customer_name, B.start_date, B.end_date, B.status
+        FROM Bookings B
+        JOIN Listings L ON B.listing_id = L.id
+        WHERE B.id > ?
+        ORDER BY B.id LIMIT ?
+    """,
+    "booking.page_before": """
+        SELECT B.id, L.title, B.customer_name, B.start_date, B.end_date, B.status
+        FROM Bookings B
+        JOIN Listings L ON B.listing_id = L.id
+        WHERE B.id < ?
+        ORDER BY B.id DESC LIMIT ?
+    """,
+    "booking.pending": "SELECT id, listing_id, customer_name, start_date, end_date, status FROM Bookings WHERE status = 'Pending'",
+    "booking.status": "SELECT status FROM Bookings WHERE id = ?",
+    "booking.span": "SELECT listing_id, start_date, end_date FROM Bookings WHERE id = ?",
+    "booking.delete_pending": "DELETE FROM Bookings WHERE id = ? AND status = 'Pending'",
+    "booking.delete_from": "DELETE FROM Bookings WHERE listing_id = ? AND start_date >= ?",
+    "analytics.listings": "SELECT id, price_per_day, host_name, location FROM Listings ORDER BY id",
+    # Bulk approval (see approvals.py): the selection, then one listing's bookings around it
+    # The stay's value is its quoted total (see pricing.py), else nights x the listing's price
+    "approval.pending": """
+        SELECT B.id, B.listing_id, CAST(julianday(B.start_date) AS INTEGER), CAST(julianday(B.end_date) AS INTEGER),
+               COALESCE(B.total, (CAST(julianday(B.end_date) - julianday(B.start_date) AS INTEGER) + 1) * L.price_per_day)
+        FROM Bookings B
+        JOIN Listings L ON L.id = B.listing_id
+        WHERE B.status = 'Pending' AND (?1 IS NULL OR B.listing_id = ?1)
+        AND (?2 IS NULL OR B.end_date >= ?2) AND (?3 IS NULL OR B.start_date <= ?3)
+        ORDER BY B.listing_id, B.id
+    """,
+    "approval.listing_bookings": """
+        SELECT id, status, CAST(julianday(start_date) AS INTEGER), CAST(julianday(end_date) AS INTEGER)
+        FROM Bookings
+        WHERE listing_id = ?1 AND status IN ('Approved', 'Pending')
+        AND start_date <= ?3 AND end_date >= ?2
+    """,
+    # Status codes are indexes into config.VALID_STATUSES
+    "analytics.spans": """
+        SELECT listing_id, CAST(julianday(start_date) AS INTEGER), CAST(julianday(end_date) AS INTEGER),
+               CASE status WHEN 'Pending' THEN 0 WHEN 'Approved' THEN 1 ELSE 2 END
+        FROM Bookings WHERE start_date <= ? AND end_date >= ?
+    """,
+    # Approved stays with their quoted total (see pricing.py) in cents, -1 without one
+    "analytics.approved": """
+        SELECT listing_id, CAST(julianday(start_date) AS INTEGER), CAST(julianday(end_date) AS INTEGER),
+               COALESCE(CAST(round(total * 100) AS INTEGER), -1)
+        FROM Bookings WHERE status = 'Approved' AND start_date <= ? AND end_date >= ?
+    """,
+    "earnings.by_listing": """
+        SELECT L.id, L.title, L.host_name,
+               COALESCE(SUM(COALESCE(B.total, (julianday(B.end_date) - julianday(B.start_date) + 1) * L.price_per_day)), 0) AS earnings
+        FROM Listings L
+        LEFT JOIN Bookings B ON L.id = B.listing_id AND B.status = 'Approved'
+        GROUP BY L.id, L.title, L.host_name
+        ORDER BY earnings DESC
+    """,
+    "earnings.archived": """
+        SELECT A.listing_id, SUM(A.quoted_cents) / 100.0 + (SUM(A.approved_nights) - SUM(A.quoted_nights)) * L.price_per_day
+        FROM ArchivedEarnings A
+        JOIN Listings L ON L.id = A.listing_id
+        GROUP BY A.listing_id
+    """,
+    "earnings.summary": """
+        SELECT L.id, L.title, L.host_name,
+               COALESCE(E.quoted_cents / 100.0 + (E.approved_nights - E.quoted_nights) * L.price_per_day, 0) AS earnings
+        FROM Listings L
+        LEFT JOIN ListingEarnings E ON E.listing_id = L.id
+        ORDER BY earnings DESC
+    """,
+    "earnings.monthly": """
+        SELECT M.listing_id, M.month, M.approved_nights,
+               M.quoted_cents / 100.0 + (M.approved_nights - M.quoted_nights) * L.price_per_day
+        FROM ListingEarningsMonthly M
+        JOIN Listings L ON L.id = M.listing_id
+        WHERE M.approved_nights != 0
+        ORDER BY M.listing_id, M.month
+    """,
+    "earnings.monthly_for_listing": """
+        SELECT M.listing_id, M.month, M.approved_nights,
+               M.quoted_cents / 100.0 + (M.approved_nights - M.quoted_nights) * L.price_per_day
+        FROM ListingEarningsMonthly M
+        JOIN Listings L ON L.id = M.listing_id
+        WHERE M.listing_id = ? AND M.approved_nights != 0
+        ORDER BY M.month
+    """,
+}
+
+# Compact storage: dates are day numbers and prices cents (see storage.py), so
+# parameters go through CAST(julianday(?) AS INTEGER) and results back through
+# date(day + 0.5) and cents / 100.0. Statements missing here work on both formats.
+COMPACT_STATEMENTS = {
+    "listing.insert": """
+        INSERT INTO Listings (title, location, price_per_day, host_name)
+        VALUES (?, ?, CAST(round(? * 100) AS INTEGER), ?)
+    """,
+    "listing.all": "SELECT id, title, location, price_per_day / 100.0, host_name FROM Listings ORDER BY id",
+    "listing.page_after": "SELECT id, title, location, price_per_day / 100.0, host_name FROM Listings WHERE id > ? ORDER BY id LIMIT ?",
+    "listing.page_before": "SELECT id, title, location, price_per_day / 100.0, host_name FROM Listings WHERE id < ? ORDER BY id DESC LIMIT ?",
+    "listing.available": """
+        SELECT L.id, L.title, L.location, L.price_per_day / 100.0
+        FROM Listings L
+        WHERE L.id NOT IN (
+            SELECT B.listing_id FROM BookingSpans S
+            JOIN Bookings B ON B.id = S.id
+            WHERE S.start_day <= CAST(julianday(?) AS INTEGER)
+            AND S.end_day >= CAST(julianday(?) AS INTEGER)
+        )
+        ORDER BY L.id
+    """,
+    "booking.overlap_count": """
+        SELECT COUNT(*) FROM Bookings
+        WHERE listing_id = ? AND status = 'Approved'
+        AND start_date <= CAST(julianday(?) AS INTEGER) AND end_date >= CAST(julianday(?) AS INTEGER)
+    """,
+    "booking.insert_if_free": """
+        INSERT INTO Bookings (listing_id, customer_name, start_date, end_date, status, total)
+        SELECT ?1, ?2, CAST(julianday(?3) AS INTEGER), CAST(julianday(?4) AS INTEGER), 'Pending', CAST(round(?5 * 100) AS INTEGER)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM Bookings
+            WHERE listing_id = ?1 AND status = 'Approved'
+            AND start_date <= CAST(julianday(?4) AS INTEGER) AND end_date >= CAST(julianday(?3) AS INTEGER)
+        )
+    """,
+    "booking.all": """
+        SELECT B.id, L.title, B.customer_name, date(B.start_date + 0.5), date(B.end_date + 0.5), B.status
+        FROM Bookings B
+        JOIN Listings L ON B.listing_id = L.id
+        ORDER BY B.id
+    """,
+    "booking.page_after": """
+        SELECT B.id, L.title, B.customer_name, date(B.start_date + 0.5), date(B.end_date + 0.5), B.status
+        FROM Bookings B
+        JOIN Listings L ON B.listing_id = L.id
+        WHERE B.id > ?
+        ORDER BY B.id LIMIT ?
+    """,
+    "booking.page_before": """
+        SELECT B.id, L.title, B.customer_name, date(B.start_date + 0.5), date(B.end_date + 0.5), B.status
+        FROM Bookings B
+        JOIN Listings L ON B.listing_id = L.id
+        WHERE B.id < ?
+        ORDER BY B.id DESC LIMIT ?
+    """,
+    "booking.pending": """
+        SELECT id, listing_id, customer_name, date(start_date + 0.5), date(end_date + 0.5), status
+        FROM Bookings WHERE status = 'Pending'
+    """,
+    "booking.span": "SELECT listing_id, date(start_date + 0.5), date(end_date + 0.5) FROM Bookings WHERE id = ?",
+    "booking.delete_from": "DELETE FROM Bookings WHERE listing_id = ? AND start_date >= CAST(julianday(?) AS INTEGER)",
+    "approval.pending": """
+        SELECT B.id, B.listing_id, B.start_date, B.end_date,
+               COALESCE(B.total, (B.end_date - B.start_date + 1) * L.price_per_day) / 100.0
+        FROM Bookings B
+        JOIN Listings L ON L.id = B.listing_id
+        WHERE B.status = 'Pending' AND (?1 IS NULL OR B.listing_id = ?1)
+        AND (?2 IS NULL OR B.end_date >= CAST(julianday(?2) AS INTEGER))
+        AND (?3 IS NULL OR B.start_date <= CAST(julianday(?3) AS INTEGER))
+        ORDER BY B.listing_id, B.id
+    """,
+    "approval.listing_bookings": """
+        SELECT id, status, start_date, end_date
+        FROM Bookings
+        WHERE listing_id = ?1 AND status IN ('Approved', 'Pending')
+        AND start_date <= CAST(julianday(?3) AS INTEGER) AND end_date >= CAST(julianday(?2) AS INTEGER)
+    """,
+    "analytics.listings": "SELECT id, price_per_day / 100.0, host_name, location FROM Listings ORDER BY id",
+    "analytics.spans": """
+        SELECT listing_id, start_date, end_date,
+               CASE status WHEN 'Pending' THEN 0 WHEN 'Approved' THEN 1 ELSE 2 END
+        FROM Bookings
+        WHERE start_date <= CAST(julianday(?) AS INTEGER) AND end_date >= CAST(julianday(?) AS INTEGER)
+    """,
+    "analytics.approved": """
+        SELECT listing_id, start_date, end_date, COALESCE(total, -1)
+        FROM Bookings WHERE status = 'Approved'
+        AND start_date <= CAST(julianday(?) AS INTEGER) AND end_date >= CAST(julianday(?) AS INTEGER)
+    """,
+    "earnings.by_listing": """
+        SELECT L.id, L.title, L.host_name,
+               COALESCE(SUM(COALESCE(B.total, (B.end_date - B.start_date + 1) * L.price_per_day)), 0) / 100.0 AS earnings
+        FROM Listings L
+        LEFT JOIN Bookings B ON L.id = B.listing_id AND B.status = 'Approved'
+        GROUP BY L.id, L.title, L.host_name
+        ORDER BY earnings DESC
+    """,
+    "earnings.archived": """
+        SELECT A.listing_id, (SUM(A.quoted_cents) + (SUM(A.approved_nights) - SUM(A.quoted_nights)) * L.price_per_day) / 100.0
+        FROM ArchivedEarnings A
+        JOIN Listings L ON L.id = A.listing_id
+        GROUP BY A.listing_id
+    """,
+    "earnings.summary": """
+        SELECT L.id, L.title, L.host_name,
+               COALESCE(E.quoted_cents + (E.approved_nights - E.quoted_nights) * L.price_per_day, 0) / 100.0 AS earnings
+        FROM Listings L
+        LEFT JOIN ListingEarnings E ON E.listing_id = L.id
+        ORDER BY earnings DESC
+    """,
+    "earnings.monthly": """
+        SELECT M.listing_id, M.month, M.approved_nights,
+               (M.quoted_cents + (M.approved_nights - M.quoted_nights) * L.price_per_day) / 100.0
+        FROM ListingEarningsMonthly M
+        JOIN Listings L ON L.id = M.listing_id
+        WHERE M.approved_nights != 0
+        ORDER BY M.listing_id, M.month
+    """,
+    "earnings.monthly_for_listing": """
+        SELECT M.listing_id, M.month, M.approved_nights,
+               (M.quoted_cents + (M.approved_nights - M.quoted_nights) * L.price_per_day) / 100.0
+        FROM ListingEarningsMonthly M
+        JOIN Listings L ON L.id = M.listing_id
+        WHERE M.listing_id = ? AND M.approved_nights != 0
+        ORDER BY M.month
+    """,
+}
+COMPACT_STATEMENTS = dict(STATEMENTS, **COMPACT_STATEMENTS)
+
+
+class SchemaOutdated(sqlite3.DatabaseError):
+    """Raised when a database needs `python migrations.py` before this version can use it"""
+
+
+def require_columns(conn, table, columns):
+    """Raise SchemaOutdated unless `table` has every one of `columns`"""
+    missing = set(columns) - {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if missing:
+        raise SchemaOutdated(f"{table} has no {', '.join(sorted(missing))} column. Please run 'python migrations.py' first.")
+
+
+def configure_connection(conn):
+    """Apply the per-connection PRAGMAs from config"""
+    for pragma, value in config.CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {pragma} = {value}")
+
+
+class ConnectionPool:
+    """Pool of configured SQLite connections for one database file
+
+    Acquiring is re-entrant per thread: a nested acquire (e.g. create_booking
+    calling view_listings) gets the connection its thread already holds.
+    At most `size` idle connections are kept; extras are closed on release.
+    """
+
+    def __init__(self, database, size=config.POOL_SIZE):
+        self.database = database
+        self.size = size
+        self.connections_opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=config.BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=config.STATEMENT_CACHE_SIZE,
+            factory=profiling.connection_factory(),
+        )
+        configure_connection(conn)
+        with self._lock:
+            self.connections_opened += 1
+        return conn
+
+    def acquire(self):
+        """Borrow a connection, reusing the one this thread already holds"""
+        held = getattr(self._local, "held", None)
+        if held:
+            held[1] += 1
+            return held[0]
+
+        conn = None
+        with self._lock:
+            if self._idle:
+                conn = self._idle.pop()
+        if conn is None:
+            conn = self._connect()
+        self._local.held = [conn, 1]
+        return conn
+
+    def release(self, conn):
+        """Return a connection; uncommitted work is rolled back"""
+        held = getattr(self._local, "held", None)
+        if held and held[0] is conn:
+            held[1] -= 1
+            if held[1] > 0:
+                return
+            self._local.held = None
+
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Context manager around acquire/release"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(database=None):
+    """Return the shared pool for a database file (defaults to DATABASE_NAME)"""
+    database = database or config.DATABASE_NAME
+    with _pools_lock:
+        pool = _pools.get(database)
+        if pool is None:
+            pool = _pools[database] = ConnectionPool(database)
+        return pool
+
+
+def connection(database=None):
+    """Borrow a pooled connection: `with repository.connection() as conn:`"""
+    return get_pool(database).connection()
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+@contextmanager
+def write_transaction(conn, retries=None):
+    """Run a block inside BEGIN IMMEDIATE, committing on success
+
+    Taking the write lock up front means a read-then-write block can never
+    be invalidated by a concurrent writer. If the lock is still busy after
+    the connection's busy timeout, BEGIN is retried with backoff. When the
+    connection is already in a transaction the block simply joins it.
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+
+    retries = config.WRITE_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            break
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == retries:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+@contextmanager
+def read_transaction(conn):
+    """Run a block of reads inside a deferred BEGIN, so they share one snapshot
+
+    No lock is taken until the first read, and never the write lock, so
+    readers do not queue behind writers in WAL mode. When the connection is
+    already in a transaction the block simply joins it.
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.commit()
+
+
+def database_file(conn):
+    """Return the file path of a connection's main database ('' for in-memory)"""
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+
+def execute(conn, name, params=()):
+    """Run a named statement for the connection's storage format and return the cursor"""
+    statements = COMPACT_STATEMENTS if storage.is_compact(conn) else STATEMENTS
+    return conn.execute(statements[name], params)
+
+
+def executemany(conn, name, seq_of_params):
+    """Run a named statement once per parameter tuple and return the cursor"""
+    statements = COMPACT_STATEMENTS if storage.is_compact(conn) else STATEMENTS
+    return conn.executemany(statements[name], seq_of_params)
+
+
+@atexit.register
+def close_all():
+    """Close all pooled connections (registered at exit)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
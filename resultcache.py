@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Read-through result cache for House Rental CLI
+
+Listing pages, searches and availability lookups repeat the same SQL (and
+the same tabulate formatting) every time the menu or API is used, even when
+nothing has changed. cached() keeps their results in one bounded LRU,
+keyed by database, statement name and parameters, with an optional TTL:
+
+    RESULT_CACHE_SIZE  entries kept across all databases (0 disables the cache)
+    RESULT_CACHE_TTL   seconds an entry may be served, None for no limit
+
+Entries of a database are dropped whenever it may have changed:
+
+    other connections  PRAGMA data_version, checked on every lookup, changes
+                       when any other connection or process commits
+    own writes         services.py and bulk.py call invalidate() after a write,
+                       since a connection's data_version ignores its own commits
+
+Inside an open transaction results may include uncommitted writes, so they
+are computed but not cached. Cached values are shared: callers must not
+mutate them. stats() returns the hit/miss counters used to size the cache;
+they are also served by `GET /stats/cache` and included in profiles.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+import config
+import repository
+import storage
+
+COUNTERS = ("hits", "misses", "bypassed", "expired", "evictions", "invalidations")
+
+
+class ResultCache:
+    """LRU of query results per (database, key), flushed per database"""
+
+    def __init__(self, size=config.RESULT_CACHE_SIZE, ttl=config.RESULT_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._lock = threading.Lock()
+
+    def _check_version(self, conn, database):
+        """Flush `database` if another connection committed since `conn` last looked"""
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if conn.data_version != version:
+            # A connection seen for the first time (or after its own writes) has no trusted baseline
+            self.invalidate(database)
+            conn.data_version = version
+
+    def get(self, conn, key, compute):
+        """Return the cached result for `key`, computing and storing it on a miss"""
+        database = repository.database_file(conn)
+        # In-memory databases have no name to key on; plain connections cannot remember data_version
+        if not self.size or not database or conn.in_transaction or not isinstance(conn, storage.Connection):
+            self._count("bypassed")
+            return compute()
+
+        self._check_version(conn, database)
+        full_key = (database, key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self.entries.get(full_key)
+            if entry is not None:
+                if entry[0] is None or entry[0] > now:
+                    self.entries.move_to_end(full_key)
+                    self.counters["hits"] += 1
+                    return entry[1]
+                del self.entries[full_key]
+                self.counters["expired"] += 1
+            self.counters["misses"] += 1
+            generation = self.generations.get(database, 0)
+
+        value = compute()
+        with self._lock:
+            # A write invalidated the database while we computed; the value may be stale
+            if self.generations.get(database, 0) == generation:
+                self.entries[full_key] = (now + self.ttl if self.ttl else None, value)
+                self.entries.move_to_end(full_key)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+                    self.counters["evictions"] += 1
+        return value
+
+    def invalidate(self, database):
+        """Drop every entry of `database`"""
+        with self._lock:
+            self.generations[database] = self.generations.get(database, 0) + 1
+            for key in [key for key in self.entries if key[0] == database]:
+                del self.entries[key]
+            self.counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.counters = dict.fromkeys(COUNTERS, 0)
+
+    def stats(self):
+        """Counters plus current size, capacity, TTL and hit rate"""
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return dict(self.counters, entries=len(self.entries), size=self.size, ttl=self.ttl,
+                        hit_rate=self.counters["hits"] / lookups if lookups else 0.0)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+
+_cache = ResultCache()
+
+
+def cached(conn, key, compute):
+    """Return compute()'s result for `key` on the connection's database, from the cache when possible"""
+    return _cache.get(conn, key, compute)
+
+
+def invalidate(conn):
+    """Forget the cached results of the connection's database after writing through `conn`"""
+    _cache.invalidate(repository.database_file(conn))
+    if isinstance(conn, storage.Connection):
+        # The write may belong to a transaction committed later; re-check on the next lookup
+        conn.data_version = None
+
+
+def stats():
+    return _cache.stats()
+
+
+def clear():
+    """Drop every entry and reset the counters"""
+    _cache.clear()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Full-text listing search for House Rental CLI
+
+ListingsFts is an external-content FTS5 index over Listings(title, location,
+host_name), kept in sync by triggers. Every word of a query is matched as a
+prefix and results are ranked with bm25 (title weighted above location
+above host). Queries are built by facets.find_listings, which combines the text
+match with the other listing filters.
+"""
+
+import re
+import repository
+
+# bm25 column weights for title, location, host_name
+RANK_WEIGHTS = (3.0, 2.0, 1.0)
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS ListingsFts USING fts5(
+        title, location, host_name,
+        content='Listings', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='1 2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_fts_ai AFTER INSERT ON Listings
+    BEGIN
+        INSERT INTO ListingsFts (rowid, title, location, host_name)
+        VALUES (NEW.id, NEW.title, NEW.location, NEW.host_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_fts_ad AFTER DELETE ON Listings
+    BEGIN
+        INSERT INTO ListingsFts (ListingsFts, rowid, title, location, host_name)
+        VALUES ('delete', OLD.id, OLD.title, OLD.location, OLD.host_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listings_fts_au AFTER UPDATE OF title, location, host_name ON Listings
+    BEGIN
+        INSERT INTO ListingsFts (ListingsFts, rowid, title, location, host_name)
+        VALUES ('delete', OLD.id, OLD.title, OLD.location, OLD.host_name);
+        INSERT INTO ListingsFts (rowid, title, location, host_name)
+        VALUES (NEW.id, NEW.title, NEW.location, NEW.host_name);
+    END
+    """,
+]
+
+_ready = set()
+
+
+def ensure_schema(conn):
+    """Create the FTS5 index and its triggers, building it on first use"""
+    key = repository.database_file(conn)
+    if key and key in _ready:
+        return
+    # Join a caller's open transaction instead of committing it early
+    owns_transaction = not conn.in_transaction
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ListingsFts'"
+    ).fetchone()
+    for statement in SCHEMA_STATEMENTS:
+        conn.execute(statement)
+    if not exists:
+        rebuild(conn)
+    if owns_transaction:
+        conn.commit()
+        _ready.add(key)
+
+
+def rebuild(conn):
+    """Rebuild the FTS5 index from Listings"""
+    conn.execute("INSERT INTO ListingsFts (ListingsFts) VALUES ('rebuild')")
+
+
+def to_match_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix
+
+    Returns None when the text has no searchable words.
+    """
+    words = re.findall(r"\w+", text or "")
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Non-interactive operations for House Rental CLI
+
+These functions hold the business rules behind the menu actions without any
+prompting or printing, so the interactive menu, the batch command mode and
+other front ends share one implementation.
+
+Writes run inside repository.write_transaction: they join the caller's
+transaction when there is one (so a batch commits once) and otherwise take
+the write lock with BEGIN IMMEDIATE and commit on their own. Overlap checks
+are part of the INSERT/UPDATE statement itself, so two agents booking or
+approving the same dates at once cannot both succeed.
+
+Listing searches and availability lookups are served through resultcache.py;
+every write here invalidates it.
+
+occupancy and analytics need NumPy, so they are imported by the functions that
+use them; command-mode calls that never touch them start faster.
+"""
+
+import sys
+from datetime import date, datetime, timedelta
+import repository
+import availability
+import earnings
+import pagination
+import facets
+import approvals
+import pricing
+import resultcache
+from config import DATE_FORMAT, VALID_STATUSES, APPROVAL_POLICIES
+
+
+class ServiceError(ValueError):
+    """Raised when an operation breaks a validation or business rule"""
+
+
+def validate_date(date_string):
+    """Validate date format"""
+    try:
+        # Plain YYYY-MM-DD skips strptime, whose first call imports _strptime and locale
+        if len(date_string) == 10 and date_string[4] == date_string[7] == "-" and date_string.isascii():
+            date.fromisoformat(date_string)
+        else:
+            datetime.strptime(date_string, DATE_FORMAT)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _loaded_occupancy():
+    """The occupancy module if it has been imported; otherwise no cache exists to keep up to date"""
+    return sys.modules.get("occupancy")
+
+
+def _require_text(value, field):
+    value = (value or "").strip()
+    if not value:
+        raise ServiceError(f"{field} cannot be empty.")
+    return value
+
+
+def _require_dates(start_date, end_date):
+    if not (validate_date(start_date) and validate_date(end_date)):
+        raise ServiceError("Invalid date format. Please use YYYY-MM-DD.")
+    if end_date < start_date:
+        raise ServiceError("End date must be after start date.")
+
+
+# ---------------------- Listings ----------------------
+def add_listing(conn, title, location, price_per_day, host_name):
+    """Insert a listing and return its id"""
+    title = _require_text(title, "Title")
+    location = _require_text(location, "Location")
+    host_name = _require_text(host_name, "Host name")
+    if price_per_day is None or float(price_per_day) <= 0:
+        raise ServiceError("Price per day must be a positive number.")
+    with repository.write_transaction(conn):
+        cursor = repository.execute(conn, "listing.insert", (title, location, float(price_per_day), host_name))
+    resultcache.invalidate(conn)
+    occupancy = _loaded_occupancy()
+    if occupancy:
+        occupancy.listing_added(conn, cursor.lastrowid)
+    return cursor.lastrowid
+
+
+def list_listings(conn):
+    """Return (id, title, location, price_per_day, host_name) for every listing"""
+    return repository.execute(conn, "listing.all").fetchall()
+
+
+def iter_listings(conn):
+    """Like list_listings, but yields rows from the cursor without materializing them"""
+    return pagination.iter_cursor(repository.execute(conn, "listing.all"))
+
+
+def search_listings(conn, text=None, min_price=None, max_price=None, limit=None,
+                    location=None, host=None, free_from=None, free_to=None):
+    """Return listings matching every given facet
+
+    text matches words in title, location or host (ranked by relevance);
+    location is a case-insensitive prefix; host is an exact, case-insensitive
+    name; free_from/free_to keep only listings with no approved booking in
+    that range. Without text, results are ordered by price.
+    """
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise ServiceError("Minimum price cannot be above maximum price.")
+    if free_from or free_to:
+        _require_dates(free_from, free_to)
+    key = ("listing.search", text, min_price, max_price, location, host, free_from, free_to, limit)
+    return resultcache.cached(conn, key, lambda: facets.find_listings(
+        conn, text=text, min_price=min_price, max_price=max_price, location=location,
+        host=host, free_from=free_from, free_to=free_to, limit=limit))
+
+
+def available_listings(conn, start_date, end_date):
+    """Return (id, title, location, price_per_day) of listings free for the range"""
+    _require_dates(start_date, end_date)
+    return resultcache.cached(conn, ("listing.available", start_date, end_date),
+                              lambda: availability.free_listings(conn, start_date, end_date))
+
+
+def listing_available(conn, listing_id, start_date, end_date):
+    """Return True if the listing has no approved booking in the range"""
+    _require_dates(start_date, end_date)
+    return availability.is_available(conn, listing_id, start_date, end_date)
+
+
+# ---------------------- Bookings ----------------------
+def _iso(date_string):
+    """A validated date as 'YYYY-MM-DD'"""
+    return datetime.strptime(date_string, DATE_FORMAT).date().isoformat()
+
+
+def create_booking(conn, listing_id, customer_name, start_date, end_date):
+    """Insert a Pending booking unless an approved booking overlaps; return its id
+
+    The booking stores its quoted total (see pricing.py), which earnings count.
+    """
+    customer_name = _require_text(customer_name, "Customer name")
+    _require_dates(start_date, end_date)
+    with repository.write_transaction(conn):
+        quote = pricing.quote(conn, listing_id, _iso(start_date), _iso(end_date))
+        if quote is None:
+            raise ServiceError("Invalid listing ID.")
+        cursor = repository.execute(conn, "booking.insert_if_free",
+                                    (listing_id, customer_name, start_date, end_date, quote.total))
+        if cursor.rowcount == 0:
+            raise ServiceError("This listing is already booked for the selected dates.")
+    resultcache.invalidate(conn)
+    return cursor.lastrowid
+
+
+def list_bookings(conn):
+    """Return (id, listing title, customer, start, end, status) for every booking"""
+    return repository.execute(conn, "booking.all").fetchall()
+
+
+def iter_bookings(conn):
+    """Like list_bookings, but yields rows from the cursor without materializing them"""
+    return pagination.iter_cursor(repository.execute(conn, "booking.all"))
+
+
+def update_booking_status(conn, booking_id, status):
+    """Move a Pending booking to Approved or Rejected
+
+    Approval re-checks overlaps inside the UPDATE, so it fails if another
+    approved booking for the listing now covers any of the same nights.
+    """
+    status = (status or "").strip().capitalize()
+    if status not in VALID_STATUSES[1:]:
+        raise ServiceError("Invalid status. Must be Approved or Rejected.")
+    name = "booking.approve_if_free" if status == "Approved" else "booking.reject_pending"
+    with repository.write_transaction(conn):
+        if repository.execute(conn, name, (booking_id,)).rowcount:
+            span = repository.execute(conn, "booking.span", (booking_id,)).fetchone()
+        else:
+            span = None
+            result = repository.execute(conn, "booking.status", (booking_id,)).fetchone()
+    if span:
+        resultcache.invalidate(conn)
+        occupancy = _loaded_occupancy()
+        if status == "Approved" and occupancy:
+            occupancy.booking_changed(conn, *span, occupied=True)
+        return
+    if not result:
+        raise ServiceError("Invalid booking ID.")
+    if result[0] != "Pending":
+        raise ServiceError(f"Booking is already {result[0]}. Only Pending bookings can be updated.")
+    raise ServiceError("Cannot approve: the listing is already booked for some of these dates.")
+
+
+def approve_pending(conn, listing_id=None, start_date=None, end_date=None, policy="first_come", dry_run=False):
+    """Approve or reject every selected Pending booking in one transaction and return the decisions
+
+    Selects the Pending bookings of one listing and/or overlapping a date
+    window (all of them when neither is given). Where they conflict, `policy`
+    picks the winner and the rest are rejected; see approvals.py. Returns
+    approvals.Decision rows; with dry_run nothing is written.
+    """
+    if start_date or end_date:
+        _require_dates(start_date, end_date)
+    if policy not in APPROVAL_POLICIES:
+        raise ServiceError(f"Invalid policy. Must be one of: {', '.join(APPROVAL_POLICIES)}.")
+    decisions = approvals.approve_pending(conn, listing_id, start_date, end_date, policy, dry_run)
+    if decisions and not dry_run:
+        resultcache.invalidate(conn)
+    occupancy = _loaded_occupancy()
+    if occupancy and not dry_run:
+        for decision in decisions:
+            if decision.status == "Approved":
+                occupancy.booking_changed(conn, decision.listing_id, decision.start_date, decision.end_date, occupied=True)
+    return decisions
+
+
+def cancel_booking(conn, booking_id):
+    """Delete a Pending booking
+
+    Pending bookings hold no nights, so the occupancy cache is unaffected.
+    """
+    with repository.write_transaction(conn):
+        cursor = repository.execute(conn, "booking.delete_pending", (booking_id,))
+    if cursor.rowcount == 0:
+        raise ServiceError("Booking not found or cannot be cancelled.")
+    resultcache.invalidate(conn)
+
+
+# ---------------------- Pricing ----------------------
+def quote_booking(conn, listing_id, start_date, end_date):
+    """Return the pricing.Quote of a stay: nights, subtotal, length-of-stay discount and total"""
+    _require_dates(start_date, end_date)
+    quote = pricing.quote(conn, listing_id, _iso(start_date), _iso(end_date))
+    if quote is None:
+        raise ServiceError("Invalid listing ID.")
+    return quote
+
+
+def _require_listing(conn, listing_id):
+    if not repository.execute(conn, "listing.exists", (listing_id,)).fetchone():
+        raise ServiceError("Invalid listing ID.")
+
+
+def set_rate_plan(conn, listing_id, weekend_uplift=None, weekly_discount=None, monthly_discount=None):
+    """Set a listing's weekend uplift and weekly/monthly discounts (percent; None keeps a setting)"""
+    if weekend_uplift is not None and weekend_uplift < 0:
+        raise ServiceError("Weekend uplift cannot be negative.")
+    for value in (weekly_discount, monthly_discount):
+        if value is not None and not 0 <= value <= 100:
+            raise ServiceError("Discounts must be between 0 and 100 percent.")
+    _require_listing(conn, listing_id)
+    pricing.set_plan(conn, listing_id, weekend_uplift, weekly_discount, monthly_discount)
+
+
+def add_seasonal_rate(conn, listing_id, start_date, end_date, price_per_day):
+    """Charge price_per_day for the nights from start_date to end_date (inclusive)"""
+    _require_dates(start_date, end_date)
+    if price_per_day <= 0:
+        raise ServiceError("Price must be positive.")
+    _require_listing(conn, listing_id)
+    pricing.add_season(conn, listing_id, _iso(start_date), _iso(end_date), price_per_day)
+
+
+# ---------------------- Reports ----------------------
+def occupancy_report(conn, start_date, end_date, nights=1):
+    """Return (id, title, location, booked_nights, occupancy_pct, next_free_start) per listing
+
+    next_free_start is the first date from start_date with `nights` free
+    nights in a row inside the range, or None.
+    """
+    _require_dates(start_date, end_date)
+    if nights < 1:
+        raise ServiceError("Number of nights must be at least 1.")
+    import occupancy
+    ids, booked, rates = occupancy.occupancy(conn, start_date, end_date)
+    _, offsets = occupancy.first_free_window(conn, nights, start_date, end_date)
+    first = date.fromisoformat(start_date)
+    stats = {int(listing_id): (int(nights_booked), round(float(rate) * 100, 1), int(offset))
+             for listing_id, nights_booked, rate, offset in zip(ids, booked, rates, offsets)}
+    rows = []
+    for listing_id, title, location, _, _ in iter_listings(conn):
+        nights_booked, pct, offset = stats.get(listing_id, (0, 0.0, 0))
+        free_start = (first + timedelta(days=offset)).isoformat() if offset >= 0 else None
+        rows.append((listing_id, title, location, nights_booked, pct, free_start))
+    return rows
+
+
+
+def revenue_report(conn, start_date, end_date, by=("month",), top=None, metric="revenue"):
+    """Return (*group labels, booked_nights, occupancy_pct, revenue, adr) rows for a date window
+
+    With `top`, only that many groups of the single `by` dimension, best
+    `metric` first.
+    """
+    _require_dates(start_date, end_date)
+    import analytics
+    try:
+        if top:
+            if len(by) != 1:
+                raise ServiceError("Top reports need exactly one grouping.")
+            return analytics.top(conn, start_date, end_date, by[0], metric, top)
+        return analytics.revenue_report(conn, start_date, end_date, by)
+    except ServiceError:
+        raise
+    except ValueError as e:
+        raise ServiceError(str(e))
+
+
+def status_report(conn, start_date, end_date, by=("month",)):
+    """Return (*group labels, approved, pending, rejected, pending_pct, rejected_pct) night counts"""
+    _require_dates(start_date, end_date)
+    import analytics
+    try:
+        return analytics.status_report(conn, start_date, end_date, by)
+    except ValueError as e:
+        raise ServiceError(str(e))
+
+
+def earnings_report(conn):
+    """Return (id, title, host_name, earnings) per listing, highest first"""
+    return earnings.earnings_by_listing(conn)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Sharded storage for House Rental CLI
+
+With config.SHARDS set, listings and their bookings live in several database
+files, each with its own write lock, so bookings in different shards never
+wait for each other:
+
+    SHARDS     (name, database file) pairs; the first is the default shard
+    SHARD_KEY  "city": a new listing goes to the shard named after the city
+               part of its location, or the default shard
+               "host": to crc32(host_name) % number of shards
+
+Shard n allocates listing and booking ids from n << SHARD_ID_BITS, so every id
+is unique across shards and names its shard: writes about an existing
+listing or booking go straight to `id >> SHARD_ID_BITS` without a lookup, and
+rows stay where they were first written. An existing database becomes the
+default shard unchanged.
+
+Reads that span shards (listing pages, search, availability, earnings) are
+scattered to every shard in parallel threads, since sqlite3 releases the GIL
+while a query runs, and the sorted per-shard results are merged. Without
+SHARDS everything here works on the single DATABASE_NAME file.
+
+Usage:
+    python sharding.py --init      # create missing shard files and id ranges
+    python sharding.py             # listings and bookings per shard
+"""
+
+import argparse
+import heapq
+import itertools
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+import config
+import repository
+import pagination
+import migrations
+from services import ServiceError
+from config import PAGE_SIZE, SHARD_ID_BITS, TABLE_FORMAT
+
+
+class ShardMap:
+    """Shard names and files, and the routing of listings and ids to them"""
+
+    def __init__(self, shards, key="city"):
+        if key not in ("city", "host"):
+            raise ValueError(f"Unknown shard key {key!r}; use 'city' or 'host'")
+        self.names = [name for name, _ in shards]
+        self.databases = [database for _, database in shards]
+        self.key = key
+        self._cities = {name.strip().lower(): index for index, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.databases)
+
+    def for_listing(self, location, host_name):
+        """Index of the shard a new listing belongs to"""
+        if self.key == "host":
+            return zlib.crc32((host_name or "").strip().lower().encode()) % len(self)
+        city = (location or "").split(",")[0].strip().lower()
+        return self._cities.get(city, 0)
+
+    def for_id(self, record_id):
+        """Index of the shard holding a listing or booking id"""
+        index = int(record_id) >> SHARD_ID_BITS
+        if not 0 <= index < len(self):
+            raise ServiceError(f"ID {record_id} does not belong to any shard.")
+        return index
+
+
+def enabled():
+    return bool(config.SHARDS)
+
+
+def current(database=None):
+    """The configured ShardMap, or a single-shard map of `database` when given or sharding is off"""
+    if database or not config.SHARDS:
+        return ShardMap([("default", database or config.DATABASE_NAME)])
+    return ShardMap(config.SHARDS, config.SHARD_KEY)
+
+
+def connection_for_listing(location, host_name, shard_map=None):
+    """Pooled connection to the shard a new listing belongs to"""
+    shard_map = shard_map or current()
+    return repository.connection(shard_map.databases[shard_map.for_listing(location, host_name)])
+
+
+def connection_for_id(record_id, shard_map=None):
+    """Pooled connection to the shard holding a listing or booking id"""
+    shard_map = shard_map or current()
+    return repository.connection(shard_map.databases[shard_map.for_id(record_id)])
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _workers():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(config.SHARD_WORKERS, thread_name_prefix="shard")
+        return _executor
+
+
+def run_parallel(jobs, connect=repository.connection):
+    """Run fn(conn) for every (database, fn) job and return the results in job order
+
+    A single job runs in the calling thread, so it shares the connection the
+    thread may already hold; several run in the shard worker threads.
+    """
+    def run(job):
+        database, fn = job
+        with connect(database) as conn:
+            return fn(conn)
+
+    if len(jobs) == 1:
+        return [run(jobs[0])]
+    return list(_workers().map(run, jobs))
+
+
+def scatter(fn, shard_map=None, only=None, connect=repository.connection):
+    """Run fn(conn) on every shard (or the shard indexes in `only`) and return the results in shard order"""
+    shard_map = shard_map or current()
+    indexes = sorted(set(only)) if only is not None else range(len(shard_map))
+    return run_parallel([(shard_map.databases[index], fn) for index in indexes], connect)
+
+
+_MISSING = object()
+
+
+def gather(parts, key=None, reverse=False, limit=None, interleave=False):
+    """Merge per-shard row lists
+
+    With `key` each part must already be sorted by it and the parts are
+    merged in order; otherwise they are concatenated in shard order, or taken
+    round-robin with interleave=True (for per-shard rankings that cannot be
+    compared, like full-text relevance).
+    """
+    if key is not None:
+        rows = heapq.merge(*parts, key=key, reverse=reverse)
+    elif interleave:
+        rows = (row for group in itertools.zip_longest(*parts, fillvalue=_MISSING) for row in group if row is not _MISSING)
+    else:
+        rows = itertools.chain.from_iterable(parts)
+    return list(itertools.islice(rows, limit) if limit else rows)
+
+
+def fetch_page(view, after=None, before=None, size=PAGE_SIZE, shard_map=None):
+    """pagination.fetch_page across every shard; ids grow with the shard index, so pages stay in id order"""
+    parts = scatter(lambda conn: pagination.fetch_page(conn, view, after, before, size), shard_map)
+    rows = gather(parts, key=lambda row: row[0])
+    return rows[-size:] if before is not None else rows[:size]
+
+
+def page_fetcher():
+    """fetch_page for pagination.browse when sharding is on, else None (browse the connection it is given)"""
+    return fetch_page if enabled() else None
+
+
+def _create(database):
+    conn = sqlite3.connect(database)
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        for table in ("Listings", "Bookings"):
+            conn.execute(migrations.create_table_sql(table))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def prepare(shard_map=None, progress=None):
+    """Create missing shard files with the current schema and start each shard's ids at its range"""
+    shard_map = shard_map or current()
+    for index, database in enumerate(shard_map.databases):
+        if not os.path.exists(database):
+            _create(database)
+            if progress:
+                progress(f"✓ Created shard {shard_map.names[index]} ({database})")
+        migrations.migrate(database)
+        low, high = index << SHARD_ID_BITS, (index + 1) << SHARD_ID_BITS
+        with repository.connection(database) as conn, repository.write_transaction(conn):
+            for table in ("Listings", "Bookings"):
+                first, last = conn.execute(f"SELECT MIN(id), MAX(id) FROM {table}").fetchone()
+                if first is not None and not (low <= first and last < high):
+                    raise ValueError(f"{database}: {table} ids {first}..{last} are outside shard {index}'s range")
+                # AUTOINCREMENT continues after the larger of sqlite_sequence and MAX(id)
+                if conn.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?", (low, table)).rowcount == 0:
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, low))
+
+
+def shard_status(shard_map=None):
+    """(name, file, listings, bookings) per shard"""
+    shard_map = shard_map or current()
+    counts = scatter(lambda conn: conn.execute(
+        "SELECT (SELECT COUNT(*) FROM Listings), (SELECT COUNT(*) FROM Bookings)").fetchone(), shard_map)
+    return [(name, database, *count) for name, database, count in zip(shard_map.names, shard_map.databases, counts)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Set up and inspect the database shards in config.SHARDS")
+    parser.add_argument("--init", action="store_true", help="create missing shard files and id ranges")
+    args = parser.parse_args(argv)
+    if not enabled():
+        print("Sharding is off: set SHARDS in config.py.")
+        return 1
+    try:
+        if args.init:
+            prepare(progress=print)
+        rows = shard_status()
+    except (ValueError, sqlite3.Error) as e:
+        print(f"❌ {e}")
+        return 1
+    from tabulate import tabulate
+    print(tabulate(rows, headers=["Shard", "File", "Listings", "Bookings"], tablefmt=TABLE_FORMAT))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
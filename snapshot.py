@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Snapshot reporting for House Rental CLI
+
+In WAL mode a long report does not block writers outright, but it pins the
+WAL: no checkpoint can get past its read snapshot, so the WAL keeps growing
+and every read and write slows while agents are creating and approving
+bookings. Reports can instead run on a copy of the database:
+
+    take()       copy the live file with the sqlite3 backup API; the live
+                 database is only read for the copy, in one read transaction,
+                 so the copy is consistent
+    reporting()  a one-shot snapshot for one report (`main.py --snapshot`)
+    replica()    a warm reporting replica per database, re-copied by a
+                 background thread every `lag` seconds (config.REPORT_REPLICA_LAG)
+
+Snapshots are files in SNAPSHOT_DIR (the temp directory by default) with
+their own connection pool, so the occupancy cache and derived-schema checks
+work on them as on any database. A replaced snapshot is deleted when its
+last reader finishes. Archived bookings (see archive.py) are found through
+the connection's source_database.
+"""
+
+import atexit
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, closing
+import config
+import repository
+
+# Modules that remember per-database state keyed by file name
+DERIVED_MODULES = ("availability", "earnings", "search", "facets", "changes", "pricing")
+
+
+class Snapshot:
+    """A consistent copy of a database, readable through its own pool"""
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        self.taken_at = time.time()
+        self.pool = repository.ConnectionPool(path)
+        self.readers = 0
+        self.retired = False
+        self._lock = threading.Lock()
+
+    @property
+    def age(self):
+        return time.time() - self.taken_at
+
+    def hold(self):
+        """Keep the snapshot file until the matching release()"""
+        with self._lock:
+            self.readers += 1
+
+    def release(self):
+        with self._lock:
+            self.readers -= 1
+            discard = self.retired and not self.readers
+        if discard:
+            self._discard()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection to the snapshot: `with snap.connection() as conn:`"""
+        self.hold()
+        try:
+            with self.pool.connection() as conn:
+                conn.source_database = self.source
+                yield conn
+        finally:
+            self.release()
+
+    def retire(self):
+        """Delete the snapshot once its last reader is done"""
+        with self._lock:
+            self.retired = True
+            discard = not self.readers
+        if discard:
+            self._discard()
+
+    def _discard(self):
+        self.pool.close_all()
+        key = os.path.abspath(self.path)
+        for name in DERIVED_MODULES + ("occupancy",):
+            module = sys.modules.get(name)
+            if module is None:
+                continue
+            if name == "occupancy":
+                module.forget(key)
+            else:
+                module._ready.discard(key)
+            if name == "pricing":
+                module.forget(key)
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except FileNotFoundError:
+                pass
+
+
+def take(database=None, directory=None):
+    """Copy `database` into a new snapshot file and return its Snapshot"""
+    database = database or config.DATABASE_NAME
+    stem = os.path.splitext(os.path.basename(database))[0]
+    fd, path = tempfile.mkstemp(prefix=f"{stem}.snapshot-", suffix=".db", dir=directory or config.SNAPSHOT_DIR)
+    os.close(fd)
+    try:
+        with closing(sqlite3.connect(database, timeout=config.BUSY_TIMEOUT)) as source, \
+                closing(sqlite3.connect(path)) as target:
+            # One step: the whole copy comes from a single read transaction
+            source.backup(target)
+            source_file = repository.database_file(source)
+    except BaseException:
+        os.remove(path)
+        raise
+    return Snapshot(path, source_file)
+
+
+@contextmanager
+def reporting(database=None):
+    """Connection to a fresh one-shot snapshot, deleted afterwards"""
+    snap = take(database)
+    try:
+        with snap.connection() as conn:
+            yield conn
+    finally:
+        snap.retire()
+
+
+class ReportingReplica:
+    """A snapshot of one database kept at most `lag` seconds old"""
+
+    def __init__(self, database=None, lag=None, directory=None):
+        self.database = database or config.DATABASE_NAME
+        self.lag = config.REPORT_REPLICA_LAG if lag is None else lag
+        if self.lag is None:
+            raise ValueError("A reporting replica needs a lag in seconds")
+        self.directory = directory
+        self.refreshes = 0
+        self.current = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """Take a new snapshot and retire the previous one"""
+        return self._publish(take(self.database, self.directory))
+
+    def _publish(self, snap):
+        with self._lock:
+            old, self.current = self.current, snap
+            self.refreshes += 1
+        if old:
+            old.retire()
+        return snap
+
+    def _run(self):
+        while not self._stop.wait(self.lag):
+            try:
+                self.refresh()
+            except sqlite3.Error as e:
+                print(f"⚠ Reporting replica refresh failed: {e}", file=sys.stderr)
+
+    def start(self):
+        """Refresh in a background thread every `lag` seconds (no-op if already running)"""
+        with self._lock:
+            if self._thread:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="report-replica", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop refreshing and delete the current snapshot"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            snap, self.current = self.current, None
+        self._stop.set()
+        if thread:
+            thread.join()
+        if snap:
+            snap.retire()
+
+    def _hold(self):
+        """Hold the current snapshot, refreshing first when missing or (with no refresher running) too old"""
+        with self._lock:
+            snap = self.current
+            if snap is not None and (self._thread is not None or snap.age <= self.lag):
+                # Held under the lock, so a concurrent refresh cannot delete it first
+                snap.hold()
+                return snap
+        snap = take(self.database, self.directory)
+        snap.hold()
+        return self._publish(snap)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection to the current snapshot"""
+        snap = self._hold()
+        try:
+            with snap.connection() as conn:
+                yield conn
+        finally:
+            snap.release()
+
+
+_replicas = {}
+_replicas_lock = threading.Lock()
+
+
+def replica(database=None, lag=None):
+    """Return the shared, running ReportingReplica of a database; `lag` only applies when it is created"""
+    database = database or config.DATABASE_NAME
+    with _replicas_lock:
+        rep = _replicas.get(database)
+        if rep is None:
+            rep = _replicas[database] = ReportingReplica(database, lag)
+    rep.start()
+    return rep
+
+
+def report_connection(database=None):
+    """Connection for a report: the replica when config.REPORT_REPLICA_LAG is set, else the live database"""
+    if config.REPORT_REPLICA_LAG is None:
+        return repository.connection(database)
+    return replica(database).connection()
+
+
+@atexit.register
+def close_all():
+    """Stop every replica and delete its snapshot (registered at exit)"""
+    with _replicas_lock:
+        replicas = list(_replicas.values())
+        _replicas.clear()
+    for rep in replicas:
+        rep.stop()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Storage formats for House Rental CLI
+
+Booking dates and listing prices are stored in one of two formats:
+
+    text     dates as 'YYYY-MM-DD' TEXT, prices as REAL (the default)
+    compact  dates as INTEGER day numbers, prices as INTEGER cents
+
+A day number is CAST(julianday(date) AS INTEGER), the same number the
+BookingSpans R*Tree and the occupancy arrays already use. Compact rows are
+smaller, overlap checks compare integers, and nights are a subtraction
+instead of two julianday() calls per row; cents also keep money exact.
+
+Callers never see the difference: they pass and get back ISO date strings and
+prices in currency units, so validate_date, DATE_FORMAT and CURRENCY_SYMBOL
+formatting are unchanged. A compact database runs the statements in
+repository.COMPACT_STATEMENTS, which convert parameters and results in SQL
+with the helpers below.
+
+Convert a database with `python migrations.py --storage compact` (or text).
+"""
+
+import sqlite3
+
+TEXT = "text"
+COMPACT = "compact"
+FORMATS = (TEXT, COMPACT)
+
+# CAST(julianday(d) AS INTEGER) minus date.toordinal()
+JULIAN_OFFSET = 1721424
+
+
+def day_sql(value):
+    """SQL turning a 'YYYY-MM-DD' expression into a day number"""
+    return f"CAST(julianday({value}) AS INTEGER)"
+
+
+def date_sql(value):
+    """SQL turning a day number expression back into 'YYYY-MM-DD'"""
+    # julianday() counts from noon, so a whole day number is noon of the day before
+    return f"date({value} + 0.5)"
+
+
+def cents_sql(value):
+    """SQL turning a price expression into integer cents"""
+    return f"CAST(round({value} * 100) AS INTEGER)"
+
+
+def price_sql(value):
+    """SQL turning an integer cents expression back into a price"""
+    return f"{value} / 100.0"
+
+
+class Connection(sqlite3.Connection):
+    """sqlite3 connection that remembers the storage format of its database
+
+    data_version and occupancy_version are the last PRAGMA data_version seen
+    by resultcache.py and occupancy.py; source_database is the live file a
+    snapshot.py copy was taken from.
+    """
+
+    storage_format = None
+    data_version = None
+    occupancy_version = None
+    source_database = None
+
+
+def detect(conn):
+    """Return the storage format of the database behind `conn`"""
+    for row in conn.execute("PRAGMA table_info(Bookings)"):
+        if row[1] == "start_date":
+            return COMPACT if row[2].upper() == "INTEGER" else TEXT
+    return TEXT
+
+
+def storage_format(conn):
+    """Return the storage format, detected once per pooled connection"""
+    fmt = getattr(conn, "storage_format", None)
+    if fmt is None:
+        fmt = detect(conn)
+        # Plain sqlite3 connections cannot carry attributes and detect every time
+        if isinstance(conn, Connection):
+            conn.storage_format = fmt
+    return fmt
+
+
+def is_compact(conn):
+    return storage_format(conn) == COMPACT
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Multi-process booking stress test for House Rental CLI
+
+Starts N worker processes that all create and approve bookings for the same
+listing over a short date window, so nearly every request collides with
+another. Afterwards it checks that no two approved bookings overlap and
+reports throughput.
+
+Usage:
+    python stress.py [--workers 8] [--operations 200] [--database FILE]
+"""
+
+import argparse
+import multiprocessing
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+import repository
+import services
+from services import ServiceError
+
+WINDOW_START = date(2030, 1, 1)
+WINDOW_DAYS = 60
+
+
+def worker(database, listing_id, operations, seed):
+    """Create-then-approve random stays; return (approved, conflicts, errors)"""
+    rng = random.Random(seed)
+    approved = conflicts = errors = 0
+    with repository.connection(database) as conn:
+        for _ in range(operations):
+            start = WINDOW_START + timedelta(days=rng.randrange(WINDOW_DAYS))
+            end = start + timedelta(days=rng.randrange(1, 5))
+            try:
+                booking_id = services.create_booking(conn, listing_id, f"worker-{seed}", start.isoformat(), end.isoformat())
+                services.update_booking_status(conn, booking_id, "Approved")
+                approved += 1
+            except ServiceError:
+                conflicts += 1
+            except sqlite3.OperationalError:
+                errors += 1
+    return approved, conflicts, errors
+
+
+def run(database, workers=8, operations=200, listing_id=1):
+    """Hammer one listing from `workers` processes and return a stats dict"""
+    with repository.connection(database) as conn:
+        repository.execute(conn, "booking.delete_from", (listing_id, WINDOW_START.isoformat()))
+        conn.commit()
+
+    context = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    with context.Pool(workers) as pool:
+        results = pool.starmap(worker, [(database, listing_id, operations, seed) for seed in range(workers)])
+    elapsed = time.perf_counter() - started
+
+    with repository.connection(database) as conn:
+        overlaps = repository.execute(conn, "booking.approved_overlaps").fetchall()
+
+    attempts = workers * operations
+    return {
+        "attempts": attempts,
+        "approved": sum(r[0] for r in results),
+        "conflicts": sum(r[1] for r in results),
+        "errors": sum(r[2] for r in results),
+        "overlaps": len(overlaps),
+        "seconds": elapsed,
+        "ops_per_sec": attempts / elapsed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent booking stress test")
+    parser.add_argument("--database", default=None, help="database file (default: config.DATABASE_NAME)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--operations", type=int, default=200, help="booking attempts per worker")
+    parser.add_argument("--listing", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    database = args.database or repository.get_pool().database
+    stats = run(database, args.workers, args.operations, args.listing)
+    print(f"Attempts: {stats['attempts']}, approved: {stats['approved']}, "
+          f"conflicts: {stats['conflicts']}, lock errors: {stats['errors']}")
+    print(f"Throughput: {stats['ops_per_sec']:.0f} booking attempts/sec over {stats['seconds']:.2f}s")
+    if stats["overlaps"]:
+        print(f"❌ {stats['overlaps']} overlapping approved booking pair(s) found!")
+        return 1
+    print("✓ No double-bookings.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
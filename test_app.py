@@ -5,7 +5,54 @@ Simple tests for House Rental CLI
 
 import sqlite3
 import os
-from config import DATABASE_NAME
+import tempfile
+import database
+import repository
+import availability
+import earnings
+import bulk
+import cli
+import pagination
+import search
+import facets
+import services
+import stress
+import datagen
+import benchmark
+import migrations
+import occupancy
+import analytics
+import api
+import profiling
+import debug
+import storage
+import archive
+import resultcache
+import sharding
+import changes
+import snapshot
+import features
+import config
+import re
+import subprocess
+import sys
+import http.client
+import io
+import json
+import contextlib
+import shutil
+import time
+from datetime import date, timedelta
+from unittest import mock
+from config import DATABASE_NAME, STARTUP_BUDGET_MS
+
+def make_temp_database():
+    """Create a throwaway database with the sample data and return its path"""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.remove(path)
+    database.create_tables_with_data(path)
+    return path
 
 def test_database_exists():
     """Test if database file exists"""
@@ -72,6 +119,1025 @@ def test_sample_data():
         print(f"✗ Database error: {e}")
         return False
 
+def test_connection_pool():
+    """Test that the pool reuses one configured connection"""
+    path = make_temp_database()
+    pool = repository.ConnectionPool(path)
+
+    with pool.connection() as outer:
+        with pool.connection() as inner:
+            assert inner is outer, "nested acquire should reuse the held connection"
+        assert outer.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+        assert outer.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        listings = repository.execute(outer, "listing.all").fetchall()
+    with pool.connection() as again:
+        assert again is outer, "released connection should be reused"
+
+    assert pool.connections_opened == 1
+    assert len(listings) == 8
+    pool.close_all()
+    print("✓ Connection pool reuses a single connection")
+    return True
+
+def test_availability_engine():
+    """Test overlap semantics and that the availability indexes are used"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        # Listing 1 has approved bookings 2025-01-05..10 and 2025-02-01..03
+        assert not availability.is_available(conn, 1, "2025-01-01", "2025-01-31"), "contained booking missed"
+        assert not availability.is_available(conn, 1, "2025-01-10", "2025-01-12")
+        assert availability.is_available(conn, 1, "2025-01-11", "2025-01-31")
+
+        free_ids = [row[0] for row in availability.free_listings(conn, "2025-01-01", "2025-01-31")]
+        assert 1 not in free_ids and 2 in free_ids and len(free_ids) == 7
+
+        conn.execute("UPDATE Bookings SET status = 'Approved' WHERE id = 2")
+        free_ids = [row[0] for row in availability.free_listings(conn, "2025-01-16", "2025-01-16")]
+        assert 2 not in free_ids, "R*Tree not updated on approval"
+        conn.execute("DELETE FROM Bookings WHERE id = 2")
+        free_ids = [row[0] for row in availability.free_listings(conn, "2025-01-16", "2025-01-16")]
+        assert 2 in free_ids, "R*Tree not updated on delete"
+        conn.rollback()
+
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN " + repository.STATEMENTS["booking.overlap_count"], (1, "2025-01-31", "2025-01-01")))
+        assert "idx_bookings_listing_status_dates" in plan, plan
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN " + repository.STATEMENTS["listing.available"], ("2025-01-31", "2025-01-01")))
+        assert "VIRTUAL TABLE" in plan, plan
+    print("✓ Availability engine finds overlapping and contained bookings")
+    return True
+
+def test_earnings_aggregates():
+    """Test that earnings aggregates follow booking and price changes"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        totals = {row[0]: row[3] for row in earnings.earnings_by_listing(conn)}
+        assert totals[1] == (6 + 3) * 80.0 and totals[2] == 0
+
+        # A booking spanning a month boundary is prorated into both months
+        conn.execute("INSERT INTO Bookings (listing_id, customer_name, start_date, end_date, status) "
+                     "VALUES (2, 'Test', '2025-03-30', '2025-04-02', 'Approved')")
+        conn.execute("UPDATE Bookings SET status = 'Approved' WHERE id = 5")
+        conn.execute("UPDATE Listings SET price_per_day = 100 WHERE id = 1")
+        conn.execute("DELETE FROM Bookings WHERE id = 4")
+        months = {row[1]: row[2] for row in earnings.monthly_earnings(conn, 2)}
+        assert months == {"2025-03": 2, "2025-04": 2}, months
+        assert earnings.verify(conn) == []
+
+        totals = {row[0]: row[3] for row in earnings.earnings_by_listing(conn)}
+        assert totals[1] == 6 * 100.0 and totals[2] == 4 * 120.0 and totals[4] == 6 * 60.0
+        conn.commit()
+
+    # A new process finds the schema in place without waiting for another writer's lock
+    writer = sqlite3.connect(path)
+    writer.execute("BEGIN IMMEDIATE")
+    with repository.connection(path) as conn:
+        earnings._ready.discard(repository.database_file(conn))
+        conn.execute("PRAGMA busy_timeout = 0")
+        earnings.ensure_schema(conn)
+        assert not conn.in_transaction and repository.database_file(conn) in earnings._ready
+        conn.execute(f"PRAGMA busy_timeout = {int(config.BUSY_TIMEOUT * 1000)}")
+    writer.rollback()
+    writer.close()
+    print("✓ Earnings aggregates match the full earnings query")
+    return True
+
+def test_bulk_import_export():
+    """Test streaming import validation and export round trip"""
+    path = make_temp_database()
+    records = [
+        {"listing_id": "1", "customer_name": "Bulk One", "start_date": "2025-03-01", "end_date": "2025-03-03", "status": "Approved"},
+        {"listing_id": "2", "customer_name": "Bulk Two", "start_date": "2025-03-05", "end_date": "2025-03-04"},
+        {"listing_id": "99", "customer_name": "No Listing", "start_date": "2025-03-01", "end_date": "2025-03-02"},
+        {"listing_id": "3", "customer_name": "", "start_date": "2025-03-01", "end_date": "2025-03-02"},
+        {"listing_id": "3", "customer_name": "Bad Date", "start_date": "2025-13-01", "end_date": "2025-03-02"},
+        {"listing_id": "3", "customer_name": "Bulk Three", "start_date": "2025-03-01", "end_date": "2025-03-02"},
+        {"listing_id": "1", "customer_name": "Overlap", "start_date": "2025-03-03", "end_date": "2025-03-04", "status": "Approved"},
+        {"listing_id": "1", "customer_name": "Old Overlap", "start_date": "2025-01-06", "end_date": "2025-01-07", "status": "Approved"},
+        {"id": "1", "listing_id": "4", "customer_name": "Taken Id", "start_date": "2025-03-01", "end_date": "2025-03-02"},
+    ]
+    with repository.connection(path) as conn:
+        result = bulk.import_records(conn, "bookings", records, chunk_size=2, progress=None)
+        assert result["imported"] == 2 and result["rejected"] == 7, result
+        assert [line for line, _ in result["errors"]] == [2, 3, 4, 5, 7, 8, 9], result["errors"]
+        assert repository.execute(conn, "booking.approved_overlaps").fetchall() == []
+        for price in ("nan", "inf"):
+            result = bulk.import_records(conn, "listings", [{"title": "T", "location": "L", "host_name": "H",
+                                                             "price_per_day": price}], progress=None)
+            assert result["rejected"] == 1, (price, result)
+        assert earnings.verify(conn) == []
+        assert not availability.is_available(conn, 1, "2025-03-02", "2025-03-02")
+
+        fd, export_path = tempfile.mkstemp(suffix=".jsonl")
+        os.close(fd)
+        assert bulk.export_file(conn, "bookings", export_path) == 7
+        with open(export_path) as handle:
+            exported = list(bulk.read_records(handle, "jsonl"))
+        os.remove(export_path)
+    assert exported[-1]["customer_name"] == "Bulk Three" and exported[-1]["status"] == "Pending"
+    print("✓ Bulk import validates rows and export round-trips")
+    return True
+
+def test_command_mode_batch():
+    """Test that a batch of commands runs in one transaction"""
+    path = make_temp_database()
+    fd, ops_path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(fd, "w") as handle:
+        handle.write("bookings create 5 'Batch Guest' 2025-04-01 2025-04-03\n")
+        handle.write("# approvals\n")
+        handle.write("bookings approve 2 6\n")
+        handle.write("availability 2025-04-02 2025-04-02 --format json\n")
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        assert cli.main(["--database", path, "--format", "json", "batch", ops_path]) == 0
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert results[1] == [{"id": 2, "status": "Approved"}, {"id": 6, "status": "Approved"}]
+    assert 5 not in [row["id"] for row in results[2]]
+
+    # A failing line rolls back the whole batch
+    with open(ops_path, "w") as handle:
+        handle.write("listings add --title Rollback --location Nowhere --price 10 --host Nobody\n")
+        handle.write("bookings approve 1\n")
+    with contextlib.redirect_stderr(io.StringIO()):
+        assert cli.main(["--database", path, "batch", ops_path]) == 1
+    os.remove(ops_path)
+    with repository.connection(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM Listings WHERE title = 'Rollback'").fetchone()[0] == 0
+
+    # Reads do not take the write lock, so they run while another connection holds it
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            assert cli.main(["--database", path, "--format", "json", "listings", "list"]) == 0
+        assert json.loads(out.getvalue())
+    finally:
+        writer.rollback()
+        writer.close()
+
+    # A reader that goes away (e.g. `| head`) ends the output quietly
+    class ClosedPipe(io.StringIO):
+        def write(self, text):
+            raise BrokenPipeError
+    assert cli.render(cli.Result(["id"], [(1,)], ()), "json", ClosedPipe()) is False
+    print("✓ Command mode runs batches in a single transaction")
+    return True
+
+def test_keyset_pagination():
+    """Test next/prev/jump pages and streamed table output"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        first = pagination.fetch_page(conn, "listings", size=3)
+        second = pagination.fetch_page(conn, "listings", after=first[-1][0], size=3)
+        back = pagination.fetch_page(conn, "listings", before=second[0][0], size=3)
+        jump = pagination.fetch_page(conn, "bookings", after=3, size=10)
+        assert [r[0] for r in first] == [1, 2, 3] and [r[0] for r in second] == [4, 5, 6]
+        assert back == first and [r[0] for r in jump] == [4, 5]
+
+        out = io.StringIO()
+        pagination.stream_table(pagination.iter_cursor(conn.execute("SELECT id FROM Listings"), 3), ["ID"], out, size=3)
+        assert out.getvalue().count("ID") == 3, "expected one table per 3-row chunk"
+    print("✓ Keyset pagination pages forward, back and by id")
+    return True
+
+def test_full_text_search():
+    """Test ranked prefix search, price filters and trigger sync"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        ids = [row[0] for row in facets.find_listings(conn, text="nair")]
+        assert sorted(ids) == [1, 6, 8], ids
+        assert [row[0] for row in facets.find_listings(conn, text="nair", max_price=85)] == [1]
+        assert [row[0] for row in facets.find_listings(conn, text="njeri")] == [5], "host name not searched"
+
+        conn.execute("INSERT INTO Listings (title, location, price_per_day, host_name) "
+                     "VALUES ('Nairobi Nairobi Loft', 'Nairobi, CBD', 50, 'Test Host')")
+        assert facets.find_listings(conn, text="nairobi")[0][1] == "Nairobi Nairobi Loft", "title matches should rank first"
+        conn.execute("UPDATE Listings SET location = 'Thika' WHERE id = 8")
+        conn.execute("DELETE FROM Listings WHERE id = 6")
+        assert 8 not in [row[0] for row in facets.find_listings(conn, text="ngong")]
+        assert 6 not in [row[0] for row in facets.find_listings(conn, text="karen")]
+        assert [row[0] for row in facets.find_listings(conn, text="thika")] == [8]
+        conn.rollback()
+    print("✓ Full-text search ranks prefix matches and stays in sync")
+    return True
+
+def test_facet_query_plans():
+    """Test combined facets and that each facet stays index-backed"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        rows = facets.find_listings(conn, location="nairobi", max_price=150, free_from="2025-01-06", free_to="2025-01-07")
+        assert [row[0] for row in rows] == [8], rows
+        assert [row[0] for row in facets.find_listings(conn, host="GRACE NJERI")] == [5]
+        assert [row[0] for row in facets.find_listings(conn, location="50%")] == []
+
+        # Check the plans the indexes are designed for; statistics from eight
+        # sample rows would let the planner pick any of them
+        conn.execute("DROP TABLE IF EXISTS sqlite_stat1")
+        conn.execute("ANALYZE sqlite_master")
+        expectations = [
+            (dict(min_price=50, max_price=100), "USING INDEX idx_listings_price"),
+            (dict(location="Nai", max_price=100), "USING INDEX idx_listings_location"),
+            (dict(host="Alice Mwangi"), "USING INDEX idx_listings_host"),
+            (dict(free_from="2025-01-01", free_to="2025-01-31"), "VIRTUAL TABLE INDEX 2"),
+            (dict(text="nai", min_price=10), "VIRTUAL TABLE INDEX 0:M"),
+        ]
+        for facet, expected in expectations:
+            lines = facets.explain(conn, **facet)
+            plan = " | ".join(lines)
+            assert expected in plan, f"{facet}: {plan}"
+            assert "SCAN L" not in lines, f"{facet} does a full scan of Listings: {plan}"
+    print("✓ Facet filters compose and use their indexes")
+    return True
+
+def test_concurrent_booking():
+    """Test that approval re-checks overlaps and N workers never double-book"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        first = services.create_booking(conn, 3, "First", "2025-06-01", "2025-06-05")
+        second = services.create_booking(conn, 3, "Second", "2025-06-04", "2025-06-08")
+        services.update_booking_status(conn, first, "Approved")
+        try:
+            services.update_booking_status(conn, second, "Approved")
+            assert False, "overlapping approval should be refused"
+        except services.ServiceError:
+            pass
+        assert not conn.in_transaction, "service writes should commit on their own"
+
+    stats = stress.run(path, workers=4, operations=25, listing_id=2)
+    assert stats["overlaps"] == 0, stats
+    assert stats["approved"] > 0 and stats["errors"] == 0, stats
+    print(f"✓ {stats['attempts']} concurrent booking attempts, no double-bookings ({stats['ops_per_sec']:.0f}/sec)")
+    return True
+
+def test_synthetic_data_and_benchmark():
+    """Test that generated bookings never overlap and the benchmark harness runs"""
+    records = list(datagen.generate_bookings(2000, range(1, 51), seed=7))
+    spans = {}
+    for record in records:
+        spans.setdefault(record["listing_id"], []).append((record["start_date"], record["end_date"]))
+    for listing_spans in spans.values():
+        listing_spans.sort()
+        for (_, end), (start, _) in zip(listing_spans, listing_spans[1:]):
+            assert end < start, f"overlap: {end} >= {start}"
+
+    data_dir = tempfile.mkdtemp()
+    results = benchmark.run_benchmarks(500, repeat=3, data_dir=data_dir)
+    assert set(results) == set(benchmark.OPERATIONS)
+    assert all(stats["p50"] <= stats["p95"] <= stats["p99"] for stats in results.values())
+    slower = {500: {name: dict(stats, p95=stats["p95"] * 10 + 1) for name, stats in results.items()}}
+    assert benchmark.compare(slower, {"500": results}, 1.25), "regressions should be flagged"
+    assert not benchmark.compare({500: results}, {"500": results}, 1.25)
+    print(f"✓ Synthetic data has no overlaps; benchmarked {len(results)} operations")
+    return True
+
+def test_schema_migration():
+    """Test that a legacy database is rebuilt online, keeping concurrent writes"""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    legacy = sqlite3.connect(path)
+    legacy.executescript("""
+        CREATE TABLE Listings (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, location TEXT,
+                               price_per_day REAL, host_name TEXT);
+        CREATE TABLE Bookings (id INTEGER PRIMARY KEY AUTOINCREMENT, listing_id INTEGER, customer_name TEXT,
+                               start_date TEXT, end_date TEXT, status TEXT,
+                               FOREIGN KEY(listing_id) REFERENCES Listings(id));
+        INSERT INTO Listings (title, location, price_per_day, host_name) VALUES
+            ('Villa', 'Nyali', 120, 'John'), ('Studio', 'Kisumu', 60, 'Peter'), ('', 'Nowhere', 10, 'Nobody');
+        INSERT INTO Bookings (listing_id, customer_name, start_date, end_date, status) VALUES
+            (1, 'Alice', '2025-12-3', '2026-1-5', 'Approved'), (2, 'Bob', '2025-12-01', '2025-12-04', 'Pending'),
+            (2, 'Carol', '2025-12-10', '2025-12-08', 'Pending'), (7, 'Orphan', '2025-12-01', '2025-12-02', 'Pending');
+    """)
+    legacy.commit()
+    legacy.close()
+
+    # Command mode refuses an unmigrated database instead of adding triggers for columns it lacks
+    with contextlib.redirect_stderr(io.StringIO()) as errors:
+        assert cli.main(["--database", path, "bookings", "create", "1", "Eve", "2026-02-01", "2026-02-02"]) == 1
+    assert "migrations.py" in errors.getvalue(), errors.getvalue()
+    try:
+        api.serve_in_thread(path)
+        assert False, "the API should not start on an unmigrated database"
+    except repository.SchemaOutdated:
+        pass
+    with repository.connection(path) as conn:
+        assert not conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall()
+        try:
+            changes.ensure_schema(conn)
+            assert False, "change log triggers need the migrated columns"
+        except repository.SchemaOutdated:
+            pass
+        try:
+            earnings.ensure_schema(conn)
+            assert False, "earnings aggregates need the quoted totals column"
+        except repository.SchemaOutdated:
+            pass
+        assert not conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%Earnings%'").fetchall()
+
+    # Write through another connection between copy batches, as the running CLI would
+    writes = []
+    def concurrent_write(message):
+        if "rows copied" in message and not writes:
+            with repository.connection(path) as conn:
+                conn.execute("UPDATE Listings SET price_per_day = 125 WHERE id = 1")
+                conn.execute("INSERT INTO Listings (title, location, price_per_day, host_name) VALUES ('Loft', 'Nairobi', 90, 'Mary')")
+                conn.commit()
+            writes.append(message)
+
+    applied = migrations.migrate(path, batch_size=1, pause=0, progress=concurrent_write)
+    assert applied == [1, 2, 3, 4], applied
+    assert migrations.migrate(path) == [], "second run should be a no-op"
+    with repository.connection(path) as conn:
+        assert migrations.user_version(conn) == migrations.LATEST_VERSION
+        assert all(migrations.is_current(conn, table) for table in migrations.TABLES)
+        listings = conn.execute("SELECT id, title, price_per_day FROM Listings ORDER BY id").fetchall()
+        assert listings == [(1, "Villa", 125), (2, "Studio", 60), (4, "Loft", 90)], listings
+        dates = conn.execute("SELECT start_date, end_date FROM Bookings WHERE id = 1").fetchone()
+        assert dates == ("2025-12-03", "2026-01-05"), dates
+        rejected = conn.execute("SELECT table_name, row_id FROM MigrationRejects ORDER BY table_name, row_id").fetchall()
+        assert rejected == [("Bookings", 3), ("Bookings", 4), ("Listings", 3)], rejected
+        assert [row[0] for row in services.search_listings(conn, text="loft")] == [4]
+        assert not availability.is_available(conn, 1, "2025-12-20", "2025-12-21")
+        assert earnings.verify(conn) == []
+        try:
+            conn.execute("INSERT INTO Bookings (listing_id, customer_name, start_date, end_date) VALUES (1, '', '2026-01-01', '2026-01-02')")
+            assert False, "CHECK constraint should reject an empty customer name"
+        except sqlite3.IntegrityError:
+            conn.rollback()
+    os.remove(path)
+    print("✓ Legacy schema migrated online with dates normalized and bad rows quarantined")
+    return True
+
+def test_shipped_migrations():
+    """Test that migrations 1 to 3 still build their original schema and migration 4 upgrades it"""
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    legacy = sqlite3.connect(path)
+    legacy.executescript("""
+        CREATE TABLE Listings (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, location TEXT,
+                               price_per_day REAL, host_name TEXT);
+        CREATE TABLE Bookings (id INTEGER PRIMARY KEY AUTOINCREMENT, listing_id INTEGER, customer_name TEXT,
+                               start_date TEXT, end_date TEXT, status TEXT);
+        INSERT INTO Listings (title, location, price_per_day, host_name) VALUES ('Villa', 'Nyali', 120, 'John');
+        INSERT INTO Bookings (listing_id, customer_name, start_date, end_date, status) VALUES
+            (1, 'Alice', '2025-12-30', '2026-01-02', 'Approved');
+    """)
+    legacy.commit()
+    legacy.close()
+
+    conn = migrations.connect(path)
+    try:
+        for version, migration in enumerate(migrations.MIGRATIONS[:3], start=1):
+            migration(conn, pause=0)
+            conn.execute(f"PRAGMA user_version = {version}")
+        assert "total" not in migrations._columns(conn, "Bookings")
+        assert migrations._columns(conn, "ListingEarnings") == ["listing_id", "approved_nights"]
+        months = conn.execute("SELECT month, approved_nights FROM ListingEarningsMonthly ORDER BY month").fetchall()
+        assert months == [("2025-12", 2), ("2026-01", 2)], months
+        conn.execute("INSERT INTO Bookings (listing_id, customer_name, start_date, end_date, status)"
+                     " VALUES (1, 'Bob', '2026-02-01', '2026-02-02', 'Approved')")
+        conn.commit()
+        logged = json.loads(conn.execute("SELECT data FROM ChangeLog ORDER BY seq DESC LIMIT 1").fetchone()[0])
+        assert "total" not in logged and logged["customer_name"] == "Bob", logged
+        assert conn.execute("SELECT approved_nights FROM ListingEarnings").fetchone()[0] == 6
+    finally:
+        conn.close()
+
+    assert migrations.migrate(path) == [4]
+    with repository.connection(path) as conn:
+        assert all(migrations.is_current(conn, table) for table in migrations.TABLES)
+        assert earnings.verify(conn) == []
+        conn.execute("UPDATE Bookings SET total = 250 WHERE id = 2")
+        conn.commit()
+        assert changes.read(conn)[-1].data["total"] == 250
+        assert earnings.verify(conn) == []
+    os.remove(path)
+    print("✓ Migrations 1 to 3 build their shipped schema and migration 4 brings it up to date")
+    return True
+
+def test_occupancy_cache():
+    """Test the occupancy cache against SQL and that approvals patch it"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        for start, end in [("2025-01-01", "2025-01-31"), ("2025-01-08", "2025-01-09"), ("2024-12-30", "2025-01-02")]:
+            expected = sorted(row[0] for row in availability.free_listings(conn, start, end))
+            assert occupancy.free_listings(conn, start, end).tolist() == expected, (start, end)
+        cache = occupancy.cache_for(conn)
+
+        # Listing 1 is booked 2025-01-05..10 and 2025-02-01..03 in the sample data
+        ids, offsets = occupancy.first_free_window(conn, 4, "2025-01-03", "2025-02-05")
+        assert dict(zip(ids.tolist(), offsets.tolist()))[1] == 8, "first 4 free nights start 2025-01-11"
+        ids, booked, rates = occupancy.occupancy(conn, "2025-01-01", "2025-01-31")
+        assert dict(zip(ids.tolist(), booked.tolist()))[1] == 6
+
+        listing = services.add_listing(conn, "Tree House", "Nanyuki", 75, "Ruth")
+        booking = services.create_booking(conn, listing, "Ann", "2025-01-08", "2025-01-12")
+        assert listing in occupancy.free_listings(conn, "2025-01-09", "2025-01-09")
+        services.update_booking_status(conn, booking, "Approved")
+        assert occupancy.cache_for(conn) is cache, "an approval should patch, not reload, the cache"
+        assert listing not in occupancy.free_listings(conn, "2025-01-09", "2025-01-09")
+
+        row = [r for r in services.occupancy_report(conn, "2025-01-01", "2025-01-31", 3) if r[0] == listing][0]
+        assert row[3:] == (5, 16.1, "2025-01-01"), row
+
+        # A write through another connection (e.g. another process) is seen on the next lookup
+        other = sqlite3.connect(path)
+        other.execute("UPDATE Bookings SET status = 'Rejected' WHERE id = ?", (booking,))
+        other.commit()
+        other.close()
+        assert listing in occupancy.free_listings(conn, "2025-01-09", "2025-01-09")
+    print("✓ Occupancy cache matches SQL availability and follows approvals and other connections")
+    return True
+
+def test_analytics_reports():
+    """Test month proration, group totals and the status report"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        booking = services.create_booking(conn, 6, "Ann", "2025-01-30", "2025-02-02")
+        services.update_booking_status(conn, booking, "Approved")
+
+        rows = {(r[0], r[1]): r[2:] for r in analytics.revenue_report(conn, "2025-01-01", "2025-02-28", ("listing", "month"))}
+        assert rows[(6, "2025-01")] == (2, 6.5, 400.0, 200.0), rows[(6, "2025-01")]
+        assert rows[(6, "2025-02")] == (2, 7.1, 400.0, 200.0), rows[(6, "2025-02")]
+        assert rows[(1, "2025-01")][:1] == (6,) and rows[(1, "2025-02")][:1] == (3,)
+
+        total = sum(r[3] for r in analytics.revenue_report(conn, "2024-01-01", "2026-12-31", ("month",)))
+        assert round(total, 2) == round(sum(r[3] for r in services.earnings_report(conn)), 2)
+        best = services.revenue_report(conn, "2025-01-01", "2025-12-31", ("host",), top=1)
+        assert best == [("James Kariuki", 4, 1.1, 800.0, 200.0)], best
+
+        # Another process approves a stay: nights and revenue both follow, from the same read
+        booking = services.create_booking(conn, 2, "Eve", "2025-03-10", "2025-03-14")
+        total = conn.execute("SELECT total FROM Bookings WHERE id = ?", (booking,)).fetchone()[0]
+        march = {r[0]: r[1:] for r in analytics.revenue_report(conn, "2025-03-01", "2025-03-31", ("listing",))}
+        here = os.path.dirname(os.path.abspath(__file__))
+        subprocess.run([sys.executable, os.path.join(here, "main.py"), "--database", path, "bookings", "approve",
+                        str(booking)], check=True, capture_output=True, cwd=here)
+        after = {r[0]: r[1:] for r in analytics.revenue_report(conn, "2025-03-01", "2025-03-31", ("listing",))}
+        assert after[2][0] == march[2][0] + 5 and abs(after[2][2] - march[2][2] - total) < 0.005, (march[2], after[2])
+
+        status = {r[0]: r[1:4] for r in services.status_report(conn, "2025-01-01", "2025-02-28")}
+        assert status["2025-01"] == (8, 4, 6), status
+        assert status["2025-02"] == (5, 6, 0), status
+        try:
+            services.revenue_report(conn, "2025-01-01", "2025-02-28", ("planet",))
+            assert False, "unknown dimensions should be refused"
+        except services.ServiceError:
+            pass
+    print("✓ Analytics prorate across months and match the earnings totals")
+    return True
+
+def test_json_api():
+    """Test the JSON API end to end on an ephemeral port"""
+    path = make_temp_database()
+    port, stop = api.serve_in_thread(path)
+    try:
+        # The writer created the derived schema at startup, so readers skip ensure_schema
+        with repository.connection(path) as conn:
+            key = repository.database_file(conn)
+        assert all(key in module._ready for module in migrations.DERIVED_MODULES)
+        client = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+
+        def call(method, url, body=None):
+            client.request(method, url, json.dumps(body) if body is not None else None)
+            response = client.getresponse()
+            return response.status, json.loads(response.read())
+
+        status, page = call("GET", "/listings?size=2")
+        assert status == 200 and [item["id"] for item in page["items"]] == [1, 2] and page["next_after"] == 2
+        status, created = call("POST", "/bookings", {"listing_id": 3, "customer_name": "Ann",
+                                                     "start_date": "2031-01-01", "end_date": "2031-01-03"})
+        assert status == 201, created
+        assert call("POST", f"/bookings/{created['id']}/approve")[0] == 200
+        status, result = call("GET", "/listings/3/available?start=2031-01-02&end=2031-01-02")
+        assert status == 200 and result["available"] is False
+
+        status, error = call("POST", "/bookings", {"listing_id": 3, "customer_name": "Ann",
+                                                   "start_date": "2031-13-01", "end_date": "2031-01-03"})
+        assert status == 400 and "date format" in error["error"], error
+        assert call("POST", f"/bookings/{created['id']}/approve")[0] == 400, "only Pending bookings can be approved"
+        assert call("GET", "/nowhere")[0] == 404
+        assert call("PUT", "/listings")[0] == 405
+        status, found = call("GET", "/listings/search?q=nairobi&max_price=500")
+        assert status == 200 and found["items"], found
+        assert call("GET", "/listings/search?q=nairobi&limit=-1")[0] == 400, "a negative limit would lift the LIMIT"
+        status, report = call("GET", "/reports/revenue?start=2031-01-01&end=2031-01-31&by=listing")
+        assert status == 200 and {"listing": 3, "booked_nights": 3}.items() <= [
+            row for row in report["items"] if row["listing"] == 3][0].items(), report
+        client.close()
+    finally:
+        stop()
+    print("✓ JSON API serves reads, serialized writes and validation errors")
+    return True
+
+def test_profiling():
+    """Test that profiling times operations and SQL and flags full scans"""
+    path = make_temp_database()
+    profiler = profiling.enable()
+    try:
+        with repository.connection(path) as conn:
+            with profiling.operation("book_and_approve"):
+                booking = services.create_booking(conn, 2, "Ann", "2031-01-01", "2031-01-03")
+                services.update_booking_status(conn, booking, "Approved")
+            with profiling.operation("list_listings"):
+                rows = services.list_listings(conn)
+    finally:
+        profiling.disable()
+    summary = profiler.summary()
+    assert summary["connections_opened"] == 1, summary["connections_opened"]
+    stats = summary["operations"]["book_and_approve"]
+    assert stats["calls"] == 1 and stats["statements"] >= 4 and stats["sql_ms"] <= stats["ms"], stats
+    assert stats["engine_statements"] > stats["statements"], "trigger bodies should be counted"
+    assert summary["operations"]["list_listings"]["rows"] == len(rows)
+    scans = {s["sql"]: s["full_scans"] for s in summary["statements"]}
+    assert scans[" ".join(repository.STATEMENTS["listing.all"].split())] == ["SCAN Listings"], scans
+    assert not scans[" ".join(repository.STATEMENTS["booking.span"].split())]
+    assert "scan a whole table" in profiler.render()
+    print(f"✓ Profiled {len(summary['statements'])} statements; full scans flagged")
+    return True
+
+def test_database_health():
+    """Test the health report checks and online incremental vacuum"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        plans = {name: scans for name, _, scans, _ in debug.query_plans(conn)}
+        assert plans["listing.all"] and not plans["booking.overlap_count"], plans
+        assert not plans["facets.price_range"], "price facets should use idx_listings_price"
+        assert all(queries for index, _, queries, _ in debug.index_usage(conn, debug.query_plans(conn)))
+        assert not any(debug.integrity_issues(conn).values())
+        sizes = {name: size for name, _, _, size, _ in debug.object_sizes(conn)}
+        assert sizes["Bookings"] > 0 and "idx_listings_price" in sizes
+
+        conn.execute("PRAGMA foreign_keys = OFF")
+        conn.execute("INSERT INTO Bookings (listing_id, customer_name, start_date, end_date, status) "
+                     "VALUES (999, 'Ghost', '2030-01-01', '2030-01-02', 'Pending')")
+        conn.commit()
+        conn.execute("PRAGMA foreign_keys = ON")
+        assert [row[1] for row in debug.integrity_issues(conn)["orphaned bookings"]] == [999]
+
+        conn.execute("CREATE TABLE Scratch (data BLOB)")
+        conn.executemany("INSERT INTO Scratch VALUES (zeroblob(4000))", [()] * 200)
+        conn.execute("DROP TABLE Scratch")
+        conn.commit()
+        storage = debug.storage_stats(conn)
+        assert storage["auto_vacuum"] == "INCREMENTAL" and storage["freelist_count"] >= 200, storage
+        released = debug.incremental_vacuum(conn, 10000, step=50, pause=0)
+        assert released == storage["freelist_count"] and debug.storage_stats(conn)["freelist_count"] == 0
+        debug.optimize(conn)
+        assert debug.checkpoint(conn, "truncate")[0] == 0
+    print(f"✓ Health checks find orphans; incremental vacuum released {released} pages online")
+    return True
+
+def test_startup_budget():
+    """Test that command mode skips NumPy/tabulate for JSON output, and report its import time"""
+    path = make_temp_database()
+    here = os.path.dirname(os.path.abspath(__file__))
+    # Measure with up-to-date bytecode, as an installed copy would have: the first run writes it
+    # under a temporary prefix rather than the source tree, and the fastest run is kept
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=tempfile.mkdtemp())
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    command = [sys.executable, "-X", "importtime", os.path.join(here, "main.py"),
+               "--database", path, "--format", "json", "listings", "list"]
+    runs = []
+    for _ in range(3):
+        result = subprocess.run(command, capture_output=True, text=True, cwd=here, env=env)
+        assert result.returncode == 0, result.stderr[-500:]
+        assert json.loads(result.stdout)[0]["id"] == 1
+        imports = re.findall(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", result.stderr)
+        runs.append((sum(int(us) for us, indent, _ in imports if not indent) / 1000, {name for _, _, name in imports}))
+    shutil.rmtree(env["PYTHONPYCACHEPREFIX"])
+    total, modules = min(runs, key=lambda run: run[0])
+    assert not {"numpy", "tabulate"} & modules, sorted({"numpy", "tabulate"} & modules)
+    # Timing depends on the machine, so it is reported against the budget rather than asserted
+    print(f"✓ Command-mode imports skip NumPy and tabulate and take {total:.1f} ms (budget {STARTUP_BUDGET_MS} ms)")
+    return True
+
+def test_compact_storage():
+    """Test that the compact storage format is converted both ways and returns the same values"""
+    path = make_temp_database()
+    migrations.migrate(path)
+
+    def snapshot(conn):
+        return {
+            "listings": services.list_listings(conn),
+            "bookings": services.list_bookings(conn),
+            "earnings": [(row[0], round(row[3], 2)) for row in services.earnings_report(conn)],
+            "monthly": [row[:3] + (round(row[3], 2),) for row in earnings.monthly_earnings(conn)],
+            "free": services.available_listings(conn, "2025-01-01", "2025-12-31"),
+            "facets": services.search_listings(conn, min_price=80, max_price=120.5, location="Nairobi"),
+            "revenue": services.revenue_report(conn, "2024-01-01", "2025-12-31", ("month",)),
+        }
+
+    with repository.connection(path) as conn:
+        before = snapshot(conn)
+        rows = conn.execute("SELECT * FROM Bookings ORDER BY id").fetchall()
+    assert migrations.convert_storage(path, storage.COMPACT, pause=0)
+    assert not migrations.convert_storage(path, storage.COMPACT, pause=0)
+
+    with repository.connection(path) as conn:
+        assert storage.storage_format(conn) == storage.COMPACT
+        assert conn.execute("SELECT typeof(start_date), typeof(price_per_day) FROM Bookings "
+                            "JOIN Listings L ON L.id = listing_id LIMIT 1").fetchone() == ("integer", "integer")
+        assert snapshot(conn) == before
+        plans = {name: scans for name, _, scans, _ in debug.query_plans(conn)}
+        assert not plans["booking.overlap_count"] and not plans["facets.price_range"], plans
+
+        listing_id = services.add_listing(conn, "Cents Cottage", "Nairobi, Karen", 99.99, "Test Host")
+        booking_id = services.create_booking(conn, listing_id, "Test Guest", "2031-01-30", "2031-02-02")
+        services.update_booking_status(conn, booking_id, "Approved")
+        try:
+            services.create_booking(conn, listing_id, "Other Guest", "2031-02-01", "2031-02-05")
+            assert False, "overlapping booking should be refused"
+        except services.ServiceError:
+            pass
+        assert earnings.verify(conn) == []
+        assert earnings.monthly_earnings(conn, listing_id) == [
+            (listing_id, "2031-01", 2, 199.98), (listing_id, "2031-02", 2, 199.98)]
+        assert repository.execute(conn, "booking.span", (booking_id,)).fetchone() == (listing_id, "2031-01-30", "2031-02-02")
+        try:
+            conn.execute("UPDATE Bookings SET start_date = '2031-01-30' WHERE id = ?", (booking_id,))
+            assert False, "CHECK constraint should reject a text date in compact storage"
+        except sqlite3.IntegrityError:
+            conn.rollback()
+        services.cancel_booking(conn, services.create_booking(conn, listing_id, "Test Guest", "2031-03-01", "2031-03-01"))
+        conn.execute("DELETE FROM Bookings WHERE id = ?", (booking_id,))
+        conn.execute("DELETE FROM Listings WHERE id = ?", (listing_id,))
+        conn.commit()
+
+    assert migrations.convert_storage(path, storage.TEXT, pause=0)
+    with repository.connection(path) as conn:
+        assert storage.storage_format(conn) == storage.TEXT
+        assert conn.execute("SELECT * FROM Bookings ORDER BY id").fetchall() == rows
+        assert snapshot(conn) == before and earnings.verify(conn) == []
+    os.remove(path)
+    print("✓ Compact storage round-trips and answers exactly like text storage")
+    return True
+
+def test_bulk_approval():
+    """Test bulk approval policies, displaced pending bookings and the command-mode entry point"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        listing_id = services.add_listing(conn, "Queue House", "Nairobi, Kilimani", 100, "Queue Host")
+        ranges = [("2032-01-01", "2032-01-05"), ("2032-01-03", "2032-01-10"),
+                  ("2032-01-06", "2032-01-08"), ("2032-01-11", "2032-01-12")]
+        ids = [services.create_booking(conn, listing_id, f"Guest {i}", *dates) for i, dates in enumerate(ranges)]
+
+        def approved(policy):
+            decisions = services.approve_pending(conn, listing_id, policy=policy, dry_run=True)
+            assert sorted(d.booking_id for d in decisions) == ids
+            return [ids.index(d.booking_id) for d in decisions if d.status == "Approved"]
+
+        assert sorted(approved("first_come")) == [0, 2, 3]
+        assert sorted(approved("highest_value")) == [1, 3]
+        assert sorted(approved("max_bookings")) == [0, 2, 3]
+        # A quoted total outranks nights x price: a discounted long stay loses to a pricier short one
+        conn.execute("UPDATE Bookings SET total = 1000 WHERE id = ?", (ids[0],))
+        conn.execute("UPDATE Bookings SET total = 400 WHERE id = ?", (ids[1],))
+        conn.commit()
+        assert sorted(approved("highest_value")) == [0, 2, 3]
+        conn.execute("UPDATE Bookings SET total = NULL WHERE id IN (?, ?)", ids[:2])
+        conn.commit()
+        try:
+            services.approve_pending(conn, policy="loudest")
+            assert False, "unknown policies should be refused"
+        except services.ServiceError:
+            pass
+
+        # Only bookings 0 and 1 overlap the window; 1 wins and displaces 2 as well
+        decisions = services.approve_pending(conn, listing_id, "2032-01-01", "2032-01-04", "highest_value")
+        assert {(ids.index(d.booking_id), d.status) for d in decisions} == {(0, "Rejected"), (1, "Approved"), (2, "Rejected")}
+        statuses = [repository.execute(conn, "booking.status", (booking_id,)).fetchone()[0] for booking_id in ids]
+        assert statuses == ["Rejected", "Approved", "Rejected", "Pending"]
+        assert not conn.in_transaction and earnings.verify(conn) == []
+        assert not repository.execute(conn, "booking.approved_overlaps").fetchall()
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        assert cli.main(["--database", path, "--format", "json", "bookings", "approve-pending"]) == 0
+    decided = json.loads(out.getvalue())
+    assert {"id": ids[3], "listing_id": listing_id, "start_date": "2032-01-11", "end_date": "2032-01-12",
+            "status": "Approved"} in decided
+    with repository.connection(path) as conn:
+        assert not repository.execute(conn, "booking.pending").fetchall()
+        assert not repository.execute(conn, "booking.approved_overlaps").fetchall()
+    os.remove(path)
+    print(f"✓ Bulk approval resolved {len(decided)} queued booking(s) in one pass without double-booking")
+    return True
+
+def test_booking_archive():
+    """Test that archiving old and rejected bookings keeps earnings and reports unchanged"""
+    path = make_temp_database()
+
+    def snapshot(conn):
+        return {
+            "earnings": [(row[0], round(row[3], 2)) for row in services.earnings_report(conn)],
+            "monthly": [row[:3] + (round(row[3], 2),) for row in earnings.monthly_earnings(conn)],
+            "revenue": services.revenue_report(conn, "2025-01-01", "2025-03-31", ("month",)),
+            "status": services.status_report(conn, "2025-01-01", "2025-03-31", ("listing",)),
+        }
+
+    with repository.connection(path) as conn:
+        before = snapshot(conn)
+        count = len(services.list_bookings(conn))
+    try:
+        archive.archive_bookings(path)
+        assert False, "archiving needs a cutoff or --rejected"
+    except ValueError:
+        pass
+    try:
+        archive.archive_bookings(path, before=(date.today() + timedelta(days=1)).isoformat(), pause=0)
+        assert False, "a future cutoff would archive upcoming stays"
+    except ValueError:
+        pass
+
+    # Alice (approved) and John (pending) ended before the cutoff; Mary's booking was rejected
+    invalidations = resultcache.stats()["invalidations"]
+    moved = archive.archive_bookings(path, before="2025-01-19", rejected=True, pause=0)
+    assert moved == {2025: 3}, moved
+    assert resultcache.stats()["invalidations"] > invalidations
+    assert archive.archive_bookings(path, before="2025-01-19", rejected=True, pause=0) == {}
+    assert list(archive.partitions(path)) == [2025]
+    with repository.connection(path) as conn:
+        assert len(services.list_bookings(conn)) == count - 3
+        assert snapshot(conn) == before
+        assert earnings.verify(conn) == []
+        earnings.rebuild(conn)
+        assert snapshot(conn) == before
+        assert sorted(row[3] for row in archive.spans(conn, "2025-01-01", "2025-01-31")) == [0, 1, 2]
+
+    for partition in archive.partitions(path).values():
+        os.remove(partition)
+    os.remove(path)
+    print(f"✓ Archived {sum(moved.values())} booking(s) with earnings and reports unchanged")
+    return True
+
+def test_result_cache():
+    """Test result cache hits, invalidation by own and other connections' writes, TTL and LRU eviction"""
+    path = make_temp_database()
+    resultcache.clear()
+    with repository.connection(path) as conn:
+        first = services.search_listings(conn, "nairobi")
+        assert services.search_listings(conn, "nairobi") is first
+        services.available_listings(conn, "2025-01-01", "2025-01-31")
+        services.available_listings(conn, "2025-01-01", "2025-01-31")
+        assert resultcache.stats()["hits"] == 2 and resultcache.stats()["misses"] == 2
+
+        # Own write: the hook in services invalidates
+        listing_id = services.add_listing(conn, "Cache Cottage", "Nairobi, Lavington", 90, "Cache Host")
+        assert listing_id in [row[0] for row in services.search_listings(conn, "nairobi")]
+
+        # Another process's write: caught by PRAGMA data_version
+        other = sqlite3.connect(path)
+        other.execute("UPDATE Listings SET title = 'Renamed Cottage' WHERE id = ?", (listing_id,))
+        other.commit()
+        other.close()
+        assert "Renamed Cottage" in [row[1] for row in services.search_listings(conn, "nairobi")]
+
+        # Inside a transaction results may be uncommitted and are not kept
+        bypassed = resultcache.stats()["bypassed"]
+        with repository.write_transaction(conn):
+            services.search_listings(conn, "nairobi")
+        assert resultcache.stats()["bypassed"] == bypassed + 1
+
+        small = resultcache.ResultCache(size=2, ttl=0.05)
+        for key in ("a", "b", "c"):
+            small.get(conn, key, lambda: key)
+        assert small.stats()["evictions"] == 1 and small.get(conn, "a", lambda: "again") == "again"
+        time.sleep(0.06)
+        small.get(conn, "c", lambda: "c")
+        assert small.stats()["expired"] == 1
+
+    stats = resultcache.stats()
+    os.remove(path)
+    print(f"✓ Result cache: {stats['hits']} hit(s), {stats['misses']} miss(es), {stats['invalidations']} invalidation(s)")
+    return True
+
+def test_snapshot_reporting():
+    """Test that reports on a snapshot or replica see a consistent copy and that replicas refresh"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        booking_id = services.create_booking(conn, 2, "Snapshot Guest", "2031-05-01", "2031-05-04")
+        before = services.earnings_report(conn)
+
+    with snapshot.reporting(path) as reports:
+        # Writes to the live database after the copy are not visible to the snapshot
+        with repository.connection(path) as conn:
+            services.update_booking_status(conn, booking_id, "Approved")
+            after = services.earnings_report(conn)
+        assert services.earnings_report(reports) == before != after
+        taken = repository.database_file(reports)
+    assert not os.path.exists(taken), "one-shot snapshots are deleted afterwards"
+
+    replica = snapshot.ReportingReplica(path, lag=60)
+    with replica.connection() as conn:
+        assert services.earnings_report(conn) == after
+        first = repository.database_file(conn)
+    with repository.connection(path) as conn:
+        services.cancel_booking(conn, services.create_booking(conn, 2, "Later Guest", "2031-06-01", "2031-06-02"))
+    replica.refresh()
+    assert not os.path.exists(first) and replica.refreshes == 2
+    replica.stop()
+
+    port, stop = api.serve_in_thread(path, report_lag=60)
+    try:
+        client = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        client.request("GET", "/earnings")
+        items = json.loads(client.getresponse().read())["items"]
+        assert [(item["id"], item["earnings"]) for item in items] == [(row[0], row[3]) for row in after]
+        client.close()
+    finally:
+        stop()
+
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        assert cli.main(["--database", path, "--snapshot", "--format", "json", "earnings"]) == 0
+    assert [(item["id"], item["earnings"]) for item in json.loads(out.getvalue())] == [(row[0], row[3]) for row in after]
+    os.remove(path)
+    print("✓ Snapshot reports are consistent and leave no snapshot files behind")
+    return True
+
+def test_sharding():
+    """Test routing to shard files, per-shard id ranges and merged scatter-gather reads"""
+    directory = tempfile.mkdtemp()
+    first = make_temp_database()
+    shards = [("Nairobi", first), ("Mombasa", os.path.join(directory, "mombasa.db")),
+              ("Kisumu", os.path.join(directory, "kisumu.db"))]
+    saved = config.SHARDS
+    config.SHARDS = shards
+    try:
+        sharding.prepare()
+        shard_map = sharding.current()
+        assert shard_map.for_listing("Mombasa, Nyali", "Ann") == 1
+        assert shard_map.for_listing("kisumu", "Ann") == 2
+        assert shard_map.for_listing("Eldoret, Town", "Ann") == 0
+
+        with sharding.connection_for_listing("Mombasa, Nyali", "Ann") as conn:
+            mombasa = services.add_listing(conn, "Shard Villa", "Mombasa, Nyali", 50, "Ann")
+        with sharding.connection_for_listing("Kisumu", "Ben") as conn:
+            kisumu = services.add_listing(conn, "Shard Loft", "Kisumu", 40, "Ben")
+        assert shard_map.for_id(mombasa) == 1 and shard_map.for_id(kisumu) == 2 and mombasa != kisumu
+        with sharding.connection_for_id(mombasa) as conn:
+            booking_id = services.create_booking(conn, mombasa, "Shard Guest", "2031-03-01", "2031-03-05")
+            services.update_booking_status(conn, booking_id, "Approved")
+            conn.commit()
+        assert shard_map.for_id(booking_id) == 1
+        try:
+            shard_map.for_id(5 << config.SHARD_ID_BITS)
+            assert False, "ids beyond the last shard should be rejected"
+        except services.ServiceError:
+            pass
+
+        def run(*args):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                assert cli.main(list(args) + ["--format", "json"]) == 0
+            return json.loads(out.getvalue())
+
+        ids = [item["id"] for item in run("listings", "list")]
+        assert ids == sorted(ids) and ids[-2:] == [mombasa, kisumu]
+        assert [row[0] for row in sharding.fetch_page("listings", size=100)] == ids
+        assert [row[0] for row in sharding.fetch_page("listings", before=kisumu, size=2)] == ids[-3:-1]
+        prices = [item["price_per_day"] for item in run("listings", "search", "--max-price", "70")]
+        assert prices == sorted(prices) and 40 in prices and 50 in prices
+        earned = [item["earnings"] for item in run("earnings")]
+        assert earned == sorted(earned, reverse=True) and 250 in earned
+        # Shard 1's occupancy calendar starts at its id range, not at row 0
+        rows = {item["id"]: item for item in run("occupancy", "2031-03-01", "2031-03-10")}
+        assert rows[mombasa]["booked_nights"] == 5 and rows[kisumu]["booked_nights"] == 0
+        assert mombasa not in [item["id"] for item in run("availability", "2031-03-02", "2031-03-03")]
+
+        # The interactive menu reads every shard too, and cancels on the booking's shard
+        def menu(action, *answers):
+            with mock.patch("builtins.input", side_effect=answers), contextlib.redirect_stdout(io.StringIO()) as out:
+                action()
+            return out.getvalue()
+
+        listed = menu(features.search_listings, "shard", "", "")
+        assert "Shard Villa" in listed and "Shard Loft" in listed, listed
+        free = menu(features.view_availability, "2031-03-02", "2031-03-03")
+        assert "Shard Loft" in free and "Shard Villa" not in free, free
+        assert "Shard Villa" in menu(features.view_occupancy, "2031-03-01", "2031-03-10", "")
+        with sharding.connection_for_id(kisumu) as conn:
+            pending = services.create_booking(conn, kisumu, "Menu Guest", "2031-04-01", "2031-04-02")
+        assert "cancelled successfully" in menu(features.cancel_booking, str(pending))
+        with sharding.connection_for_id(kisumu) as conn:
+            assert repository.execute(conn, "booking.status", (pending,)).fetchone() is None
+    finally:
+        config.SHARDS = saved
+    os.remove(first)
+    shutil.rmtree(directory)
+    print("✓ Shards route writes by city and id, and merged reads span every shard")
+    return True
+
+def test_change_feed():
+    """Test that inserts, status updates, deletes and archiving are logged in order and tailed by consumers"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        start = changes.head(conn)
+        listing_id = services.add_listing(conn, "Feed Loft", "Nairobi, CBD", 55, "Feed Host")
+        booking_id = services.create_booking(conn, listing_id, "Feed Guest", "2020-02-01", "2020-02-03")
+        services.update_booking_status(conn, booking_id, "Approved")
+        pending = services.create_booking(conn, listing_id, "Feed Guest", "2031-02-01", "2031-02-03")
+        services.cancel_booking(conn, pending)
+        # An update that changes nothing is not logged
+        conn.execute("UPDATE Listings SET title = title WHERE id = ?", (listing_id,))
+        conn.commit()
+
+        feed = changes.read(conn, start)
+        assert [(c.table_name, c.operation) for c in feed] == [
+            ("Listings", "insert"), ("Bookings", "insert"), ("Bookings", "update"), ("Bookings", "insert"), ("Bookings", "delete")]
+        assert [c.seq for c in feed] == list(range(start + 1, start + 6)) and changes.head(conn) == start + 5
+        assert feed[2].data["status"] == "Approved" and feed[4].data["id"] == pending
+        assert feed[0].data["price_per_day"] == 55 and feed[1].data["start_date"] == "2020-02-01"
+
+    # A named consumer resumes after its last fully processed batch
+    batches = changes.tail(path, consumer="export", batch_size=3)
+    first = next(batches)
+    assert len(first) == 3
+    batches.close()
+    with repository.connection(path) as conn:
+        assert changes.position(conn, "export") == 0, "an unfinished batch is not committed"
+    seen = [change.seq for batch in changes.tail(path, consumer="export", batch_size=3) for change in batch]
+    with repository.connection(path) as conn:
+        assert seen[0] == 1 and changes.position(conn, "export") == seen[-1] == changes.head(conn)
+        assert changes.prune(conn) == len(seen) and changes.read(conn) == []
+
+    archive.archive_bookings(path, before="2021-01-01", pause=0)
+    with repository.connection(path) as conn:
+        moved = changes.read(conn, seen[-1])
+        assert moved and {c.operation for c in moved} == {"archive"} and booking_id in [c.row_id for c in moved]
+        # Sequence numbers are never reused after a prune
+        assert moved[0].seq > seen[-1]
+    for partition in archive.partitions(path).values():
+        os.remove(partition)
+    os.remove(path)
+    print("✓ Change feed logs every write in order and consumers resume from their cursor")
+    return True
+
+def test_quote_engine():
+    """Test seasonal, weekend and length-of-stay pricing, stored booking totals and earnings from them"""
+    path = make_temp_database()
+    with repository.connection(path) as conn:
+        listing_id = services.add_listing(conn, "Quote Villa", "Diani, Beach", 100, "Quote Host")
+        services.set_rate_plan(conn, listing_id, weekend_uplift=50, weekly_discount=10, monthly_discount=20)
+        services.add_seasonal_rate(conn, listing_id, "2030-12-20", "2031-01-05", 150)
+        assert conn.execute("SELECT COUNT(*) FROM RateCalendars WHERE listing_id = ?", (listing_id,)).fetchone()[0] >= 2
+
+        def nightly(day):
+            price = 150 if date(2030, 12, 20) <= day <= date(2031, 1, 5) else 100
+            return price * 1.5 if day.weekday() in (4, 5) else price
+
+        # Every stay matches pricing the nights one by one, across seasons and years
+        for start, nights in [(date(2030, 3, 4), 3), (date(2030, 3, 4), 7), (date(2030, 12, 1), 45), (date(2031, 12, 25), 400)]:
+            end = start + timedelta(days=nights - 1)
+            quote = services.quote_booking(conn, listing_id, start.isoformat(), end.isoformat())
+            subtotal = sum(nightly(start + timedelta(days=n)) for n in range(nights))
+            percent = 20 if nights >= 28 else 10 if nights >= 7 else 0
+            assert quote.nights == nights and quote.subtotal == subtotal, (quote, subtotal)
+            assert abs(quote.total - subtotal * (100 - percent) / 100) < 0.01, quote
+        try:
+            services.quote_booking(conn, 999999, "2030-03-04", "2030-03-06")
+            assert False, "unknown listing should be rejected"
+        except services.ServiceError:
+            pass
+        try:
+            services.set_rate_plan(conn, listing_id, weekly_discount=150)
+            assert False, "discount over 100% should be rejected"
+        except services.ServiceError:
+            pass
+
+        # The booking keeps its quoted total when prices change later
+        quote = services.quote_booking(conn, listing_id, "2030-12-27", "2031-01-02")
+        booking_id = services.create_booking(conn, listing_id, "Quote Guest", "2030-12-27", "2031-01-02")
+        services.update_booking_status(conn, booking_id, "Approved")
+        services.add_seasonal_rate(conn, listing_id, "2030-12-25", "2031-01-31", 300)
+        conn.execute("UPDATE Listings SET price_per_day = 250 WHERE id = ?", (listing_id,))
+        conn.commit()
+        assert services.quote_booking(conn, listing_id, "2030-12-27", "2031-01-02").total > quote.total
+        earned = {row[0]: row[3] for row in earnings.earnings_by_listing(conn)}
+        assert abs(earned[listing_id] - quote.total) < 0.01, (earned[listing_id], quote)
+        assert earnings.verify(conn) == []
+        # The stay crosses a month boundary: months and the revenue report share its total by night
+        months = {row[1]: row[3] for row in earnings.monthly_earnings(conn, listing_id)}
+        assert set(months) == {"2030-12", "2031-01"} and abs(sum(months.values()) - quote.total) < 0.005, months
+        revenue = {row[1]: row[-2] for row in services.revenue_report(conn, "2030-12-01", "2031-01-31", by=("listing", "month"))
+                   if row[0] == listing_id}
+        assert all(abs(revenue[month] - months[month]) < 0.005 for month in months), (revenue, months)
+        conn.execute("UPDATE ListingEarningsMonthly SET quoted_cents = quoted_cents + 100"
+                     " WHERE listing_id = ? AND month = '2030-12'", (listing_id,))
+        assert earnings.verify(conn), "a wrong monthly amount should be reported"
+        conn.rollback()
+
+    assert migrations.convert_storage(path, storage.COMPACT, pause=0)
+    with repository.connection(path) as conn:
+        assert conn.execute("SELECT total FROM Bookings WHERE id = ?", (booking_id,)).fetchone()[0] == round(quote.total * 100)
+        earned = {row[0]: row[3] for row in earnings.earnings_by_listing(conn)}
+        assert abs(earned[listing_id] - quote.total) < 0.01 and earnings.verify(conn) == []
+        assert services.quote_booking(conn, listing_id, "2030-03-04", "2030-03-10").subtotal == 7 * 250 + 2 * 125
+    os.remove(path)
+    print("✓ Quotes use seasonal rates, weekend uplift and stay discounts, and bookings keep their quoted totals")
+    return True
+
 def run_tests():
     """Run all tests"""
     print("=== House Rental CLI Tests ===")
@@ -79,7 +1145,33 @@ def run_tests():
     tests = [
         test_database_exists,
         test_tables_exist,
-        test_sample_data
+        test_sample_data,
+        test_connection_pool,
+        test_availability_engine,
+        test_earnings_aggregates,
+        test_bulk_import_export,
+        test_command_mode_batch,
+        test_keyset_pagination,
+        test_full_text_search,
+        test_facet_query_plans,
+        test_concurrent_booking,
+        test_synthetic_data_and_benchmark,
+        test_schema_migration,
+        test_shipped_migrations,
+        test_occupancy_cache,
+        test_analytics_reports,
+        test_json_api,
+        test_profiling,
+        test_database_health,
+        test_startup_budget,
+        test_compact_storage,
+        test_bulk_approval,
+        test_booking_archive,
+        test_result_cache,
+        test_snapshot_reporting,
+        test_sharding,
+        test_change_feed,
+        test_quote_engine
     ]
     
     passed = 0